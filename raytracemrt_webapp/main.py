@@ -1,26 +1,65 @@
+import io
 import asyncio
 import numpy as np
 from time import perf_counter
 
+from pyodide.ffi import to_js
 from pyodide.ffi.wrappers import add_event_listener
 from pyscript.ffi import create_proxy
 from pyscript import window, document, PyWorker
+from pyscript.js_modules import three as THREE
 
-from pyscript_3dapp_lib.utils import create_hidden_link, rgb_falsecolors, convertxyz2zxy, get_bytes_from_file, write_csv_web
-from pyscript_3dapp_lib.libthree import get_scene, get_camera, get_renderer, get_orbit_ctrl, get_lights, create_grp, create_cube, viz_pts_color, create_sphere, viz_vox_outlines, create_lines
+from pyscript_3dapp_lib.utils import create_hidden_link, convertxyz2zxy, get_bytes_from_file, write_csv_web
+from pyscript_3dapp_lib.libthree import get_scene, get_camera, get_renderer, get_orbit_ctrl, get_lights, create_grp, create_cube, create_lines
 
 MRT_RES = None
+MRT_NPZ = None
 PLY_NAME = None
-PLY_PTS = None
+# the point cloud is fetched once per scene sorted into levels of detail, only the points of the level fitting the camera distance are drawn
+PTS_CLOUD = None
 PLY_TEMPS = None
+PLY_LOD = None
+# the angle in radians the spacing of the drawn points is seen under, about 1 or 2 pixels
+PTS_LOD_ANGLE = 0.002
 MN_TEMP = None
 MX_TEMP = None
 VIZ_PTS_MODE = 0
 GRID_PTS = None
-GRID_RAYS = None
-GRID_MS_RAYS = None
+# the rays stay in the workers, the worker and the index in its shard of each grid point to fetch the rays of a grid point on demand
+GRID_OWNERS = None
+POOL_WORKERS = None
 RAYS_ON = None
+# the merged voxel outlines and the instanced grid spheres of the results with the values they are colored by, recolored in place by recolor_results
+VX_OUTLINES = None
+VX_TEMPS = None
+GRID_MESH = None
+MRT_VALS = None
+# index of the grid points of each shard being streamed and whether the user cancelled the calculation
+STREAM_SHARDS = None
+CANCELLED = False
+# the 12 edges of a voxel as 24 vertices, as multiples of half the voxel dimension from the midpt
+VOX_EDGE_VERTS = np.array([[-1,-1,-1], [1,-1,-1], [1,-1,-1], [1,1,-1], [1,1,-1], [-1,1,-1], [-1,1,-1], [-1,-1,-1],
+                           [-1,-1,1], [1,-1,1], [1,-1,1], [1,1,1], [1,1,1], [-1,1,1], [-1,1,1], [-1,-1,1],
+                           [-1,-1,-1], [-1,-1,1], [1,-1,-1], [1,-1,1], [1,1,-1], [1,1,1], [-1,1,-1], [-1,1,1]], dtype=np.float32)
 height_3dview_ratio = 0.8
+# modules of the array based engine to be loaded into the worker
+ENGINE_FILES = {f"./raytrace_mrt_engine/{mod}.py": f"./raytrace_mrt_engine/{mod}.py" for mod in ['__init__', 'intersect', 'traverse', 'bvh', 'rays', 'voxel', 'cache', 'instrument', 'plyio', 'pipeline', 'adaptive', 'viewfactor', 'gridgen', 'lod']}
+WORKER_CONFIG = {
+                    "packages": ["plyfile>=1.1.3", "geomie3d==0.0.11", "numpy-stl>=3.2.0",
+                                "./lib/pyscript_3dapp_lib-0.0.2-py3-none-any.whl"],
+                    "files": ENGINE_FILES
+                }
+# every pyodide worker holds its own copy of the interpreter and the packages, cap the pool to keep the memory in check
+MAX_WORKERS = 8
+# latest progress message of each worker of the pool
+WORKER_TEXTS = {}
+# the pool is started at page load and kept alive across submissions
+POOL_TASK = None
+# key and shared buffer of the voxels last broadcast to the pool
+SHARED_VOXELS = None
+# time of the submission and seconds until the first progress message from the workers
+SUBMIT_T = None
+FIRST_PROGRESS_DUR = None
 #-----------------------------------------------------------
 # region: get the renderer and append it to index.html
 renderer = get_renderer()
@@ -43,6 +82,9 @@ for light in lights:
 dl_btn = document.getElementById("mrt-download")
 dl_btn.disabled = True
 
+npz_btn = document.getElementById("mrt-npz-download")
+npz_btn.disabled = True
+
 vizpts_btn = document.getElementById("viz_pts")
 vizpts_btn.disabled = True
 
@@ -52,6 +94,9 @@ gridid_btn.disabled = True
 vizrays_btn = document.getElementById("viz_rays")
 vizrays_btn.disabled = True
 
+cancel_btn = document.getElementById("mrt-cancel")
+cancel_btn.disabled = True
+
 # orbit controls
 controls = get_orbit_ctrl(camera, renderer)
 # create a spinning cube
@@ -69,6 +114,8 @@ def animate(*args):
     controls.update()
     init_edges.rotation.x += 0.01
     init_edges.rotation.y += 0.01
+    if VIZ_PTS_MODE == 1:
+        update_pts_lod()
     renderer.render(scene, camera)
     # Call the animation loop recursively
     window.requestAnimationFrame(animate_proxy)
@@ -90,7 +137,298 @@ def change_color_bar(mnval: float, mxval: float):
         color_label = document.getElementById("fcval" + str(cnt+1))
         color_label.textContent = str(round(i, 1))
 
-def grid_pts_mrt2rows(grid_pts: list[list[float]], mrts: list[float]) -> list[list]:
+def mark_progress():
+    global FIRST_PROGRESS_DUR
+    if SUBMIT_T is not None and FIRST_PROGRESS_DUR is None:
+        FIRST_PROGRESS_DUR = perf_counter() - SUBMIT_T
+
+def worker_dialog_text(txt: str):
+    mark_progress()
+    change_dialog_text(txt)
+
+def change_worker_text(worker_id: int, txt: str):
+    mark_progress()
+    WORKER_TEXTS[worker_id] = txt
+    lines = [f"Worker {wid + 1}: {WORKER_TEXTS[wid]}" for wid in sorted(WORKER_TEXTS)]
+    change_dialog_text('\n'.join(lines))
+
+def get_pool_size() -> int:
+    """
+    number of workers for the pool, one core is left for the main thread
+
+    Returns
+    -------
+    int
+        number of workers.
+    """
+    ncores = window.navigator.hardwareConcurrency
+    if not ncores:
+        ncores = 2
+    return max(1, min(MAX_WORKERS, int(ncores) - 1))
+
+async def start_pool() -> list:
+    """
+    start the pool of workers and wait for them to be ready, called once at page load so the workers boot and install the packages while the user picks the files
+
+    Returns
+    -------
+    list
+        list[shape(nworkers)] the PyWorkers.
+    """
+    t1 = perf_counter()
+    npool = get_pool_size()
+    workers = [PyWorker("./worker.py", type="pyodide", config = WORKER_CONFIG) for _ in range(npool)]
+    await asyncio.gather(*[worker.ready for worker in workers])
+    for worker in workers:
+        worker.sync.change_dialog_text = worker_dialog_text
+        worker.sync.change_worker_text = change_worker_text
+        worker.sync.report_partial = report_partial
+    print(f"{npool} workers ready in {round(perf_counter() - t1, 1)} s")
+    return workers
+
+def clear_results():
+    """
+    remove the results of the previous submission from the scene
+    """
+    global VIZ_PTS_MODE, RAYS_ON, VX_OUTLINES, GRID_MESH, PTS_CLOUD, PLY_TEMPS, PLY_LOD
+    for name in ['mrt_world', 'three_js_pts', f"grid_rays{RAYS_ON}", f"grid_ms_rays{RAYS_ON}"]:
+        obj = scene.getObjectByName(name, True)
+        if obj:
+            scene.remove(obj)
+    VIZ_PTS_MODE = 0
+    RAYS_ON = None
+    VX_OUTLINES = None
+    GRID_MESH = None
+    # the point cloud is fetched from the worker when it is visualized
+    PTS_CLOUD = None
+    PLY_TEMPS = None
+    PLY_LOD = None
+
+def share_voxels(voxels):
+    """
+    copy the packed voxels into a SharedArrayBuffer once so that all the workers receive the same memory instead of a copy each.
+    Falls back to a normal Float64Array if the page is not cross-origin isolated by mini-coi.js.
+
+    Parameters
+    ----------
+    voxels: Float64Array
+        the packed voxels from the prepare_scene of the worker.
+
+    Returns
+    -------
+    Float64Array
+        the packed voxels to pass to the load_voxels of the workers.
+    """
+    if not window.crossOriginIsolated:
+        return window.Float64Array.new(voxels)
+    nvals = voxels.length
+    sab = window.SharedArrayBuffer.new(nvals * 8)
+    shared = window.Float64Array.new(sab)
+    shared.set(voxels)
+    return shared
+
+def split_grid(grid_xyzs: list[list[float]], nparts: int) -> tuple[list[list[list[float]]], list[list[int]]]:
+    """
+    split the grid points into shards, one for each worker. The grid points are dealt round-robin by index, so the shards differ by at most one grid point
+    and the neighbouring grid points, which cost about the same to trace, are spread over all the workers. The same grid goes to the same workers
+    and hits their caches when it is submitted again.
+
+    Parameters
+    ----------
+    grid_xyzs: list[list[float]]
+        list[shape(ngrids, 3)] the grid points.
+
+    nparts: int
+        number of shards.
+
+    Returns
+    -------
+    shards : list[list[list[float]]]
+        list[shape(nparts, nshard_grids, 3)] the grid points of each shard.
+
+    shard_ids : list[list[int]]
+        list[shape(nparts, nshard_grids)] index of the grid points of each shard.
+    """
+    shard_ids = [list(range(part, len(grid_xyzs), nparts)) for part in range(nparts)]
+    shards = [grid_xyzs[part::nparts] for part in range(nparts)]
+    return shards, shard_ids
+
+def sum_cache_stats(stats_ls: list[dict]) -> dict:
+    """
+    add up the cache hits, misses and values too large to cache reported by the workers
+
+    Parameters
+    ----------
+    stats_ls: list[dict]
+        the cache stats of each call to the workers.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the total "hits", "misses" and "skipped" of each kind.
+    """
+    total = {'hits': {}, 'misses': {}, 'skipped': {}}
+    for stats in stats_ls:
+        for count_key in ['hits', 'misses', 'skipped']:
+            for kind, count in stats[count_key].items():
+                total[count_key][kind] = total[count_key].get(kind, 0) + count
+    return total
+
+def add_main_stage(profile: dict, name: str, time_s: float):
+    """
+    add a stage timed in the main script to the profile of the calculation
+
+    Parameters
+    ----------
+    profile: dict
+        the profile with the "stages" of the calculation.
+
+    name: str
+        name of the stage.
+
+    time_s: float
+        wall time of the stage in seconds.
+    """
+    profile['stages'][name] = {'time_s': time_s, 'peak_mb': None, 'calls': 1, 'counters': {}, 'rates': {}, 'workers': 0}
+
+def merge_profiles(profile: dict, worker_profiles: list[dict]):
+    """
+    merge the profiles of the workers that ran the same stages in parallel into the profile of the calculation.
+    The time and peak memory of a stage are the max over the workers, the critical path, and the counters are summed, so the rates are the throughput of the whole pool.
+
+    Parameters
+    ----------
+    profile: dict
+        the profile with the "stages" of the calculation, the stages of the workers are added to it.
+
+    worker_profiles: list[dict]
+        the profiles from raytrace_mrt_engine.gen_profile of the workers.
+    """
+    stages = profile['stages']
+    for wprofile in worker_profiles:
+        for name, stage in wprofile['stages'].items():
+            merged = stages.get(name)
+            if merged is None:
+                merged = {'time_s': 0.0, 'peak_mb': None, 'calls': 0, 'counters': {}, 'rates': {}, 'workers': 0}
+                stages[name] = merged
+            merged['time_s'] = max(merged['time_s'], stage['time_s'])
+            if stage['peak_mb'] is not None:
+                merged['peak_mb'] = stage['peak_mb'] if merged['peak_mb'] is None else max(merged['peak_mb'], stage['peak_mb'])
+            merged['calls'] += stage['calls']
+            merged['workers'] += 1
+            for key, val in stage['counters'].items():
+                if isinstance(val, bool):
+                    merged['counters'][key] = val
+                else:
+                    merged['counters'][key] = merged['counters'].get(key, 0) + val
+            merged['rates'] = {f"{key}_per_s": val/merged['time_s'] for key, val in merged['counters'].items()
+                               if not isinstance(val, bool) and merged['time_s'] > 0}
+
+def format_rate(val: float) -> str:
+    """
+    format a throughput with a k, M or G suffix
+
+    Parameters
+    ----------
+    val: float
+        the throughput per second.
+
+    Returns
+    -------
+    str
+        the formatted throughput.
+    """
+    for div, suffix in [(1e9, 'G'), (1e6, 'M'), (1e3, 'k')]:
+        if val >= div:
+            return f"{val/div:.2f}{suffix}"
+    return f"{val:.1f}"
+
+def show_profile(profile: dict, total_s: float):
+    """
+    show the wall time, peak memory and throughput of each stage of the calculation in the breakdown panel
+
+    Parameters
+    ----------
+    profile: dict
+        the profile with the "stages" of the calculation.
+
+    total_s: float
+        wall time of the whole calculation in seconds.
+    """
+    stages = profile['stages']
+    rows = ['<tr><th>Stage</th><th>Time (s)</th><th>Peak (MB)</th><th>Throughput</th></tr>']
+    for name, stage in stages.items():
+        peak = f"{stage['peak_mb']:.1f}" if stage['peak_mb'] is not None else '-'
+        rates = ', '.join(f"{format_rate(val)} {key[:-6]}/s" for key, val in stage['rates'].items())
+        cached = ' (cached)' if stage['counters'].get('cached') else ''
+        wtxt = f" x{stage['workers']}" if stage['workers'] > 1 else ''
+        rows.append(f"<tr><td>{name}{wtxt}{cached}</td><td>{stage['time_s']:.3f}</td><td>{peak}</td><td>{rates}</td></tr>")
+    rows.append(f"<tr><th>total</th><th>{total_s:.3f}</th><th></th><th></th></tr>")
+    document.getElementById("profile-table").innerHTML = ''.join(rows)
+    document.getElementById("profile-panel").hidden = False
+
+def merge_shard_results(shard_res: list, shard_ids: list[list[int]], ngrids: int) -> tuple[list[float], list[int], list[int], list[float], list[dict]]:
+    """
+    merge the mrts of trace_grid_shard from the workers back into the order of the grid points
+
+    Parameters
+    ----------
+    shard_res: list
+        the results of the shards.
+
+    shard_ids: list[list[int]]
+        list[shape(nshards, nshard_grids)] index of the grid points of each shard from split_grid.
+
+    ngrids: int
+        number of grid points.
+
+    Returns
+    -------
+    mrt_ls : list[float]
+        list[shape(ngrids)] mrt of each grid point, nan if it was not calculated before a cancel.
+
+    nray_ls : list[int]
+        list[shape(ngrids)] number of rays cast from each grid point.
+
+    nhit_ls : list[int]
+        list[shape(ngrids)] number of rays of each grid point that hit a voxel.
+
+    stderr_ls : list[float]
+        list[shape(ngrids)] standard error of the mrt of each grid point, nan if the rays per grid point are fixed.
+
+    cache_ls : list[dict]
+        the cache stats of each shard.
+    """
+    mrts = np.full(ngrids, np.nan, dtype=np.float32)
+    nrays = np.zeros(ngrids, dtype=np.int32)
+    nhits = np.zeros(ngrids, dtype=np.int32)
+    stderrs = np.full(ngrids, np.nan, dtype=np.float32)
+    cache_ls = []
+    for res, ids in zip(shard_res, shard_ids):
+        mrts[ids] = js2np(res.mrt)
+        nrays[ids] = js2np(res.nrays)
+        nhits[ids] = js2np(res.nhits)
+        stderrs[ids] = js2np(res.stderr)
+        cache_ls.append(res.cache.to_py())
+    return mrts.tolist(), nrays.tolist(), nhits.tolist(), stderrs.tolist(), cache_ls
+
+def js2np(js_buf) -> np.ndarray:
+    """
+    convert a typed array from the workers to a numpy array
+
+    Parameters
+    ----------
+    js_buf: TypedArray
+        JS typed array, e.g. Float32Array.
+
+    Returns
+    -------
+    np.ndarray
+        the numpy array with the dtype of the typed array.
+    """
+    return np.asarray(js_buf.to_py())
+
+def grid_pts_mrt2rows(grid_pts: list[list[float]], mrts: list[float], nrays: list[int] = None, stderrs: list[float] = None) -> list[list]:
     """
     convert grid pts and mrts to rows
 
@@ -102,18 +440,67 @@ def grid_pts_mrt2rows(grid_pts: list[list[float]], mrts: list[float]) -> list[li
     mrts: list[float]
         mrts calculated corresponding to the grid pts
 
+    nrays: list[int], optional
+        number of rays cast from each grid pt, written as an extra column if given.
+
+    stderrs: list[float], optional
+        standard error of the mrts, written as an extra column if given.
+
     Returns
     -------
     list[list]
-        list[shape(npts, 4)]  
+        list[shape(npts, 4)], 5 or 6 columns with nrays and stderrs
     """
     header_str = ['x', 'y', 'z', 'MRT(degC)']
+    cols = [mrts]
+    if nrays is not None:
+        header_str.append('nrays')
+        cols.append(nrays)
+    if stderrs is not None:
+        header_str.append('stderr(degC)')
+        cols.append(stderrs)
     rows = [header_str]
-    for cnt,grid_pt in enumerate(grid_pts):
-        row = [grid_pt[0], grid_pt[1], grid_pt[2], mrts[cnt]]
-        rows.append(row)
+    rows.extend([grid_pt[0], grid_pt[1], grid_pt[2], *vals] for grid_pt, vals in zip(grid_pts, zip(*cols)))
     return rows
 
+def mrt_npz_web(grid_pts: np.ndarray, mrts: np.ndarray, nhits: np.ndarray, nrays: np.ndarray, stderrs: np.ndarray = None) -> io.BytesIO:
+    """
+    write the results to a compressed npz with a column per array, same columns as raytrace_mrt_engine.write_mrt_npz, so large results can be loaded without parsing the csv
+
+    Parameters
+    ----------
+    grid_pts: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    mrts: np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point.
+
+    nhits: np.ndarray
+        np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+
+    nrays: np.ndarray
+        np.ndarray[shape(ngrids)] number of rays cast from each grid point.
+
+    stderrs: np.ndarray, optional
+        np.ndarray[shape(ngrids)] standard error of the mrts, written if given.
+
+    Returns
+    -------
+    io.BytesIO
+        bufferstream to be written to file in the create_hidden_link function
+    """
+    nhits = np.asarray(nhits, dtype=np.int32)
+    nrays = np.asarray(nrays, dtype=np.int32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        miss_fracs = np.where(nrays != 0, 1 - nhits/nrays, -999.0).astype(np.float32)
+    cols = {'grid_xyzs': np.asarray(grid_pts, dtype=np.float64).reshape(-1, 3), 'mrt': np.asarray(mrts, dtype=np.float32),
+            'nhits': nhits, 'nrays': nrays, 'miss_frac': miss_fracs}
+    if stderrs is not None:
+        cols['stderr'] = np.asarray(stderrs, dtype=np.float32)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **cols)
+    return buffer
+
 def viz_a_grid_rays(grid_pt: list[float], grid_rays: list[list[float]], rgb: list[float]):
     """
     process and viz rays of a grid point
@@ -143,6 +530,338 @@ def viz_a_grid_rays(grid_pt: list[float], grid_rays: list[list[float]], rgb: lis
     threejs_lines = create_lines(lines_xyzs_flat, rgb_color=rgb)
     return threejs_lines
     
+def np2js(arr: np.ndarray):
+    """
+    convert a numpy array to a flat JS Float32Array in one block copy
+
+    Parameters
+    ----------
+    arr: np.ndarray
+        the array, flattened.
+
+    Returns
+    -------
+    Float32Array
+        JS typed array.
+    """
+    return to_js(np.ascontiguousarray(arr, dtype=np.float32).ravel())
+
+def falsecolors_arr(vals: np.ndarray, minval: float, mxval: float) -> np.ndarray:
+    """
+    generate falsecolor values corresponding to the parameters, same colors as rgb_falsecolors computed on arrays
+
+    Parameters
+    ----------
+    vals: np.ndarray
+        np.ndarray[shape(n)], values to be converted to rgb of falsecolor.
+    
+    minval: float
+        min val on the falsecolor bar.
+        
+    mxval: float
+        max val on the falsecolor bar.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(n, 3)] float32 rgb colors.
+    """
+    vals = np.asarray(vals, dtype=np.float64)
+    val_range = mxval - minval
+    if val_range > 0:
+        ratio = np.clip((vals - minval)/val_range, 0, 1)
+    else:
+        ratio = (vals > minval).astype(np.float64)
+    # hue from 250 degrees (blue) for the min to 0 degrees (red) for the max, converted from hsv (h, 1, 1) to rgb
+    h6 = (250 - ratio*250)/360*6
+    sector = np.floor(h6).astype(np.int64) % 6
+    f = h6 - np.floor(h6)
+    one = np.ones_like(f)
+    zero = np.zeros_like(f)
+    rs = np.choose(sector, [one, 1-f, zero, zero, f, one])
+    gs = np.choose(sector, [f, one, one, 1-f, zero, zero])
+    bs = np.choose(sector, [zero, zero, f, one, one, 1-f])
+    return np.column_stack((rs, gs, bs)).astype(np.float32)
+
+def create_vox_outlines(midpts: np.ndarray, vox_dim: float) -> THREE.LineSegments:
+    """
+    create the outlines of all the voxels as a single merged line segments geometry with a color attribute to be set with set_vox_colors
+
+    Parameters
+    ----------
+    midpts: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the midpts of the voxels.
+
+    vox_dim: float
+        the size of the voxels.
+
+    Returns
+    -------
+    THREE.LineSegments
+        threejs line segments of the voxels
+    """
+    nverts = len(VOX_EDGE_VERTS)
+    positions = midpts[:, np.newaxis, :] + VOX_EDGE_VERTS[np.newaxis, :, :] * (vox_dim/2)
+    geometry = THREE.BufferGeometry.new()
+    geometry.setAttribute('position', THREE.Float32BufferAttribute.new(np2js(positions), 3))
+    geometry.setAttribute('color', THREE.Float32BufferAttribute.new(window.Float32Array.new(len(midpts) * nverts * 3), 3))
+    outlines = THREE.LineSegments.new(geometry, THREE.LineBasicMaterial.new(vertexColors = True))
+    return outlines
+
+def set_vox_colors(outlines: THREE.LineSegments, colors: np.ndarray):
+    """
+    update the colors of the voxel outlines in place
+
+    Parameters
+    ----------
+    outlines: THREE.LineSegments
+        the outlines from create_vox_outlines.
+
+    colors: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] rgb color of each voxel.
+    """
+    color_attr = outlines.geometry.getAttribute('color')
+    color_attr.array.set(np2js(np.repeat(colors, len(VOX_EDGE_VERTS), axis=0)))
+    color_attr.needsUpdate = True
+
+def create_grid_spheres(grid_pts: np.ndarray, radius: float = 0.1) -> THREE.InstancedMesh:
+    """
+    create a sphere for each grid point as a single instanced mesh with a per-instance color to be set with set_grid_colors
+
+    Parameters
+    ----------
+    grid_pts: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    radius: float, optional
+        radius of the spheres. Default = 0.1.
+
+    Returns
+    -------
+    THREE.InstancedMesh
+        threejs instanced mesh of the spheres
+    """
+    ngrids = len(grid_pts)
+    geometry = THREE.SphereGeometry.new(radius, 10, 10)
+    material = THREE.MeshBasicMaterial.new()
+    mesh = THREE.InstancedMesh.new(geometry, material, ngrids)
+    # column major translation matrices
+    matrices = np.tile(np.eye(4, dtype=np.float32).ravel(), (ngrids, 1))
+    matrices[:, 12:15] = grid_pts
+    mesh.instanceMatrix.array.set(np2js(matrices))
+    mesh.instanceMatrix.needsUpdate = True
+    mesh.instanceColor = THREE.InstancedBufferAttribute.new(window.Float32Array.new(ngrids * 3), 3)
+    mesh.computeBoundingSphere()
+    return mesh
+
+def set_grid_colors(mesh: THREE.InstancedMesh, colors: np.ndarray, ids: np.ndarray = None):
+    """
+    update the colors of the grid spheres in place
+
+    Parameters
+    ----------
+    mesh: THREE.InstancedMesh
+        the spheres from create_grid_spheres.
+
+    colors: np.ndarray
+        np.ndarray[shape(ngrids, 3)] rgb color of each grid point, np.ndarray[shape(nids, 3)] with ids.
+
+    ids: np.ndarray, optional
+        np.ndarray[shape(nids)] index of the grid points to color, the other grid points keep their colors and only the span of the buffer
+        from the first to the last of the ids is written and uploaded. Default = None, all the grid points are colored.
+    """
+    color_attr = mesh.instanceColor
+    if ids is None:
+        color_attr.array.set(np2js(colors))
+    else:
+        lo = int(ids.min())
+        hi = int(ids.max()) + 1
+        # the shards are dealt round-robin, the ids of a batch are strided, patch the span in numpy and write it back in one block copy
+        span = np.asarray(color_attr.array.subarray(lo*3, hi*3).to_py(), dtype=np.float32).reshape(-1, 3)
+        span[ids - lo] = colors
+        color_attr.array.set(np2js(span), lo*3)
+        color_attr.addUpdateRange(lo*3, (hi - lo)*3)
+    color_attr.needsUpdate = True
+
+def create_lod_points(positions, npts: int) -> THREE.Points:
+    """
+    create the point cloud as a single points geometry from the typed array of the worker without copying it, with a color attribute to be set with set_pts_colors
+
+    Parameters
+    ----------
+    positions: Float32Array
+        JS typed array of the flat points in zxy sorted by level of detail.
+
+    npts: int
+        number of points.
+
+    Returns
+    -------
+    THREE.Points
+        threejs points, drawn up to the count set with update_pts_lod
+    """
+    geometry = THREE.BufferGeometry.new()
+    geometry.setAttribute('position', THREE.BufferAttribute.new(positions, 3))
+    geometry.setAttribute('color', THREE.Float32BufferAttribute.new(window.Float32Array.new(npts * 3), 3))
+    geometry.setDrawRange(0, 0)
+    material = THREE.PointsMaterial.new(size = 0.05, sizeAttenuation = True, vertexColors = True)
+    points = THREE.Points.new(geometry, material)
+    # the points drawn change with the camera, culling by the bounding sphere of all the points is enough
+    geometry.computeBoundingSphere()
+    return points
+
+def set_pts_colors(points: THREE.Points, colors: np.ndarray):
+    """
+    update the colors of the point cloud in place
+
+    Parameters
+    ----------
+    points: THREE.Points
+        the points from create_lod_points.
+
+    colors: np.ndarray
+        np.ndarray[shape(npts, 3)] rgb color of each point.
+    """
+    color_attr = points.geometry.getAttribute('color')
+    color_attr.array.set(np2js(colors))
+    color_attr.needsUpdate = True
+
+def lod_draw_count(lod: dict, distance: float, budget: int) -> tuple[int, float]:
+    """
+    number of points to draw from the start of the level of detail order for a camera at a distance from the points
+
+    Parameters
+    ----------
+    lod: dict
+        the "level_ends", "spacings" and "radius" of the point cloud from the worker.
+
+    distance: float
+        distance of the camera from the center of the points.
+
+    budget: int
+        maximum number of points to draw.
+
+    Returns
+    -------
+    count : int
+        number of points to draw.
+
+    spacing : float
+        spacing of the points of the finest level drawn.
+    """
+    # the finest level needed is the first with a spacing seen under PTS_LOD_ANGLE from the nearest points
+    near = max(distance - lod['radius'], 0.0)
+    level = min(int(np.searchsorted(-lod['spacings'], -near*PTS_LOD_ANGLE, side='left')), len(lod['level_ends']) - 1)
+    count = int(min(lod['level_ends'][level], max(budget, 1)))
+    # a budget smaller than the level draws a coarser level, the points are drawn with its spacing
+    level = min(int(np.searchsorted(lod['level_ends'], count, side='left')), level)
+    return count, float(lod['spacings'][level])
+
+def get_pts_budget() -> int:
+    """
+    read the point budget of the point cloud from the webapp
+
+    Returns
+    -------
+    int
+        maximum number of points to draw.
+    """
+    budget = document.querySelector("#pts-budget").value
+    return int(budget) if budget else 1000000
+
+def update_pts_lod():
+    """
+    draw the points of the level of detail fitting the distance of the camera, only the draw range and the size of the points change
+    """
+    distance = camera.position.distanceTo(PLY_LOD['center'])
+    count, spacing = lod_draw_count(PLY_LOD, distance, PLY_LOD['budget'])
+    PTS_CLOUD.geometry.setDrawRange(0, count)
+    PTS_CLOUD.material.size = max(0.05, spacing)
+
+def recolor_results(mn_temp: float, mx_temp: float):
+    """
+    recolor the voxels and grid spheres of the results in place for a new range of the color bar, the geometries are not rebuilt
+
+    Parameters
+    ----------
+    mn_temp: float
+        min val on the falsecolor bar.
+
+    mx_temp: float
+        max val on the falsecolor bar.
+    """
+    global MN_TEMP, MX_TEMP
+    MN_TEMP = mn_temp
+    MX_TEMP = mx_temp
+    change_color_bar(mn_temp, mx_temp)
+    if VX_OUTLINES is not None:
+        set_vox_colors(VX_OUTLINES, falsecolors_arr(VX_TEMPS, mn_temp, mx_temp))
+    if GRID_MESH is not None:
+        set_grid_colors(GRID_MESH, grid_colors(MRT_VALS, mn_temp, mx_temp))
+    if PTS_CLOUD is not None:
+        set_pts_colors(PTS_CLOUD, falsecolors_arr(PLY_TEMPS, mn_temp, mx_temp))
+
+def grid_colors(mrts: np.ndarray, mn_temp: float, mx_temp: float) -> np.ndarray:
+    """
+    falsecolors of the grid points, the grid points not calculated yet are grey
+
+    Parameters
+    ----------
+    mrts: np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point, nan if not calculated yet.
+
+    mn_temp: float
+        min val on the falsecolor bar.
+
+    mx_temp: float
+        max val on the falsecolor bar.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ngrids, 3)] rgb color of each grid point.
+    """
+    not_done = np.isnan(mrts)
+    colors = falsecolors_arr(np.where(not_done, mn_temp, mrts), mn_temp, mx_temp)
+    colors[not_done] = 0.5
+    return colors
+
+def report_partial(worker_id: int, grid_ids, mrts, msg: str) -> bool:
+    """
+    called by the workers after each batch of grid points, colors the grid points of the batch
+
+    Parameters
+    ----------
+    worker_id: int
+        id of the worker.
+
+    grid_ids: Int32Array
+        index of the grid points of the batch in the shard of the worker.
+
+    mrts: Float32Array
+        mrt of the grid points of the batch.
+
+    msg: str
+        progress message of the worker.
+
+    Returns
+    -------
+    bool
+        False if the calculation is cancelled and the worker should stop.
+    """
+    change_worker_text(worker_id, msg)
+    ids = STREAM_SHARDS[worker_id][js2np(grid_ids)]
+    MRT_VALS[ids] = js2np(mrts)
+    if len(ids) != 0:
+        set_grid_colors(GRID_MESH, grid_colors(MRT_VALS[ids], MN_TEMP, MX_TEMP), ids=ids)
+    return not CANCELLED
+
+def cancel_calc(*args):
+    global CANCELLED
+    CANCELLED = True
+    cancel_btn.disabled = True
+    change_dialog_text('Cancelling after the current batch ...')
+
 async def on_submit(e):
     try:
         # region: get all the parameters
@@ -150,7 +869,6 @@ async def on_submit(e):
         submit_btn = document.getElementById("stcsv-submit")
         submit_btn.disabled = True
         set_cam_orig()
-        init_edges = scene.getObjectByName( "init_edges", True )
         scene.add(init_edges)
         output_p = document.querySelector("#stcsv-output")
         output_p.textContent = 'Calculating ...'
@@ -175,98 +893,131 @@ async def on_submit(e):
             grid_bytes = await get_bytes_from_file(grid_item)
             vdim = float(document.querySelector("#vdim").value)
             nrays = float(document.querySelector("#nray").value)
-            # Await for the worker
-            worker_config = {
-                                "packages": ["plyfile>=1.1.3", "geomie3d==0.0.11", "numpy-stl>=3.2.0",
-                                            "./lib/pyscript_3dapp_lib-0.0.2-py3-none-any.whl", 
-                                            "./lib/raytrace_mrt_lib-0.0.2-py3-none-any.whl"]
-                            }
-            worker = PyWorker("./worker.py", type="pyodide", config = worker_config)
-            # Await for the worker
-            await worker.ready
-            worker.sync.change_dialog_text = change_dialog_text
+            # tolerance of the standard error of the mrt, 0 casts a fixed number of rays per grid point
+            tol = float(document.querySelector("#mrt-tol").value or 0)
+            max_rays = int(document.querySelector("#max-rays").value or 2000)
+            # method used by the workers to intersect the rays with the voxels
+            intx_method = document.querySelector("#intx-method").value or 'slab'
+            # tracing the peak memory of the stages slows down the workers, only when asked for
+            trace_memory = bool(document.querySelector("#trace-memory").checked)
+            # Await for the workers started at page load
+            global SUBMIT_T, FIRST_PROGRESS_DUR, SHARED_VOXELS
+            SUBMIT_T = perf_counter()
+            FIRST_PROGRESS_DUR = None
+            change_dialog_text('Waiting for the workers to be ready ...')
+            # stages timed in the main script, the stages of the workers are merged in as they return
+            profile = {'stages': {}}
+            ts = perf_counter()
+            workers = await POOL_TASK
+            add_main_stage(profile, 'wait_workers', perf_counter() - ts)
+            clear_results()
             # endregion: loading dialog and get extra parameters
-            # region: calculate the mrt and retrieve information from the calc
+            # region: voxelize once and broadcast the voxels to the pool
             world = create_grp()
-            mrt_data = await worker.sync.calc_mrt(st_bytes, grid_bytes, vdim, nrays)
-            vx_midpts = list(mrt_data.midpts)
-            vx_midpts = list(map(list, vx_midpts))
-            nmidpts = len(vx_midpts)
-            vx_temps = list(mrt_data.temps)
-            cam_pos = mrt_data.cam[0]
-            lookat = mrt_data.cam[1]
-            global GRID_PTS
-            grid_pts = mrt_data.grid
+            world.name = 'mrt_world'
+            scene_data = await workers[0].sync.prepare_scene(st_bytes, grid_bytes, vdim, trace_memory)
+            merge_profiles(profile, [scene_data.profile.to_py()])
+            ts = perf_counter()
+            grid_xyzs = js2np(scene_data.grid_xyzs).reshape(-1, 3).tolist()
+            nworkers = max(1, min(len(workers), len(grid_xyzs)))
+            workers = workers[:nworkers]
+            change_dialog_text(f"Broadcasting the voxels to {nworkers} workers ...")
+            if SHARED_VOXELS is None or SHARED_VOXELS[0] != scene_data.key:
+                SHARED_VOXELS = (scene_data.key, share_voxels(scene_data.voxels))
+            voxel_buf = SHARED_VOXELS[1]
+            load_res = await asyncio.gather(*[worker.sync.load_voxels(voxel_buf, vdim, scene_data.key, intx_method, trace_memory) for worker in workers])
+            add_main_stage(profile, 'broadcast', perf_counter() - ts)
+            merge_profiles(profile, [res.to_py() for res in load_res])
+            ts = perf_counter()
+            # endregion: voxelize once and broadcast the voxels to the pool
+            # region: show the voxels and the grid points before the calculation
+            global GRID_OWNERS, POOL_WORKERS, GRID_PTS, VX_OUTLINES, VX_TEMPS, GRID_MESH, MRT_VALS, STREAM_SHARDS, CANCELLED
+            vx_midpts = js2np(scene_data.midpts).reshape(-1, 3)
+            vx_temps = js2np(scene_data.temps)
+            cam_place = js2np(scene_data.cam).tolist()
+            cam_pos = cam_place[0:3]
+            lookat = cam_place[3:6]
+            grid_pts = convertxyz2zxy(grid_xyzs).tolist()
             GRID_PTS = grid_pts
-            mrt_ls = mrt_data.mrt
-            mrt_ls = np.round(mrt_ls,2).tolist()
-            global PLY_PTS
-            pts = list(mrt_data.pts)
-            PLY_PTS = pts
-            global PLY_TEMPS
-            pts_temps = list(mrt_data.pts_temp)
-            PLY_TEMPS = pts_temps
-            global GRID_RAYS
-            grid_rays = mrt_data.rays # shape(ngrids, nintx, 3)
-            GRID_RAYS = grid_rays
-            global GRID_MS_RAYS
-            grid_ms_rays = mrt_data.miss_rays # shape(ngrids, nmiss, 3)
-            GRID_MS_RAYS = grid_ms_rays
-            # endregion: calculate the mrt and retrieve information from the calc
-            # region: convert all temps to falsecolor
-            mn_vxtemp = min(vx_temps)
-            mx_vxtemp = max(vx_temps)
-            mn_mrt = min(mrt_ls)
-            mx_mrt = max(mrt_ls)
-            mn_temp = min([mn_vxtemp, mn_mrt])
-            mx_temp = max([mx_vxtemp, mx_mrt])
-            global MN_TEMP
-            MN_TEMP = mn_temp
-            global MX_TEMP
-            MX_TEMP = mx_temp
-            change_color_bar(mn_temp, mx_temp)
-            nvx_verts = 24
-            vx_temps2 = np.repeat(vx_temps, nvx_verts)
-            vx_colors = rgb_falsecolors(vx_temps2, mn_temp, mx_temp)
-            vx_colors = np.reshape(vx_colors, (nmidpts, nvx_verts*3)).tolist()
-            # endregion: convert all temps to falsecolor
-            # region: viz voxels mrt to falsecolor and viz the points
-            outlines = viz_vox_outlines(vx_midpts, vx_colors, vdim)
-            world.add(outlines)
-            
-            mrt_colors = rgb_falsecolors(mrt_ls, mn_temp, mx_temp)
-            mrt_colors = np.reshape(mrt_colors, (len(mrt_ls), 3)).tolist()
-            for gcnt, grid_pt in enumerate(grid_pts):
-                rgb = mrt_colors[gcnt]
-                grid_sphere = create_sphere(0.1, 10, 10, r = rgb[0], g = rgb[1], b = rgb[2])
-                grid_sphere.position.x = grid_pt[0]
-                grid_sphere.position.y = grid_pt[1]
-                grid_sphere.position.z = grid_pt[2]
-                world.add(grid_sphere)
-            # endregion: viz voxels mrt to falsecolor and viz the points
-            # region: prepare the 3d scene
+            ngrids = len(grid_pts)
+            VX_OUTLINES = create_vox_outlines(vx_midpts, vdim)
+            VX_TEMPS = vx_temps
+            world.add(VX_OUTLINES)
+            GRID_MESH = create_grid_spheres(np.array(grid_pts), 0.1)
+            MRT_VALS = np.full(ngrids, np.nan)
+            world.add(GRID_MESH)
+            # the grid points are colored with the range of the voxels while they stream in
+            recolor_results(float(vx_temps.min()), float(vx_temps.max()))
             camera.position.set(cam_pos[0], cam_pos[1], cam_pos[2])
-            camera.lookAt(lookat)
-
+            camera.lookAt(lookat[0], lookat[1], lookat[2])
             scene.remove(init_edges)
             scene.add(world)
-            worker.terminate()
+            add_main_stage(profile, 'build_geometry', perf_counter() - ts)
+            # endregion: show the voxels and the grid points before the calculation
+            # region: stream the mrt of each shard of grid points and merge the results
+            WORKER_TEXTS.clear()
+            shards, shard_ids = split_grid(grid_xyzs, nworkers)
+            STREAM_SHARDS = [np.array(ids, dtype=np.int64) for ids in shard_ids]
+            busy = [wcnt for wcnt, shard in enumerate(shards) if len(shard) != 0]
+            CANCELLED = False
+            cancel_btn.disabled = False
+            ts = perf_counter()
+            shard_res = await asyncio.gather(*[workers[wcnt].sync.trace_grid_shard(shards[wcnt], nrays, wcnt, tol, max_rays, trace_memory)
+                                             for wcnt in busy])
+            cancel_btn.disabled = True
+            merge_profiles(profile, [res.profile.to_py() for res in shard_res])
+            add_main_stage(profile, 'stream', perf_counter() - ts)
+            ts = perf_counter()
+            mrt_ls, nray_ls, nhit_ls, stderr_ls, cache_ls = merge_shard_results(shard_res, [shard_ids[wcnt] for wcnt in busy], ngrids)
+            cache_res = sum_cache_stats([scene_data.cache.to_py()] + cache_ls)
+            print(f"cache hits: {cache_res['hits']}, cache misses: {cache_res['misses']}")
+            if cache_res['skipped']:
+                print(f"too large to cache: {cache_res['skipped']}")
+            GRID_OWNERS = [None] * ngrids
+            for wcnt in busy:
+                for cnt, gcnt in enumerate(shard_ids[wcnt]):
+                    GRID_OWNERS[gcnt] = (wcnt, cnt)
+            POOL_WORKERS = workers
+            MRT_VALS = np.round(mrt_ls, 2)
+            done = np.logical_not(np.isnan(MRT_VALS))
+            ndone = int(np.count_nonzero(done))
+            mn_temp = vx_temps.min()
+            mx_temp = vx_temps.max()
+            if ndone != 0:
+                mn_temp = min(mn_temp, MRT_VALS[done].min())
+                mx_temp = max(mx_temp, MRT_VALS[done].max())
+            recolor_results(float(mn_temp), float(mx_temp))
             loading_dialog.close()
-            # endregion: prepare the 3d scene
+            # endregion: stream the mrt of each shard of grid points and merge the results
             # region: prepare data for downloads and other viz
-            global MRT_RES
-            csv_rows = grid_pts_mrt2rows(grid_pts, mrt_ls)
+            global MRT_RES, MRT_NPZ
+            # only the grid points calculated before a cancel are written
+            done_pts = np.array(grid_pts)[done]
+            nray_arr = np.array(nray_ls)[done]
+            nhit_arr = np.array(nhit_ls)[done]
+            if tol > 0:
+                stderr_arr = np.array(stderr_ls)[done]
+                csv_rows = grid_pts_mrt2rows(done_pts.tolist(), MRT_VALS[done].tolist(), nray_arr.tolist(), np.round(stderr_arr, 3).tolist())
+                print(f"adaptive rays: {int(nray_arr.sum())} rays cast, max {int(nray_arr.max(initial=0))} per grid point")
+            else:
+                stderr_arr = None
+                csv_rows = grid_pts_mrt2rows(done_pts.tolist(), MRT_VALS[done].tolist())
             mrt_res = write_csv_web(csv_rows)
             MRT_RES = mrt_res
+            MRT_NPZ = mrt_npz_web(done_pts, np.array(mrt_ls, dtype=np.float32)[done], nhit_arr, nray_arr, stderr_arr)
             t2 = perf_counter()
-            dur = int((t2 - t1)/60)
-            if dur == 0:
-                dur = 'less than a minute'
-            output_p.textContent = f"Success! Time Elapsed (mins): {dur}"
+            add_main_stage(profile, 'finalize', t2 - ts)
+            dur = round(t2 - t1, 1)
+            show_profile(profile, t2 - t1)
+            first_msg = f"{round(FIRST_PROGRESS_DUR, 1)} s" if FIRST_PROGRESS_DUR is not None else 'n/a'
+            print(f"time to first progress message: {first_msg}")
+            ntrace_hits = cache_res['hits'].get('trace', 0)
+            status = 'Success!' if ndone == ngrids else f"Cancelled, {ndone}/{ngrids} grid points calculated."
+            output_p.textContent = f"{status} Time Elapsed (s): {dur}, first progress after {first_msg}, {ntrace_hits}/{ngrids} grid points reused"
             
             dl_btn.disabled = False
-            dl_msg = document.querySelector("#mrt-output")
-            dl_msg.textContent = 'Refresh to do another projection.'
+            npz_btn.disabled = False
+            submit_btn.disabled = False
 
             vizpts_btn.disabled = False
             gridid_btn.disabled = False
@@ -280,34 +1031,110 @@ async def on_submit(e):
     except Exception as e:
         change_dialog_text(e)
         print(e)
+        document.getElementById("stcsv-submit").disabled = False
 
 def downloadFile(*args):
     create_hidden_link(MRT_RES, f"{PLY_NAME}_mrt_res", 'csv')
 
-def viz_pts(*args):
-    global VIZ_PTS_MODE
+def downloadNpz(*args):
+    create_hidden_link(MRT_NPZ, f"{PLY_NAME}_mrt_res", 'npz')
+
+async def gen_grid(*args):
+    """
+    generate a grid over the floor of the uploaded ply refined where the mrt is steep and download it with the mrt of each grid point.
+    The csv can be uploaded as the mrt grid file.
+    """
+    grid_btn = document.getElementById("grid-gen")
+    output_p = document.querySelector("#grid-output")
+    st_file_list = document.querySelector("#stpts-file-upload").files
+    loading_dialog = document.getElementById("loading")
+    loading_dialog.showModal()
+    if len(st_file_list) == 0:
+        change_dialog_text('Please specify PLY file')
+        return
+    try:
+        grid_btn.disabled = True
+        t1 = perf_counter()
+        st_item = st_file_list.item(0)
+        st_name = st_item.name.split('.')[0]
+        st_bytes = await get_bytes_from_file(st_item)
+        vdim = float(document.querySelector("#vdim").value)
+        nrays = float(document.querySelector("#nray").value)
+        height = float(document.querySelector("#grid-height").value)
+        spacing = float(document.querySelector("#grid-spacing").value)
+        threshold = float(document.querySelector("#grid-threshold").value)
+        max_depth = int(document.querySelector("#grid-depth").value)
+        change_dialog_text('Waiting for the workers to be ready ...')
+        workers = await POOL_TASK
+        grid_res = await workers[0].sync.gen_grid(st_bytes, vdim, height, spacing, threshold, max_depth, nrays)
+        grid_xyzs = js2np(grid_res.grid_xyzs).reshape(-1, 3)
+        mrts = np.round(js2np(grid_res.mrt), 2)
+        csv_rows = grid_pts_mrt2rows(grid_xyzs.tolist(), mrts.tolist())
+        create_hidden_link(write_csv_web(csv_rows), f"{st_name}_mrt_grid", 'csv')
+        t2 = perf_counter()
+        output_p.textContent = f"{len(grid_xyzs)} grid points ({grid_res.nuniform} in a uniform grid), Time Elapsed (s): {round(t2 - t1, 1)}"
+        loading_dialog.close()
+    except Exception as e:
+        change_dialog_text(e)
+        print(e)
+    grid_btn.disabled = False
+
+async def viz_pts(*args):
+    global VIZ_PTS_MODE, PTS_CLOUD, PLY_TEMPS, PLY_LOD
     if VIZ_PTS_MODE == 0:
-        pts_colors = rgb_falsecolors(PLY_TEMPS, MN_TEMP, MX_TEMP)
-        three_js_pts = viz_pts_color(PLY_PTS, pts_colors, size=0.05)
-        three_js_pts.name = 'three_js_pts'
-        scene.add(three_js_pts)
+        if PTS_CLOUD is None:
+            cloud = await POOL_WORKERS[0].sync.get_cloud()
+            PLY_TEMPS = js2np(cloud.temps)
+            center = js2np(cloud.center)
+            PLY_LOD = {'level_ends': js2np(cloud.level_ends), 'spacings': js2np(cloud.spacings), 'radius': float(cloud.radius),
+                       'center': THREE.Vector3.new(float(center[0]), float(center[1]), float(center[2]))}
+            PTS_CLOUD = create_lod_points(cloud.pts, len(PLY_TEMPS))
+            PTS_CLOUD.name = 'three_js_pts'
+            set_pts_colors(PTS_CLOUD, falsecolors_arr(PLY_TEMPS, MN_TEMP, MX_TEMP))
+            scene.add(PTS_CLOUD)
+        PLY_LOD['budget'] = get_pts_budget()
+        update_pts_lod()
+        PTS_CLOUD.visible = True
         VIZ_PTS_MODE = 1
     else:
-        three_js_pts = scene.getObjectByName( "three_js_pts", True )
-        scene.remove(three_js_pts)
+        PTS_CLOUD.visible = False
         VIZ_PTS_MODE = 0
 
-def viz_rays(*args):
+def change_pts_budget(*args):
+    if PLY_LOD is not None:
+        PLY_LOD['budget'] = get_pts_budget()
+
+async def get_grid_rays(grid_id: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    fetch the rays of a grid point from the worker that traced it
+
+    Parameters
+    ----------
+    grid_id: int
+        index of the grid point.
+
+    Returns
+    -------
+    grid_rays : np.ndarray
+        np.ndarray[shape(nintx, 3)] intersection points of the grid point.
+
+    grid_ms_rays : np.ndarray
+        np.ndarray[shape(nmiss, 3)] end points of the rays that missed.
+    """
+    wcnt, shard_id = GRID_OWNERS[grid_id]
+    grid_res = await POOL_WORKERS[wcnt].sync.get_grid_rays(shard_id)
+    grid_rays = js2np(grid_res.rays).reshape(-1, 3)
+    grid_ms_rays = js2np(grid_res.miss_rays).reshape(-1, 3)
+    return grid_rays, grid_ms_rays
+
+async def viz_rays(*args):
     global RAYS_ON
     grid_pts = GRID_PTS
-    rays = GRID_RAYS
-    ms_rays = GRID_MS_RAYS
     grid_id = int(document.querySelector("#grid_id").value)
     grid_pt = grid_pts[grid_id-1]
-    grid_rays = rays[grid_id-1]
-    grid_ms_rays = ms_rays[grid_id-1]
-    nms_rays = len(grid_ms_rays)
     if RAYS_ON == None:
+        grid_rays, grid_ms_rays = await get_grid_rays(grid_id-1)
+        nms_rays = len(grid_ms_rays)
         threejs_lines = viz_a_grid_rays(grid_pt, grid_rays, [1,0,0])
         threejs_lines.name = f"grid_rays{grid_id}"
         scene.add(threejs_lines)
@@ -322,6 +1149,8 @@ def viz_rays(*args):
         scene.remove(three_js_lines)
         scene.remove(three_js_lines_ms)
         if grid_id != RAYS_ON:
+            grid_rays, grid_ms_rays = await get_grid_rays(grid_id-1)
+            nms_rays = len(grid_ms_rays)
             threejs_lines = viz_a_grid_rays(grid_pt, grid_rays, [1,0,0])
             threejs_lines.name = f"grid_rays{grid_id}"
             scene.add(threejs_lines)
@@ -335,7 +1164,13 @@ def viz_rays(*args):
 
 if __name__ == "__main__":
     animate()
+    # warm up the workers while the user picks the files
+    POOL_TASK = asyncio.create_task(start_pool())
     add_event_listener(document.getElementById("stcsv-submit"), "click", lambda e: asyncio.create_task(on_submit(e)))
     add_event_listener(document.getElementById("mrt-download"), "click", downloadFile)
-    add_event_listener(document.getElementById("viz_pts"), "click", viz_pts)
-    add_event_listener(document.getElementById("viz_rays"), "click", viz_rays)
\ No newline at end of file
+    add_event_listener(document.getElementById("mrt-npz-download"), "click", downloadNpz)
+    add_event_listener(document.getElementById("grid-gen"), "click", lambda e: asyncio.create_task(gen_grid(e)))
+    add_event_listener(document.getElementById("mrt-cancel"), "click", cancel_calc)
+    add_event_listener(document.getElementById("viz_pts"), "click", lambda e: asyncio.create_task(viz_pts(e)))
+    add_event_listener(document.getElementById("pts-budget"), "change", change_pts_budget)
+    add_event_listener(document.getElementById("viz_rays"), "click", lambda e: asyncio.create_task(viz_rays(e)))
\ No newline at end of file
@@ -0,0 +1,16 @@
+"""
+array based engine for the raytracing mrt calculations
+"""
+from .intersect import midpts2bounds, rays_voxels_intersect
+from .traverse import gen_voxel_lookup, find_voxels, rays_voxels_traverse
+from .bvh import content_key, scene_key, gen_bvh, save_bvh, load_bvh, get_cached_bvh, bvh_intersect
+from .rays import get_unit_dirs, gen_rays_arr, separate_rays_arr
+from .voxel import voxelize, voxelize_chunks, pack_voxels, unpack_voxels
+from .cache import gen_cache, cache_get, cache_put, cache_stats
+from .instrument import gen_profile, profile_stage, add_stage, format_profile, write_profile
+from .plyio import parse_ply_header, read_ply_vertex, ply_vertex_columns, ply_vertex_count, iter_ply_vertex_chunks
+from .pipeline import INTX_METHODS, MIN_BATCH_RAYS, load_scene, gen_tracer, trace_rays, trace_grid, aggregate_grid, calc_grid_mrt, ray_ends, iter_grid_mrt, calc_mrt_arr, read_grid_csv, write_mrt_csv, write_mrt_npz, read_mrt_npz
+from .adaptive import random_rotation, iter_grid_mrt_adaptive, calc_grid_mrt_adaptive
+from .viewfactor import gen_view_matrix, save_view_matrix, load_view_matrix, frame_voxel_temps, view_matrix_mrt, calc_frames_mrt
+from .gridgen import floor_extent, gen_adaptive_grid, calc_adaptive_grid
+from .lod import gen_point_lod
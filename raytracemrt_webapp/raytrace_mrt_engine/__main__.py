@@ -0,0 +1,231 @@
+"""
+headless entry point of the engine, e.g.
+
+    python -m raytrace_mrt_engine run scan.ply grid.csv --vdim 0.1 --nrays 100 --workers 8
+    python -m raytrace_mrt_engine viewmatrix scan.ply grid.csv --vdim 0.1 --nrays 100 --out vmat.npz
+    python -m raytrace_mrt_engine frames vmat.npz frame_*.ply --radiant --out-dir mrt_frames
+    python -m raytrace_mrt_engine grid scan.ply --vdim 0.1 --height 1.0 --spacing 1.0 --threshold 0.3 --max-depth 3
+    python -m raytrace_mrt_engine bench --scales xs s m --out bench.json
+    python -m raytrace_mrt_engine batch jobs.json --procs 4 --report batch.json
+"""
+import os
+import sys
+import argparse
+from time import perf_counter
+
+from .pipeline import INTX_METHODS, calc_mrt_arr, read_grid_csv, write_mrt_csv, write_mrt_npz
+from .batch import read_manifest, run_batch, format_batch, write_batch_json
+from .bench import SCALES, DEFAULT_SCALES, run_bench, format_bench, write_bench_json
+from .gridgen import calc_adaptive_grid
+from .instrument import format_profile, write_profile
+from .viewfactor import gen_view_matrix, save_view_matrix, load_view_matrix, calc_frames_mrt
+
+def _print_progress(msg: str):
+    print(msg.replace('\n', ' '), file=sys.stderr)
+
+def run(args: argparse.Namespace):
+    """
+    calculate the mrt of the grid points from a ply file and write them to a csv file
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the run command.
+    """
+    t1 = perf_counter()
+    grid_xyzs = read_grid_csv(args.grid)
+    res = calc_mrt_arr(args.ply, grid_xyzs, args.vdim, args.nrays, intx_method=args.method, bvh_dir=args.bvh_dir,
+                       workers=args.workers, progress=_print_progress, tol=args.tol, max_rays=args.max_rays,
+                       profile=args.profile is not None, chunk_size=args.chunk_size, trace_memory=args.trace_memory)
+    out = args.out
+    if out is None:
+        ply_name = os.path.basename(args.ply).split('.')[0]
+        out = f"{ply_name}_mrt_res.csv"
+    if args.tol > 0:
+        write_mrt_csv(out, res['grid_xyzs'], res['mrt'], nrays=res['nrays'], stderrs=res['stderr'])
+        print(f"Adaptive rays: {int(res['nrays'].sum())} rays cast, max {int(res['nrays'].max())} per grid point", file=sys.stderr)
+    else:
+        write_mrt_csv(out, res['grid_xyzs'], res['mrt'])
+    if args.npz:
+        npz_out = os.path.splitext(out)[0] + '.npz'
+        write_mrt_npz(npz_out, res['grid_xyzs'], res['mrt'], nhits=res['nhits'], nrays=res['nrays'], stderrs=res.get('stderr'))
+        print(f"Binary results written to {npz_out}", file=sys.stderr)
+    if args.profile is not None:
+        write_profile(args.profile, res['profile'])
+        print(format_profile(res['profile']), file=sys.stderr)
+    t2 = perf_counter()
+    print(f"Success! {len(grid_xyzs)} grid points written to {out}, Time Elapsed (s): {round(t2 - t1, 1)}", file=sys.stderr)
+
+def viewmatrix(args: argparse.Namespace):
+    """
+    trace the grid points once and save the view matrix of the grid points onto the voxels
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the viewmatrix command.
+    """
+    t1 = perf_counter()
+    grid_xyzs = read_grid_csv(args.grid)
+    res = calc_mrt_arr(args.ply, grid_xyzs, args.vdim, args.nrays, intx_method=args.method, bvh_dir=args.bvh_dir,
+                       workers=args.workers, progress=_print_progress, chunk_size=args.chunk_size)
+    vmat = gen_view_matrix(res['trace'], res['scene']['voxels'], res['grid_xyzs'])
+    save_view_matrix(args.out, vmat)
+    t2 = perf_counter()
+    print(f"Success! {len(grid_xyzs)} x {len(vmat['ijks'])} view matrix with {len(vmat['data'])} entries written to {args.out}, "
+          f"Time Elapsed (s): {round(t2 - t1, 1)}", file=sys.stderr)
+
+def frames(args: argparse.Namespace):
+    """
+    calculate the mrt of each frame of a time series of ply files with a saved view matrix and write one csv per frame
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the frames command.
+    """
+    t1 = perf_counter()
+    vmat = load_view_matrix(args.vmat)
+    mrts = calc_frames_mrt(vmat, args.plys, radiant=args.radiant, progress=_print_progress)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for ply, frame_mrts in zip(args.plys, mrts):
+        ply_name = os.path.basename(ply).split('.')[0]
+        write_mrt_csv(os.path.join(args.out_dir, f"{ply_name}_mrt_res.csv"), vmat['grid_xyzs'], frame_mrts)
+    t2 = perf_counter()
+    print(f"Success! {len(args.plys)} frames written to {args.out_dir}, Time Elapsed (s): {round(t2 - t1, 1)}", file=sys.stderr)
+
+def grid(args: argparse.Namespace):
+    """
+    generate an adaptive grid over the floor of the voxel model, refined where the mrt is steep, and write the grid points and their mrt to a csv file
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the grid command.
+    """
+    t1 = perf_counter()
+    res = calc_adaptive_grid(args.ply, args.vdim, args.height, args.spacing, threshold=args.threshold, max_depth=args.max_depth,
+                             nrays=args.nrays, intx_method=args.method, bvh_dir=args.bvh_dir, margin=args.margin, progress=_print_progress)
+    out = args.out
+    if out is None:
+        ply_name = os.path.basename(args.ply).split('.')[0]
+        out = f"{ply_name}_mrt_grid.csv"
+    write_mrt_csv(out, res['grid_xyzs'], res['mrt'])
+    t2 = perf_counter()
+    print(f"Success! {len(res['grid_xyzs'])} grid points written to {out} ({res['nuniform']} in a uniform grid at the finest spacing), "
+          f"Time Elapsed (s): {round(t2 - t1, 1)}", file=sys.stderr)
+
+def bench(args: argparse.Namespace):
+    """
+    time and measure the peak memory of each stage of the pipeline on the reference case and synthetic scenes, write them to a json file
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the bench command.
+    """
+    bench_res = run_bench(scales=args.scales, intx_method=args.method, reference=not args.no_reference, seed=args.seed,
+                          progress=_print_progress)
+    write_bench_json(args.out, bench_res)
+    print(format_bench(bench_res))
+    print(f"Benchmark of {len(bench_res['cases'])} cases written to {args.out}", file=sys.stderr)
+
+def batch(args: argparse.Namespace):
+    """
+    run the jobs of a manifest on a pool of processes and report the duration of each job and the jobs per hour
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        the parsed arguments of the batch command.
+    """
+    jobs = read_manifest(args.manifest)
+    cache_bytes = None if args.cache_mb is None else int(args.cache_mb * 1e6)
+    batch_res = run_batch(jobs, max_procs=args.procs, progress=_print_progress, cache_bytes=cache_bytes)
+    print(format_batch(batch_res))
+    if args.report is not None:
+        write_batch_json(args.report, batch_res)
+    if batch_res['nfailed'] != 0:
+        sys.exit(1)
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog='python -m raytrace_mrt_engine', description='perform ray tracing to calculate the mrt')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='calculate the mrt of the grid points')
+    run_parser.add_argument('ply', help='projected point cloud with surface temperature (.ply)')
+    run_parser.add_argument('grid', help='mrt grid file (.csv) with a header row and x, y, z columns')
+    run_parser.add_argument('--vdim', type=float, default=0.1, help='voxel dimensions in meter, default 0.1')
+    run_parser.add_argument('--nrays', type=int, default=100, help='number of rays per grid point, default 100')
+    run_parser.add_argument('--workers', type=int, default=1, help='number of processes to trace the rays with, default 1')
+    run_parser.add_argument('--method', choices=INTX_METHODS, default='slab', help='ray-voxel intersection method, default slab')
+    run_parser.add_argument('--bvh-dir', default=None, help="directory to cache the bvh in when --method is bvh")
+    run_parser.add_argument('--tol', type=float, default=0,
+                            help='if > 0, cast rounds of --nrays rays until the standard error of the mrt is <= tol in degC, default 0 (fixed --nrays)')
+    run_parser.add_argument('--max-rays', type=int, default=2000, help='maximum number of rays per grid point when --tol > 0, default 2000')
+    run_parser.add_argument('--out', default=None, help='the output csv, default {ply name}_mrt_res.csv')
+    run_parser.add_argument('--npz', action='store_true', help='also write the mrt, hits, rays and miss fraction of each grid point to a .npz next to the csv')
+    run_parser.add_argument('--profile', default=None, help='write the time and throughput of each stage to this json file')
+    run_parser.add_argument('--trace-memory', action='store_true', help='with --profile, also trace the peak memory of each stage, slows down the run')
+    run_parser.add_argument('--chunk-size', type=int, default=None,
+                            help='read and voxelize the ply in chunks of this many points, for point clouds that do not fit in memory')
+    run_parser.set_defaults(func=run)
+
+    vmat_parser = subparsers.add_parser('viewmatrix', help='trace the grid points once and save the grid point x voxel view matrix (.npz)')
+    vmat_parser.add_argument('ply', help='projected point cloud with surface temperature (.ply) of the fixed geometry')
+    vmat_parser.add_argument('grid', help='mrt grid file (.csv) with a header row and x, y, z columns')
+    vmat_parser.add_argument('--vdim', type=float, default=0.1, help='voxel dimensions in meter, default 0.1')
+    vmat_parser.add_argument('--nrays', type=int, default=100, help='number of rays per grid point, default 100')
+    vmat_parser.add_argument('--workers', type=int, default=1, help='number of processes to trace the rays with, default 1')
+    vmat_parser.add_argument('--method', choices=INTX_METHODS, default='slab', help='ray-voxel intersection method, default slab')
+    vmat_parser.add_argument('--bvh-dir', default=None, help="directory to cache the bvh in when --method is bvh")
+    vmat_parser.add_argument('--chunk-size', type=int, default=None,
+                             help='read and voxelize the ply in chunks of this many points, for point clouds that do not fit in memory')
+    vmat_parser.add_argument('--out', default='view_matrix.npz', help='the output view matrix, default view_matrix.npz')
+    vmat_parser.set_defaults(func=viewmatrix)
+
+    frames_parser = subparsers.add_parser('frames', help='calculate the mrt of a time series of ply files with a saved view matrix')
+    frames_parser.add_argument('vmat', help='view matrix (.npz) from the viewmatrix command')
+    frames_parser.add_argument('plys', nargs='+', help='the frames (.ply) of the same space')
+    frames_parser.add_argument('--radiant', action='store_true', help='average the temperatures to the 4th power in kelvin instead of the arithmetic mean')
+    frames_parser.add_argument('--out-dir', default='.', help='directory of the output csv, one {ply name}_mrt_res.csv per frame, default .')
+    frames_parser.set_defaults(func=frames)
+
+    grid_parser = subparsers.add_parser('grid', help='generate a grid over the floor refined where the mrt is steep and calculate its mrt')
+    grid_parser.add_argument('ply', help='projected point cloud with surface temperature (.ply)')
+    grid_parser.add_argument('--vdim', type=float, default=0.1, help='voxel dimensions in meter, default 0.1')
+    grid_parser.add_argument('--height', type=float, default=1.0, help='height of the grid in meter, default 1.0')
+    grid_parser.add_argument('--spacing', type=float, default=1.0, help='coarse spacing of the grid in meter, default 1.0')
+    grid_parser.add_argument('--threshold', type=float, default=0.5,
+                             help='split a cell when the mrt at its corners differ by more than this in degC, default 0.5')
+    grid_parser.add_argument('--max-depth', type=int, default=3, help='maximum number of times a coarse cell is split, default 3')
+    grid_parser.add_argument('--margin', type=float, default=0.2, help='distance of the grid from the edges of the floor in meter, default 0.2')
+    grid_parser.add_argument('--nrays', type=int, default=100, help='number of rays per grid point, default 100')
+    grid_parser.add_argument('--method', choices=INTX_METHODS, default='dda', help='ray-voxel intersection method, default dda')
+    grid_parser.add_argument('--bvh-dir', default=None, help="directory to cache the bvh in when --method is bvh")
+    grid_parser.add_argument('--out', default=None, help='the output csv, default {ply name}_mrt_grid.csv')
+    grid_parser.set_defaults(func=grid)
+
+    bench_parser = subparsers.add_parser('bench', help='benchmark the stages of the pipeline on synthetic scenes and examples/simple_example')
+    bench_parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=DEFAULT_SCALES,
+                              help=f"synthetic scenes to run, default {' '.join(DEFAULT_SCALES)}")
+    bench_parser.add_argument('--method', choices=INTX_METHODS, default='slab', help='ray-voxel intersection method, default slab')
+    bench_parser.add_argument('--no-reference', action='store_true', help='skip the examples/simple_example reference case')
+    bench_parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic scenes, default 0')
+    bench_parser.add_argument('--out', default='bench.json', help='the output json, default bench.json')
+    bench_parser.set_defaults(func=bench)
+
+    batch_parser = subparsers.add_parser('batch', help='run the jobs of a manifest on a pool of processes')
+    batch_parser.add_argument('manifest', help='jobs (.json or .csv) with the ply, grid, vdim, nrays and out of each job, '
+                                               'optionally the name, method, tol, max_rays, chunk_size and npz')
+    batch_parser.add_argument('--procs', type=int, default=None, help='maximum number of jobs run at the same time, default the number of cpus')
+    batch_parser.add_argument('--report', default=None, help='write the duration of each job and the jobs per hour to this json file')
+    batch_parser.add_argument('--cache-mb', type=float, default=None,
+                              help='memory budget in MB of the cache shared by the jobs of a ply in a process, default sized from the points of the ply')
+    batch_parser.set_defaults(func=batch)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
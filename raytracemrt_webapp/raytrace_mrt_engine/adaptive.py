@@ -0,0 +1,196 @@
+from typing import Iterator
+
+import numpy as np
+
+from .rays import get_unit_dirs
+from .pipeline import trace_rays
+from .instrument import profile_stage
+
+def random_rotation(rng: np.random.Generator) -> np.ndarray:
+    """
+    generate a uniformly distributed random rotation matrix
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+        the random generator.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(3, 3)] the rotation matrix.
+    """
+    q, r = np.linalg.qr(rng.standard_normal((3, 3)))
+    q = q * np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:, 0] = -q[:, 0]
+    return q
+
+def iter_grid_mrt_adaptive(tracer: dict, vx_temps: np.ndarray, grid_xyzs: np.ndarray, tol: float = 0.1, batch_rays: int = 100,
+                           max_rays: int = 2000, min_hits: int = 10, seed: int = 0, profile: dict = None) -> Iterator[dict]:
+    """
+    trace the grid points in rounds of batch_rays directions and track the running mean and standard error of the temperatures hit by the rays of each grid point.
+    A grid point stops when the standard error of its mrt is within tol or when it reaches max_rays. The first round uses the same directions as
+    raytrace_mrt_engine.gen_rays_arr, the next rounds use randomly rotated copies of them.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with raytrace_mrt_engine.gen_tracer.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    tol: float, optional
+        the grid point stops when the standard error of its mrt is <= tol in degC. Default = 0.1.
+
+    batch_rays: int, optional
+        number of rays cast per grid point in each round. Default = 100.
+
+    max_rays: int, optional
+        maximum number of rays per grid point. Default = 2000.
+
+    min_hits: int, optional
+        minimum number of rays that hit a voxel before the standard error is trusted. Default = 10.
+
+    seed: int, optional
+        seed of the random rotations, the same seed gives the same result. Default = 0.
+
+    profile: dict, optional
+        profile from raytrace_mrt_engine.gen_profile, the "gen_rays", "project" and "aggregate" stages are accumulated over the rounds.
+
+    Yields
+    ------
+    dict
+        after each round, a dictionary containing:
+            - "grid_ids": np.ndarray[shape(nfinished)] index of the grid points finished in this round.
+            - "mrt": np.ndarray[shape(nfinished)] mrt of the finished grid points, -999 if the grid point do not see any temperatures.
+            - "nhits": np.ndarray[shape(nfinished)] number of rays of the finished grid points that hit a voxel.
+            - "nrays": np.ndarray[shape(nfinished)] number of rays cast from the finished grid points.
+            - "stderr": np.ndarray[shape(nfinished)] standard error of the mrt of the finished grid points, -999 if it cannot be estimated.
+            - "trace": dict, the rays of the round with the keys of raytrace_mrt_engine.trace_grid, the "grid_ids" of the rays are indices into grid_xyzs.
+            - "ndone": int, number of grid points finished so far.
+            - "msg": str, progress message.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    vx_temps = np.asarray(vx_temps, dtype=np.float64)
+    ngrids = len(grid_xyzs)
+    unit_dirs = get_unit_dirs(int(batch_rays))
+    nunit = len(unit_dirs)
+    rng = np.random.default_rng(seed)
+    sums = np.zeros(ngrids)
+    sq_sums = np.zeros(ngrids)
+    nhits = np.zeros(ngrids, dtype=np.int64)
+    nrays = np.zeros(ngrids, dtype=np.int64)
+    active = np.arange(ngrids)
+    ndone = 0
+    rnd = 0
+    while len(active) != 0:
+        with profile_stage(profile, 'gen_rays', rays=len(active) * nunit):
+            dirxs = unit_dirs if rnd == 0 else unit_dirs @ random_rotation(rng).T
+            origs = np.repeat(grid_xyzs[active], nunit, axis=0)
+            ray_dirxs = np.tile(dirxs, (len(active), 1))
+            ray_grids = np.repeat(active, nunit)
+        with profile_stage(profile, 'project', rays=len(origs)) as counters:
+            hit_idxs, hit_dists = trace_rays(tracer, origs, ray_dirxs)
+            if tracer['intx_method'] == 'slab':
+                counters['ray_voxel_tests'] = len(origs) * tracer['nvoxels']
+        with profile_stage(profile, 'aggregate', rays=len(origs), grids=len(active)):
+            is_hit = hit_idxs != -1
+            hit_temps = vx_temps[hit_idxs[is_hit]]
+            hit_grids = ray_grids[is_hit]
+            sums += np.bincount(hit_grids, weights=hit_temps, minlength=ngrids)
+            sq_sums += np.bincount(hit_grids, weights=hit_temps**2, minlength=ngrids)
+            nhits += np.bincount(hit_grids, minlength=ngrids)
+            nrays[active] += nunit
+        # running mean and standard error of the active grid points
+        act_n = nhits[active]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(act_n != 0, sums[active]/act_n, -999.0)
+            var = (sq_sums[active] - sums[active]**2/act_n)/(act_n - 1)
+            stderrs = np.where(act_n > 1, np.sqrt(np.maximum(var, 0)/act_n), -999.0)
+        converged = (act_n >= min_hits) & (stderrs >= 0) & (stderrs <= tol)
+        finished = converged | (nrays[active] + nunit > max_rays)
+        fin_ids = active[finished]
+        ndone += len(fin_ids)
+        rnd += 1
+        msg = f"Adaptive rays round {rnd}: {ndone}/{ngrids} grid points finished, {int(nrays.sum())} rays cast"
+        trace = {'origs': origs, 'dirxs': ray_dirxs, 'grid_ids': ray_grids, 'hit_idxs': hit_idxs, 'hit_dists': hit_dists}
+        yield {'grid_ids': fin_ids, 'mrt': means[finished], 'nhits': act_n[finished], 'nrays': nrays[fin_ids],
+               'stderr': stderrs[finished], 'trace': trace, 'ndone': ndone, 'msg': msg}
+        active = active[np.logical_not(finished)]
+
+def calc_grid_mrt_adaptive(tracer: dict, vx_temps: np.ndarray, grid_xyzs: np.ndarray, tol: float = 0.1, batch_rays: int = 100,
+                           max_rays: int = 2000, min_hits: int = 10, seed: int = 0, progress=None, profile: dict = None, workers: int = 1) -> dict:
+    """
+    calculate the mrt of the grid points with an adaptive number of rays, see iter_grid_mrt_adaptive.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with raytrace_mrt_engine.gen_tracer.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    tol: float, optional
+        the grid point stops when the standard error of its mrt is <= tol in degC. Default = 0.1.
+
+    batch_rays: int, optional
+        number of rays cast per grid point in each round. Default = 100.
+
+    max_rays: int, optional
+        maximum number of rays per grid point. Default = 2000.
+
+    min_hits: int, optional
+        minimum number of rays that hit a voxel before the standard error is trusted. Default = 10.
+
+    seed: int, optional
+        seed of the random rotations. Default = 0.
+
+    progress: Callable[[str], None], optional
+        function called with a progress message after each round.
+
+    profile: dict, optional
+        profile from raytrace_mrt_engine.gen_profile, see iter_grid_mrt_adaptive. With workers > 1 the rounds of all the processes are recorded as one "project" stage.
+
+    workers: int, optional
+        number of processes, the grid points are sharded across a process pool if > 1, see raytrace_mrt_engine.parallel.calc_grid_mrt_adaptive_parallel. Default = 1.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "mrt": np.ndarray[shape(ngrids)] mrt of each grid point, -999 if the grid point do not see any temperatures.
+            - "nhits": np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+            - "nrays": np.ndarray[shape(ngrids)] number of rays cast from each grid point.
+            - "stderr": np.ndarray[shape(ngrids)] standard error of the mrt, -999 if it cannot be estimated.
+            - "trace": dict, the rays of all the rounds with the keys of raytrace_mrt_engine.trace_grid.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    ngrids = len(grid_xyzs)
+    if workers > 1 and ngrids > 1:
+        from .parallel import calc_grid_mrt_adaptive_parallel
+        with profile_stage(profile, 'project', grids=ngrids) as counters:
+            res = calc_grid_mrt_adaptive_parallel(tracer, vx_temps, grid_xyzs, workers, progress=progress, tol=tol, batch_rays=batch_rays,
+                                                  max_rays=max_rays, min_hits=min_hits, seed=seed)
+            counters['rays'] = int(res['nrays'].sum())
+        return res
+    res = {'mrt': np.full(ngrids, -999.0), 'nhits': np.zeros(ngrids, dtype=np.int64), 'nrays': np.zeros(ngrids, dtype=np.int64),
+           'stderr': np.full(ngrids, -999.0)}
+    traces = []
+    for rnd in iter_grid_mrt_adaptive(tracer, vx_temps, grid_xyzs, tol=tol, batch_rays=batch_rays, max_rays=max_rays,
+                                      min_hits=min_hits, seed=seed, profile=profile):
+        for key in ['mrt', 'nhits', 'nrays', 'stderr']:
+            res[key][rnd['grid_ids']] = rnd[key]
+        traces.append(rnd['trace'])
+        if progress is not None:
+            progress(rnd['msg'])
+    res['trace'] = {key: np.concatenate([trace[key] for trace in traces]) for key in ['origs', 'dirxs', 'grid_ids', 'hit_idxs', 'hit_dists']}
+    return res
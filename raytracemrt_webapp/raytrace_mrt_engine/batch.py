@@ -0,0 +1,286 @@
+"""
+headless batch runner of many mrt jobs listed in a manifest, e.g.
+
+    python -m raytrace_mrt_engine batch jobs.json --procs 4 --report batch.json
+"""
+import os
+import csv
+import json
+import math
+from time import perf_counter, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+
+from .cache import DEFAULT_MAX_BYTES, gen_cache
+from .plyio import ply_vertex_count
+from .pipeline import INTX_METHODS, calc_mrt_arr, read_grid_csv, write_mrt_csv, write_mrt_npz
+
+# the columns of a job in the manifest, the optional ones get the default
+JOB_FIELDS = ['ply', 'grid', 'vdim', 'nrays', 'out']
+JOB_DEFAULTS = {'name': None, 'method': 'slab', 'tol': 0.0, 'max_rays': 2000, 'chunk_size': None, 'npz': False}
+# upper bound of the cached bytes per point of a ply, the float64 xyzs and temps of the cloud,
+# the point to voxel ids and at most one voxel per point with its ijks, midpts, counts, temp_sums and temps
+CACHE_BYTES_PER_PT = 32 + 8 + 72
+
+def read_manifest(path: str) -> list[dict]:
+    """
+    read the jobs of a manifest. A json manifest is a list of jobs or a dictionary with a "jobs" list, a csv manifest has a header row and a job per row.
+    Each job has a ply, grid, vdim, nrays and out, and optionally a name, method, tol, max_rays and chunk_size, see raytrace_mrt_engine.calc_mrt_arr,
+    and npz to also write the results with raytrace_mrt_engine.write_mrt_npz.
+    Relative paths are relative to the directory of the manifest.
+
+    Parameters
+    ----------
+    path: str
+        path of the .json or .csv manifest.
+
+    Returns
+    -------
+    list[dict]
+        the jobs with the values converted and the defaults filled in, the name defaults to job{index}.
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = [row for row in csv.DictReader(f) if any(row.values())]
+    else:
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows['jobs']
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for cnt, row in enumerate(rows):
+        # empty csv cells are left to the defaults
+        row = {key.strip(): val for key, val in row.items() if key is not None and val not in (None, '')}
+        missing = [field for field in JOB_FIELDS if field not in row]
+        if missing:
+            raise ValueError(f"job {cnt} of {path} is missing {missing}")
+        job = dict(JOB_DEFAULTS)
+        job.update(row)
+        if job['name'] is None:
+            job['name'] = f"job{cnt}"
+        for key in ['ply', 'grid', 'out']:
+            job[key] = os.path.join(base_dir, os.path.expanduser(str(job[key])))
+        job['vdim'] = float(job['vdim'])
+        job['nrays'] = int(job['nrays'])
+        job['tol'] = float(job['tol'])
+        job['max_rays'] = int(job['max_rays'])
+        if job['chunk_size'] is not None:
+            job['chunk_size'] = int(job['chunk_size'])
+        job['npz'] = str(job['npz']).strip().lower() in ('1', 'true', 'yes')
+        if job['method'] not in INTX_METHODS:
+            raise ValueError(f"job {job['name']} of {path} has an unknown method {job['method']}, choose from {INTX_METHODS}")
+        job['index'] = cnt
+        jobs.append(job)
+    return jobs
+
+def plan_tasks(jobs: list[dict], max_procs: int) -> list[list[dict]]:
+    """
+    group the jobs into tasks run one after another in a process. The jobs of the same ply are kept in the same task so the points and voxels are parsed once
+    and reused from the cache, the jobs of a ply are split into more tasks only to keep the processes busy when there are fewer plys than processes.
+
+    Parameters
+    ----------
+    jobs: list[dict]
+        the jobs from read_manifest.
+
+    max_procs: int
+        number of processes the tasks are run with.
+
+    Returns
+    -------
+    list[list[dict]]
+        the tasks, the biggest first so the long tasks do not start last.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(os.path.realpath(job['ply']), []).append(job)
+    tasks = []
+    for group in groups.values():
+        nsplit = min(len(group), max(1, round(max_procs * len(group)/len(jobs))))
+        size = math.ceil(len(group)/nsplit)
+        tasks.extend(group[start:start + size] for start in range(0, len(group), size))
+    # the work of a job is about its number of rays, the ply is parsed once per task. Missing files are left for run_job to report
+    def file_size(path: str) -> int:
+        return os.path.getsize(path) if os.path.isfile(path) else 0
+    def task_work(task: list[dict]) -> float:
+        return file_size(task[0]['ply']) + sum(job['nrays'] * file_size(job['grid']) for job in task)
+    return sorted(tasks, key=task_work, reverse=True)
+
+def run_job(job: dict, cache: dict = None) -> dict:
+    """
+    calculate the mrt of a job and write it to the csv of the job
+
+    Parameters
+    ----------
+    job: dict
+        a job from read_manifest.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache shared by the jobs of a task.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "name", "index", "ply", "out": the job.
+            - "status": str, 'ok' or 'error'.
+            - "error": str, the error message if the job failed.
+            - "ngrids": int, number of grid points.
+            - "nrays": int, number of rays cast.
+            - "duration_s": float, wall time of the job in seconds.
+            - "cache": dict, the hits of the cache by kind, e.g. {"cloud": 1, "voxels": 1} when the ply was already parsed by a previous job.
+            - "cache_skipped": dict, the values of the job by kind that were too large for the memory budget of the cache and are not reused.
+            - "pid": int, the process the job ran in.
+    """
+    rec = {'name': job['name'], 'index': job['index'], 'ply': job['ply'], 'out': job['out'], 'status': 'ok', 'error': None,
+           'ngrids': 0, 'nrays': 0, 'duration_s': 0.0, 'cache': {}, 'cache_skipped': {}, 'pid': os.getpid()}
+    t1 = perf_counter()
+    try:
+        grid_xyzs = read_grid_csv(job['grid'])
+        res = calc_mrt_arr(job['ply'], grid_xyzs, job['vdim'], job['nrays'], intx_method=job['method'], cache=cache,
+                           tol=job['tol'], max_rays=job['max_rays'], chunk_size=job['chunk_size'])
+        out_dir = os.path.dirname(job['out'])
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if job['tol'] > 0:
+            write_mrt_csv(job['out'], res['grid_xyzs'], res['mrt'], nrays=res['nrays'], stderrs=res['stderr'])
+        else:
+            write_mrt_csv(job['out'], res['grid_xyzs'], res['mrt'])
+        if job['npz']:
+            write_mrt_npz(os.path.splitext(job['out'])[0] + '.npz', res['grid_xyzs'], res['mrt'], nhits=res['nhits'], nrays=res['nrays'],
+                          stderrs=res.get('stderr'))
+        rec['ngrids'] = len(grid_xyzs)
+        rec['nrays'] = int(res['nrays'].sum())
+        if res['cache'] is not None:
+            rec['cache'] = res['cache']['hits']
+            rec['cache_skipped'] = res['cache']['skipped']
+    except Exception as e:
+        rec['status'] = 'error'
+        rec['error'] = f"{type(e).__name__}: {e}"
+    rec['duration_s'] = perf_counter() - t1
+    return rec
+
+def task_cache_bytes(task: list[dict]) -> int:
+    """
+    the memory budget of the cache of a task, large enough for the parsed points and voxels of the ply of the task on top of the default budget for the traces.
+
+    Parameters
+    ----------
+    task: list[dict]
+        the jobs of the task from plan_tasks, all with the same ply.
+
+    Returns
+    -------
+    int
+        the memory budget in bytes.
+    """
+    try:
+        npts = ply_vertex_count(task[0]['ply'])
+    except Exception:
+        # the ply is missing or broken, run_job reports it
+        npts = 0
+    return DEFAULT_MAX_BYTES + CACHE_BYTES_PER_PT * npts
+
+def _run_task(task: list[dict], cache_bytes: int = None) -> list[dict]:
+    """
+    run the jobs of a task one after another with a cache shared by the jobs, see run_job. The memory budget of the cache is task_cache_bytes if cache_bytes is None.
+    """
+    cache = gen_cache(task_cache_bytes(task) if cache_bytes is None else cache_bytes)
+    return [run_job(job, cache=cache) for job in task]
+
+def run_batch(jobs: list[dict], max_procs: int = None, progress: Callable[[str], None] = None, cache_bytes: int = None) -> dict:
+    """
+    run the jobs on a pool of processes, see plan_tasks for how the jobs are scheduled. A failed job is recorded and does not stop the others.
+
+    Parameters
+    ----------
+    jobs: list[dict]
+        the jobs from read_manifest.
+
+    max_procs: int, optional
+        maximum number of jobs run at the same time, 1 runs the jobs in this process. Default = None, the number of cpus.
+
+    progress: Callable[[str], None], optional
+        function called with a message when a job is finished.
+
+    cache_bytes: int, optional
+        memory budget of the cache of each task in bytes. Default = None, sized from the ply of the task with task_cache_bytes.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "jobs": list[dict], the record of each job from run_job in the order of the manifest.
+            - "max_procs": int, number of processes.
+            - "ntasks": int, number of tasks the jobs were grouped into.
+            - "wall_s": float, wall time of the batch in seconds.
+            - "nok", "nfailed": int, number of finished and failed jobs.
+            - "jobs_per_hour": float, finished jobs per hour of wall time.
+            - "started": float, unix time the batch started.
+    """
+    if max_procs is None:
+        max_procs = os.cpu_count() or 1
+    max_procs = max(1, min(int(max_procs), len(jobs)))
+    tasks = plan_tasks(jobs, max_procs) if len(jobs) != 0 else []
+    started = time()
+    t1 = perf_counter()
+    recs = []
+    def task_done(task_recs: list[dict]):
+        for rec in task_recs:
+            recs.append(rec)
+            if progress is not None:
+                msg = 'done' if rec['status'] == 'ok' else f"failed, {rec['error']}"
+                if rec['cache_skipped']:
+                    msg += f", too large to cache {rec['cache_skipped']}"
+                progress(f"Job {len(recs)}/{len(jobs)} {rec['name']} {msg} in {rec['duration_s']:.1f} s")
+    if max_procs == 1:
+        for task in tasks:
+            task_done(_run_task(task, cache_bytes))
+    else:
+        with ProcessPoolExecutor(max_workers=max_procs) as executor:
+            futures = [executor.submit(_run_task, task, cache_bytes) for task in tasks]
+            for future in as_completed(futures):
+                task_done(future.result())
+    wall_s = perf_counter() - t1
+    recs.sort(key=lambda rec: rec['index'])
+    nok = sum(rec['status'] == 'ok' for rec in recs)
+    return {'jobs': recs, 'max_procs': max_procs, 'ntasks': len(tasks), 'wall_s': wall_s, 'nok': nok, 'nfailed': len(recs) - nok,
+            'jobs_per_hour': nok/wall_s*3600 if wall_s > 0 else 0.0, 'started': started}
+
+def format_batch(batch_res: dict) -> str:
+    """
+    format the result of run_batch as a table, one row per job and a summary line.
+
+    Parameters
+    ----------
+    batch_res: dict
+        the result of run_batch.
+
+    Returns
+    -------
+    str
+        the table.
+    """
+    lines = ['job\tstatus\tngrids\tnrays\tduration_s\tout']
+    for rec in batch_res['jobs']:
+        status = rec['status'] if rec['status'] == 'ok' else f"{rec['status']} ({rec['error']})"
+        lines.append(f"{rec['name']}\t{status}\t{rec['ngrids']}\t{rec['nrays']}\t{rec['duration_s']:.2f}\t{rec['out']}")
+    lines.append(f"{batch_res['nok']} jobs done, {batch_res['nfailed']} failed in {batch_res['wall_s']:.1f} s with {batch_res['max_procs']} processes, "
+                 f"{batch_res['jobs_per_hour']:.1f} jobs/hour")
+    return '\n'.join(lines)
+
+def write_batch_json(path: str, batch_res: dict):
+    """
+    write the result of run_batch to a json file.
+
+    Parameters
+    ----------
+    path: str
+        path of the json file.
+
+    batch_res: dict
+        the result of run_batch.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(batch_res, f, indent=2)
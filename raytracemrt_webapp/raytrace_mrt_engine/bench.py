@@ -0,0 +1,298 @@
+"""
+headless benchmark of the stages of the pipeline on synthetic scenes of increasing size and on examples/simple_example, e.g.
+
+    python -m raytrace_mrt_engine bench --scales xs s --out bench.json
+"""
+import os
+import json
+import platform
+import tempfile
+from time import strftime
+from typing import Callable
+
+import numpy as np
+
+from .plyio import read_ply_vertex, ply_vertex_columns
+from .voxel import voxelize
+from .rays import gen_rays_arr, separate_rays_arr
+from .instrument import gen_profile, profile_stage
+from .pipeline import gen_tracer, trace_rays, progress_chunk, calc_grid_mrt, read_grid_csv, write_mrt_csv
+
+# the synthetic scenes, from 10k to 10M points, 1 to 10k grid points and 100 to 10k rays per grid point
+SCALES = {'xs': {'npts': 10000, 'ngrids': 1, 'nrays': 100, 'vdim': 0.3},
+          's': {'npts': 100000, 'ngrids': 100, 'nrays': 1000, 'vdim': 0.2},
+          'm': {'npts': 1000000, 'ngrids': 1000, 'nrays': 1000, 'vdim': 0.1},
+          'rays': {'npts': 100000, 'ngrids': 10, 'nrays': 10000, 'vdim': 0.2},
+          'l': {'npts': 10000000, 'ngrids': 10000, 'nrays': 100, 'vdim': 0.1}}
+DEFAULT_SCALES = ['xs', 's']
+# the fixed reference case
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'examples', 'simple_example')
+REFERENCE_PLY = 'SoLo_Therm_08-08-2025_13-51-50_LWpointCloud_13k_projected.ply'
+REFERENCE_GRID = 'mrt_grid.csv'
+# the synthetic room in meters
+ROOM_DIMS = (6.0, 4.0, 3.0)
+STAGES = ['ply_parse', 'voxelize', 'ray_gen', 'intersect', 'aggregate', 'serialize']
+
+def gen_synthetic_scene(npts: int, room_dims: tuple[float, float, float] = ROOM_DIMS, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    generate a point cloud of the surfaces of a box room with a surface temperature, the points are spread over the 6 faces by area.
+
+    Parameters
+    ----------
+    npts: int
+        number of points.
+
+    room_dims: tuple[float, float, float], optional
+        the x, y, z dimension of the room in meters. Default = ROOM_DIMS.
+
+    seed: int, optional
+        seed of the random points. Default = 0.
+
+    Returns
+    -------
+    xyzs : np.ndarray
+        np.ndarray[shape(npts, 3)] float32 the points.
+
+    temps : np.ndarray
+        np.ndarray[shape(npts)] float32 the temperature of each point, a warm ceiling, a cool floor and walls warming up with height.
+    """
+    rng = np.random.default_rng(seed)
+    dims = np.array(room_dims, dtype=np.float64)
+    # faces as (fixed axis, fixed value), -x, +x, -y, +y, floor, ceiling
+    faces = [(0, 0.0), (0, dims[0]), (1, 0.0), (1, dims[1]), (2, 0.0), (2, dims[2])]
+    areas = np.array([np.prod(np.delete(dims, axis)) for axis, _ in faces])
+    face_ids = rng.choice(len(faces), size=npts, p=areas/areas.sum())
+    xyzs = rng.random((npts, 3)) * dims
+    for fcnt, (axis, val) in enumerate(faces):
+        xyzs[face_ids == fcnt, axis] = val
+    temps = 24.0 + 1.5 * xyzs[:, 2]/dims[2] + rng.normal(0, 0.3, npts)
+    temps[face_ids == 5] += 2.0
+    temps[face_ids == 4] -= 1.0
+    return xyzs.astype(np.float32), temps.astype(np.float32)
+
+def gen_synthetic_grid(ngrids: int, room_dims: tuple[float, float, float] = ROOM_DIMS, height: float = 1.0) -> np.ndarray:
+    """
+    generate a regular grid of points at a height inside the synthetic room.
+
+    Parameters
+    ----------
+    ngrids: int
+        number of grid points, the grid is the closest ncols x nrows with ncols*nrows >= ngrids, cut to ngrids.
+
+    room_dims: tuple[float, float, float], optional
+        the x, y, z dimension of the room in meters. Default = ROOM_DIMS.
+
+    height: float, optional
+        height of the grid in meters. Default = 1.0.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+    """
+    ncols = max(1, int(np.ceil(np.sqrt(ngrids * room_dims[0]/room_dims[1]))))
+    nrows = max(1, int(np.ceil(ngrids/ncols)))
+    xs = (np.arange(ncols) + 0.5) * room_dims[0]/ncols
+    ys = (np.arange(nrows) + 0.5) * room_dims[1]/nrows
+    xx, yy = np.meshgrid(xs, ys)
+    grid_xyzs = np.stack([xx.ravel(), yy.ravel(), np.full(xx.size, height)], axis=1)
+    return grid_xyzs[:ngrids]
+
+def gen_ply_bytes(xyzs: np.ndarray, temps: np.ndarray) -> bytes:
+    """
+    write the points to a binary little endian ply with the x, y, z and temperature properties.
+
+    Parameters
+    ----------
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, 3)] the points.
+
+    temps: np.ndarray
+        np.ndarray[shape(npts)] the temperature of each point.
+
+    Returns
+    -------
+    bytes
+        the content of the ply file.
+    """
+    npts = len(xyzs)
+    vertex = np.empty(npts, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('temperature', '<f4')])
+    vertex['x'], vertex['y'], vertex['z'] = xyzs[:, 0], xyzs[:, 1], xyzs[:, 2]
+    vertex['temperature'] = temps
+    header = (f"ply\nformat binary_little_endian 1.0\nelement vertex {npts}\nproperty float x\nproperty float y\n"
+              f"property float z\nproperty float temperature\nend_header\n")
+    return header.encode('ascii') + vertex.tobytes()
+
+def _parse(ply_bytes: bytes) -> dict:
+    plydata = ply_vertex_columns(read_ply_vertex(ply_bytes))
+    return {'xyzs': np.asarray(plydata['xyzs'], dtype=np.float64), 'temps': np.asarray(plydata['temps'], dtype=np.float64)}
+
+def _intersect(tracer: dict, rays: dict) -> dict:
+    hit_idxs = []
+    hit_dists = []
+    nparallel = max(1, int(np.ceil(len(rays['origs'])/progress_chunk(tracer))))
+    for rays1 in separate_rays_arr(rays, nparallel):
+        idxs, dists = trace_rays(tracer, rays1['origs'], rays1['dirxs'])
+        hit_idxs.append(idxs)
+        hit_dists.append(dists)
+    return {'grid_ids': rays['grid_ids'], 'hit_idxs': np.concatenate(hit_idxs), 'hit_dists': np.concatenate(hit_dists)}
+
+def run_case(name: str, ply_bytes: bytes, grid_xyzs: np.ndarray, vdim: float, nrays: int, intx_method: str = 'slab',
+             progress: Callable[[str], None] = None) -> dict:
+    """
+    run the stages of the pipeline on a scene and measure each stage.
+
+    Parameters
+    ----------
+    name: str
+        name of the case.
+
+    ply_bytes: bytes
+        the content of the ply file.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    nrays: int
+        number of rays per grid point.
+
+    intx_method: str, optional
+        'slab', 'dda' or 'bvh', see raytrace_mrt_engine.gen_tracer. Default = 'slab'.
+
+    progress: Callable[[str], None], optional
+        function called with a message at the start of each stage.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "name", "vdim", "intx_method": the parameters of the case.
+            - "npts", "nvoxels", "ngrids", "nrays": the size of the case, nrays is the total number of rays.
+            - "stages": dict, the record of each of the STAGES from raytrace_mrt_engine.profile_stage.
+            - "total_s": float, the sum of the time of the stages.
+            - "rays_per_s": float, the throughput of the intersect stage.
+    """
+    if progress is None:
+        progress = lambda msg: None
+    profile = gen_profile(trace_memory=True)
+    progress(f"[{name}] ply_parse")
+    with profile_stage(profile, 'ply_parse', bytes=len(ply_bytes)) as counters:
+        plydata = _parse(ply_bytes)
+        counters['pts'] = len(plydata['xyzs'])
+    progress(f"[{name}] voxelize")
+    with profile_stage(profile, 'voxelize', pts=len(plydata['xyzs'])) as counters:
+        voxels = voxelize(plydata['xyzs'], plydata['temps'], vdim)
+        counters['voxels'] = len(voxels['ijks'])
+    progress(f"[{name}] ray_gen")
+    with profile_stage(profile, 'ray_gen') as counters:
+        rays = gen_rays_arr(grid_xyzs, nrays)
+        counters['rays'] = len(rays['origs'])
+    nrays_all = len(rays['origs'])
+    progress(f"[{name}] intersect {nrays_all} rays onto {len(voxels['ijks'])} voxels")
+    tracer = gen_tracer(voxels, intx_method=intx_method)
+    with profile_stage(profile, 'intersect', rays=nrays_all) as counters:
+        trace_res = _intersect(tracer, rays)
+        if intx_method == 'slab':
+            counters['ray_voxel_tests'] = nrays_all * len(voxels['ijks'])
+    progress(f"[{name}] aggregate")
+    with profile_stage(profile, 'aggregate', rays=nrays_all, grids=len(grid_xyzs)):
+        mrts, _ = calc_grid_mrt(trace_res, voxels['temps'], len(grid_xyzs))
+    progress(f"[{name}] serialize")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with profile_stage(profile, 'serialize', grids=len(grid_xyzs)):
+            write_mrt_csv(os.path.join(tmp_dir, 'mrt.csv'), grid_xyzs, mrts)
+    stages = profile['stages']
+    return {'name': name, 'vdim': vdim, 'intx_method': intx_method, 'npts': len(plydata['xyzs']), 'nvoxels': len(voxels['ijks']),
+            'ngrids': len(grid_xyzs), 'nrays': nrays_all, 'stages': stages,
+            'total_s': sum(stage['time_s'] for stage in stages.values()),
+            'rays_per_s': nrays_all/max(stages['intersect']['time_s'], 1e-9)}
+
+def run_bench(scales: list[str] = None, intx_method: str = 'slab', reference: bool = True, seed: int = 0,
+              progress: Callable[[str], None] = None) -> dict:
+    """
+    run the benchmark on the reference case and the synthetic scenes.
+
+    Parameters
+    ----------
+    scales: list[str], optional
+        names of the SCALES to run. Default = DEFAULT_SCALES.
+
+    intx_method: str, optional
+        'slab', 'dda' or 'bvh', see raytrace_mrt_engine.gen_tracer. Default = 'slab'.
+
+    reference: bool, optional
+        run the examples/simple_example case if it is found. Default = True.
+
+    seed: int, optional
+        seed of the synthetic scenes. Default = 0.
+
+    progress: Callable[[str], None], optional
+        function called with a message at the start of each stage.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "created": str, the local time of the run.
+            - "env": dict, the python, numpy and platform versions.
+            - "cases": list[dict], the result of run_case for each case.
+    """
+    if scales is None:
+        scales = DEFAULT_SCALES
+    cases = []
+    ref_ply = os.path.join(REFERENCE_DIR, REFERENCE_PLY)
+    if reference and os.path.isfile(ref_ply):
+        with open(ref_ply, 'rb') as f:
+            ply_bytes = f.read()
+        grid_xyzs = read_grid_csv(os.path.join(REFERENCE_DIR, REFERENCE_GRID))
+        cases.append(run_case('simple_example', ply_bytes, grid_xyzs, 0.1, 100, intx_method=intx_method, progress=progress))
+    for scale in scales:
+        params = SCALES[scale]
+        xyzs, temps = gen_synthetic_scene(params['npts'], seed=seed)
+        ply_bytes = gen_ply_bytes(xyzs, temps)
+        del xyzs, temps
+        grid_xyzs = gen_synthetic_grid(params['ngrids'])
+        cases.append(run_case(scale, ply_bytes, grid_xyzs, params['vdim'], params['nrays'], intx_method=intx_method, progress=progress))
+    env = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+    return {'created': strftime('%Y-%m-%dT%H:%M:%S'), 'env': env, 'cases': cases}
+
+def format_bench(bench_res: dict) -> str:
+    """
+    format the result of run_bench as a table, one row per case with the time of each stage.
+
+    Parameters
+    ----------
+    bench_res: dict
+        the result of run_bench.
+
+    Returns
+    -------
+    str
+        the table.
+    """
+    header = ['case', 'npts', 'nvoxels', 'nrays'] + STAGES + ['total_s', 'Mrays/s']
+    lines = ['\t'.join(header)]
+    for case in bench_res['cases']:
+        row = [case['name'], str(case['npts']), str(case['nvoxels']), str(case['nrays'])]
+        row += [f"{case['stages'][stage]['time_s']:.3f}" for stage in STAGES]
+        row += [f"{case['total_s']:.3f}", f"{case['rays_per_s']/1e6:.3f}"]
+        lines.append('\t'.join(row))
+    return '\n'.join(lines)
+
+def write_bench_json(path: str, bench_res: dict):
+    """
+    write the result of run_bench to a json file.
+
+    Parameters
+    ----------
+    path: str
+        path of the json file.
+
+    bench_res: dict
+        the result of run_bench.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(bench_res, f, indent=2)
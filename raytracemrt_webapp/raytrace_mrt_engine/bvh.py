@@ -0,0 +1,374 @@
+import os
+import hashlib
+
+import numpy as np
+
+from .intersect import midpts2bounds, slab_pairs
+
+BVH_KEYS = ['node_mins', 'node_maxs', 'child_offsets', 'leaf_starts', 'leaf_counts', 'prim_order', 'prim_mins', 'prim_maxs']
+
+def content_key(ply_src: bytes | str) -> str:
+    """
+    generate a key identifying the content of a ply file.
+
+    Parameters
+    ----------
+    ply_src: bytes | str
+        content of the ply file as a bytes-like object or the path of the ply file.
+
+    Returns
+    -------
+    str
+        sha256 hex digest of the content.
+    """
+    if isinstance(ply_src, (str, os.PathLike)):
+        hasher = hashlib.sha256()
+        with open(ply_src, 'rb') as f:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                hasher.update(chunk)
+    else:
+        hasher = hashlib.sha256(memoryview(ply_src))
+    return hasher.hexdigest()
+
+def scene_key(ply_src: bytes | str, vdim: float, ckey: str = None) -> str:
+    """
+    generate a key identifying a voxel model, the same ply content voxelized with the same vdim gives the same key.
+
+    Parameters
+    ----------
+    ply_src: bytes | str
+        content of the ply file as a bytes-like object or the path of the ply file.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    ckey: str, optional
+        the content_key of the ply if it is already computed, the ply is not read again.
+
+    Returns
+    -------
+    str
+        hex digest identifying the voxel model.
+    """
+    if ckey is None:
+        ckey = content_key(ply_src)
+    return hashlib.sha256(f"{ckey}:{float(vdim)!r}".encode('utf-8')).hexdigest()
+
+def gen_bvh(midpts: np.ndarray, vx_dim: list[float], leaf_size: int = 8) -> dict:
+    """
+    build a bounding volume hierarchy over the voxels, splitting the voxels at the median of the longest axis of each node.
+
+    Parameters
+    ----------
+    midpts: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the midpts of the voxels.
+
+    vx_dim: list[float]
+        list[shape(3)] the x, y, z dimension of a voxel.
+
+    leaf_size: int, optional
+        the maximum number of voxels in a leaf node. Default = 8.
+
+    Returns
+    -------
+    dict
+        A dictionary of flat arrays, node 0 is the root:
+            - "node_mins": np.ndarray[shape(nnodes, 3)] the min corner of the nodes.
+            - "node_maxs": np.ndarray[shape(nnodes, 3)] the max corner of the nodes.
+            - "child_offsets": np.ndarray[shape(nnodes, 2)] index of the left and right child nodes, -1 for leaf nodes.
+            - "leaf_starts": np.ndarray[shape(nnodes)] start of the voxels of a leaf node in prim_order.
+            - "leaf_counts": np.ndarray[shape(nnodes)] number of voxels of a leaf node, 0 for internal nodes.
+            - "prim_order": np.ndarray[shape(nvoxels)] voxel index of the voxels in the order of the leaves.
+            - "prim_mins": np.ndarray[shape(nvoxels, 3)] the min corner of the voxels in the order of the leaves.
+            - "prim_maxs": np.ndarray[shape(nvoxels, 3)] the max corner of the voxels in the order of the leaves.
+    """
+    midpts = np.asarray(midpts, dtype=np.float64)
+    vx_mins, vx_maxs = midpts2bounds(midpts, vx_dim)
+    nvox = len(midpts)
+    order = np.arange(nvox)
+    node_mins = []
+    node_maxs = []
+    child_offsets = []
+    leaf_starts = []
+    leaf_counts = []
+
+    def add_node() -> int:
+        node_mins.append(None)
+        node_maxs.append(None)
+        child_offsets.append([-1, -1])
+        leaf_starts.append(0)
+        leaf_counts.append(0)
+        return len(node_mins) - 1
+
+    stack = [(0, nvox, add_node())]
+    while stack:
+        start, end, node_id = stack.pop()
+        idxs = order[start:end]
+        node_mins[node_id] = vx_mins[idxs].min(axis=0)
+        node_maxs[node_id] = vx_maxs[idxs].max(axis=0)
+        if end - start <= leaf_size:
+            leaf_starts[node_id] = start
+            leaf_counts[node_id] = end - start
+            continue
+        centres = midpts[idxs]
+        axis = int(np.argmax(centres.max(axis=0) - centres.min(axis=0)))
+        mid = (start + end) // 2
+        part = np.argpartition(centres[:, axis], mid - start)
+        order[start:end] = idxs[part]
+        left = add_node()
+        right = add_node()
+        child_offsets[node_id] = [left, right]
+        stack.append((mid, end, right))
+        stack.append((start, mid, left))
+
+    bvh = {'node_mins': np.array(node_mins), 'node_maxs': np.array(node_maxs),
+           'child_offsets': np.array(child_offsets, dtype=np.int64),
+           'leaf_starts': np.array(leaf_starts, dtype=np.int64), 'leaf_counts': np.array(leaf_counts, dtype=np.int64),
+           'prim_order': order, 'prim_mins': vx_mins[order], 'prim_maxs': vx_maxs[order]}
+    return bvh
+
+def save_bvh(bvh: dict, path: str):
+    """
+    save the bvh to a .npz file
+
+    Parameters
+    ----------
+    bvh: dict
+        the bvh generated from gen_bvh.
+
+    path: str
+        the path of the .npz file.
+    """
+    np.savez(path, **{key: bvh[key] for key in BVH_KEYS})
+
+def load_bvh(path: str) -> dict:
+    """
+    load the bvh saved with save_bvh
+
+    Parameters
+    ----------
+    path: str
+        the path of the .npz file.
+
+    Returns
+    -------
+    dict
+        the bvh, same as the one generated from gen_bvh.
+    """
+    with np.load(path) as npz:
+        bvh = {key: npz[key] for key in BVH_KEYS}
+    return bvh
+
+def _bvh_depth(bvh: dict) -> int:
+    """
+    the depth of the deepest leaf of the bvh, the root is at depth 0.
+
+    Parameters
+    ----------
+    bvh: dict
+        the bvh generated from gen_bvh.
+
+    Returns
+    -------
+    int
+        the depth of the bvh.
+    """
+    child_offsets = bvh['child_offsets']
+    nodes = np.zeros(1, dtype=np.int64)
+    depth = 0
+    while True:
+        children = child_offsets[nodes].reshape(-1)
+        nodes = children[children != -1]
+        if len(nodes) == 0:
+            return depth
+        depth += 1
+
+def bvh_intersect(bvh: dict, origs: np.ndarray, dirxs: np.ndarray, max_rays: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect rays with the voxels of the bvh and return the nearest hit of each ray.
+    The rays are traced in batches, each ray walks the bvh front to back with its own stack, the nearer child is visited first
+    so the nearest hit is found early and the nodes entered further than it are skipped.
+
+    Parameters
+    ----------
+    bvh: dict
+        the bvh generated from gen_bvh.
+
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    max_rays: int, optional
+        the number of rays traced together in a batch. Default = 4096.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the nearest voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the nearest hit along the ray direction, np.inf if the ray did not hit any voxels.
+    """
+    origs = np.asarray(origs, dtype=np.float64)
+    dirxs = np.asarray(dirxs, dtype=np.float64)
+    nrays = len(origs)
+    hit_idxs = np.full(nrays, -1, dtype=np.int64)
+    hit_dists = np.full(nrays, np.inf)
+    if len(bvh['prim_order']) == 0:
+        return hit_idxs, hit_dists
+    # a ray pops one node and pushes at most 2 children, so the stack never holds more than depth + 1 nodes
+    stack_size = _bvh_depth(bvh) + 1
+    for start in range(0, nrays, max_rays):
+        end = min(start + max_rays, nrays)
+        idxs, dists = _bvh_intersect_batch(bvh, origs[start:end], dirxs[start:end], stack_size)
+        hit_idxs[start:end] = idxs
+        hit_dists[start:end] = dists
+    return hit_idxs, hit_dists
+
+def _bvh_intersect_batch(bvh: dict, origs: np.ndarray, dirxs: np.ndarray, stack_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect a batch of rays with the voxels of the bvh. All the rays pop the top node of their stack together, a leaf updates the nearest hit of the ray
+    and an inner node pushes the children the ray enters before its nearest hit, the far child first so that the near child is popped next.
+
+    Parameters
+    ----------
+    bvh: dict
+        the bvh generated from gen_bvh.
+
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    stack_size: int
+        the maximum number of nodes on the stack of a ray, see _bvh_depth.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the nearest voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the nearest hit, np.inf if the ray did not hit any voxels.
+    """
+    nrays = len(origs)
+    best_prims = np.full(nrays, np.iinfo(np.int64).max, dtype=np.int64)
+    best_dists = np.full(nrays, np.inf)
+    child_offsets = bvh['child_offsets']
+    leaf_counts = bvh['leaf_counts']
+    node_mins = bvh['node_mins']
+    node_maxs = bvh['node_maxs']
+    stack_nodes = np.empty((nrays, stack_size), dtype=np.int64)
+    stack_tnears = np.empty((nrays, stack_size))
+    stack_lens = np.zeros(nrays, dtype=np.int64)
+    # push the root for the rays that hit it
+    is_hit, tnear, _ = slab_pairs(origs, dirxs, node_mins[[0]], node_maxs[[0]])
+    stack_nodes[is_hit, 0] = 0
+    stack_tnears[is_hit, 0] = np.maximum(tnear[is_hit], 0)
+    stack_lens[is_hit] = 1
+    active = np.flatnonzero(stack_lens)
+    while len(active) != 0:
+        #------------------------------------------------------------------
+        # region: pop the top node of each ray
+        stack_lens[active] -= 1
+        tops = stack_lens[active]
+        pop_nodes = stack_nodes[active, tops]
+        # nearest hit termination, nothing in a node entered after the nearest hit can be nearer
+        is_near = stack_tnears[active, tops] <= best_dists[active]
+        pair_rays = active[is_near]
+        pair_nodes = pop_nodes[is_near]
+        is_leaf = leaf_counts[pair_nodes] != 0
+        # endregion: pop the top node of each ray
+        #------------------------------------------------------------------
+        # region: test the voxels in the leaves
+        leaf_rays = pair_rays[is_leaf]
+        leaf_nodes = pair_nodes[is_leaf]
+        if len(leaf_rays) != 0:
+            counts = leaf_counts[leaf_nodes]
+            prim_rays = np.repeat(leaf_rays, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            prims = np.repeat(bvh['leaf_starts'][leaf_nodes], counts) + offsets
+            prim_hit, prim_tnear, prim_tfar = slab_pairs(origs[prim_rays], dirxs[prim_rays],
+                                                         bvh['prim_mins'][prims], bvh['prim_maxs'][prims])
+            # rays starting inside a voxel hit it where they exit
+            prim_dists = np.where(prim_tnear > 0, prim_tnear, prim_tfar)
+            prim_rays = prim_rays[prim_hit]
+            prim_dists = prim_dists[prim_hit]
+            prim_ids = bvh['prim_order'][prims[prim_hit]]
+            # the nearest hit of each ray, the lowest voxel index among equally near hits
+            sort_idx = np.lexsort((prim_ids, prim_dists, prim_rays))
+            prim_rays = prim_rays[sort_idx]
+            first_true = np.ones(len(prim_rays), dtype=bool)
+            first_true[1:] = prim_rays[1:] != prim_rays[:-1]
+            cand_rays = prim_rays[first_true]
+            cand_dists = prim_dists[sort_idx][first_true]
+            cand_ids = prim_ids[sort_idx][first_true]
+            closer = np.logical_or(cand_dists < best_dists[cand_rays],
+                                   np.logical_and(cand_dists == best_dists[cand_rays], cand_ids < best_prims[cand_rays]))
+            best_dists[cand_rays[closer]] = cand_dists[closer]
+            best_prims[cand_rays[closer]] = cand_ids[closer]
+        # endregion: test the voxels in the leaves
+        #------------------------------------------------------------------
+        # region: push the children, far first
+        is_inner = np.logical_not(is_leaf)
+        inner_rays = pair_rays[is_inner]
+        if len(inner_rays) != 0:
+            children = child_offsets[pair_nodes[is_inner]]
+            child_rays = np.repeat(inner_rays, 2)
+            child_nodes = children.reshape(-1)
+            is_hit, tnear, _ = slab_pairs(origs[child_rays], dirxs[child_rays], node_mins[child_nodes], node_maxs[child_nodes])
+            tnear = np.maximum(tnear, 0)
+            is_hit = np.logical_and(is_hit, tnear <= best_dists[child_rays]).reshape(-1, 2)
+            tnear = tnear.reshape(-1, 2)
+            # column 0 is the near child, column 1 the far child
+            swap = tnear[:, 1] < tnear[:, 0]
+            order = np.column_stack([swap, np.logical_not(swap)]).astype(np.int64)
+            rows = np.arange(len(inner_rays))[:, None]
+            children = children[rows, order]
+            tnear = tnear[rows, order]
+            is_hit = is_hit[rows, order]
+            for col in [1, 0]:
+                push = is_hit[:, col]
+                push_rays = inner_rays[push]
+                stack_nodes[push_rays, stack_lens[push_rays]] = children[push, col]
+                stack_tnears[push_rays, stack_lens[push_rays]] = tnear[push, col]
+                stack_lens[push_rays] += 1
+        # endregion: push the children, far first
+        active = active[stack_lens[active] != 0]
+
+    best_prims = np.where(np.isinf(best_dists), -1, best_prims)
+    return best_prims, best_dists
+
+def get_cached_bvh(midpts: np.ndarray, vx_dim: list[float], cache_dir: str, key: str) -> dict:
+    """
+    load the bvh of a voxel model from the cache directory, build and save it if it is not in the cache.
+
+    Parameters
+    ----------
+    midpts: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the midpts of the voxels.
+
+    vx_dim: list[float]
+        list[shape(3)] the x, y, z dimension of a voxel.
+
+    cache_dir: str
+        the directory to keep the bvh .npz files.
+
+    key: str
+        key identifying the voxel model, generated from scene_key.
+
+    Returns
+    -------
+    dict
+        the bvh, same as the one generated from gen_bvh.
+    """
+    path = os.path.join(cache_dir, f"{key}.npz")
+    if os.path.exists(path):
+        return load_bvh(path)
+    bvh = gen_bvh(midpts, vx_dim)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_bvh(bvh, path)
+    return bvh
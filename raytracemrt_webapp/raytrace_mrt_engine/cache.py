@@ -0,0 +1,136 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# default memory budget of a cache in bytes
+DEFAULT_MAX_BYTES = 268435456
+
+def value_nbytes(value) -> int:
+    """
+    estimate the memory used by a cached value from the size of its arrays
+
+    Parameters
+    ----------
+    value: np.ndarray | dict | list | tuple
+        the value, the arrays in nested dictionaries, lists and tuples are counted.
+
+    Returns
+    -------
+    int
+        number of bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(value_nbytes(val) for val in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(val) for val in value)
+    return 0
+
+def gen_cache(max_bytes: int = DEFAULT_MAX_BYTES) -> dict:
+    """
+    generate a content-addressed cache for the intermediate results of the pipeline, the least recently used entries are evicted when the memory budget is exceeded.
+    Entries are grouped by kind, e.g. 'cloud', 'voxels' and 'trace', and the hits, misses and values too large to cache are counted for each kind.
+
+    Parameters
+    ----------
+    max_bytes: int, optional
+        the memory budget in bytes. Default = DEFAULT_MAX_BYTES.
+
+    Returns
+    -------
+    dict
+        the cache, pass it to cache_get and cache_put.
+    """
+    return {'max_bytes': max_bytes, 'nbytes': 0, 'entries': OrderedDict(), 'hits': {}, 'misses': {}, 'skipped': {}}
+
+def cache_get(cache: dict, kind: str, key):
+    """
+    get a cached value and mark it as recently used
+
+    Parameters
+    ----------
+    cache: dict
+        the cache from gen_cache.
+
+    kind: str
+        the kind of the value.
+
+    key: hashable
+        the key of the value.
+
+    Returns
+    -------
+    object
+        the cached value, None if it is not cached.
+    """
+    entries = cache['entries']
+    entry = entries.get((kind, key))
+    if entry is None:
+        cache['misses'][kind] = cache['misses'].get(kind, 0) + 1
+        return None
+    entries.move_to_end((kind, key))
+    cache['hits'][kind] = cache['hits'].get(kind, 0) + 1
+    return entry[0]
+
+def cache_put(cache: dict, kind: str, key, value):
+    """
+    cache a value, values larger than the memory budget are not cached and counted as skipped
+
+    Parameters
+    ----------
+    cache: dict
+        the cache from gen_cache.
+
+    kind: str
+        the kind of the value.
+
+    key: hashable
+        the key of the value.
+
+    value: object
+        the value to cache, its size is estimated with value_nbytes.
+    """
+    size = value_nbytes(value)
+    if size > cache['max_bytes']:
+        cache['skipped'][kind] = cache['skipped'].get(kind, 0) + 1
+        return
+    entries = cache['entries']
+    old = entries.pop((kind, key), None)
+    if old is not None:
+        cache['nbytes'] -= old[1]
+    entries[(kind, key)] = (value, size)
+    cache['nbytes'] += size
+    while cache['nbytes'] > cache['max_bytes']:
+        _, (_, evicted_size) = entries.popitem(last=False)
+        cache['nbytes'] -= evicted_size
+
+def cache_stats(cache: dict, reset: bool = False) -> dict:
+    """
+    the hit and miss counts of the cache
+
+    Parameters
+    ----------
+    cache: dict
+        the cache from gen_cache.
+
+    reset: bool, optional
+        reset the counts after reading them, e.g. at the end of a run. Default = False.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "hits": dict, number of hits of each kind.
+            - "misses": dict, number of misses of each kind.
+            - "skipped": dict, number of values of each kind not cached because they are larger than the memory budget.
+            - "nentries": int, number of cached values.
+            - "nbytes": int, estimated memory used by the cached values.
+    """
+    stats = {'hits': dict(cache['hits']), 'misses': dict(cache['misses']), 'skipped': dict(cache['skipped']),
+             'nentries': len(cache['entries']), 'nbytes': cache['nbytes']}
+    if reset:
+        cache['hits'] = {}
+        cache['misses'] = {}
+        cache['skipped'] = {}
+    return stats
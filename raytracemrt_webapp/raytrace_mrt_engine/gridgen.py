@@ -0,0 +1,195 @@
+from typing import Callable
+
+import numpy as np
+
+from .pipeline import load_scene, gen_tracer, trace_grid, calc_grid_mrt
+
+def floor_extent(voxels: dict, margin: float = 0.0) -> tuple[float, float, float, float]:
+    """
+    the extent of the voxel model on the xy plane
+
+    Parameters
+    ----------
+    voxels: dict
+        the voxels generated with raytrace_mrt_engine.voxelize.
+
+    margin: float, optional
+        the extent is shrunk by the margin on each side, so the grid points stay away from the walls. Default = 0.0.
+
+    Returns
+    -------
+    tuple[float, float, float, float]
+        the xmin, xmax, ymin, ymax of the voxels.
+    """
+    midpts = np.asarray(voxels['midpts'])
+    half = np.asarray(voxels['voxel_dim'][0:2], dtype=np.float64)/2
+    mns = midpts[:, 0:2].min(axis=0) - half + margin
+    mxs = midpts[:, 0:2].max(axis=0) + half - margin
+    return float(mns[0]), float(mxs[0]), float(mns[1]), float(mxs[1])
+
+def _new_nodes(node_ids: dict, ijs: np.ndarray) -> np.ndarray:
+    """
+    number the corners not seen before in the order they come.
+
+    Parameters
+    ----------
+    node_ids: dict
+        index of each corner seen so far by its (i, j), the new corners are added to it.
+
+    ijs: np.ndarray
+        np.ndarray[shape(n, 2)] the (i, j) of the corners.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nnew, 2)] the (i, j) of the new corners.
+    """
+    new_ijs = []
+    for ij in map(tuple, ijs.tolist()):
+        if ij not in node_ids:
+            node_ids[ij] = len(node_ids)
+            new_ijs.append(ij)
+    return np.array(new_ijs, dtype=np.int64).reshape(-1, 2)
+
+def gen_adaptive_grid(tracer: dict, vx_temps: np.ndarray, voxels: dict, height: float, spacing: float, threshold: float = 0.5,
+                      max_depth: int = 3, nrays: int = 100, margin: float = 0.2, cache: dict = None,
+                      progress: Callable[[str], None] = None) -> dict:
+    """
+    generate the grid points over the floor extent of the voxels at a height and calculate their mrt. The floor is first covered with square cells of the coarse spacing,
+    a cell is split into 4 when the mrts at its corners differ by more than the threshold, up to max_depth times. Only the new corners of each level are traced,
+    so the steep parts of the mrt map get the fine spacing and the flat parts keep the coarse spacing.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with raytrace_mrt_engine.gen_tracer.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    voxels: dict
+        the voxels generated with raytrace_mrt_engine.voxelize.
+
+    height: float
+        the z of the grid points in meters.
+
+    spacing: float
+        the coarse spacing of the grid points in meters, stretched to fit a whole number of cells in the floor extent.
+
+    threshold: float, optional
+        a cell is split when the max - min of the mrt at its corners is more than the threshold in degC. Default = 0.5.
+
+    max_depth: int, optional
+        maximum number of times a coarse cell is split, the finest spacing is about spacing/2**max_depth. Default = 3.
+
+    nrays: int, optional
+        number of rays to cast per grid point. Default = 100.
+
+    margin: float, optional
+        distance of the grid from the edges of the floor extent in meters. Default = 0.2.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache, see raytrace_mrt_engine.trace_grid.
+
+    progress: Callable[[str], None], optional
+        function called with a progress message after each level.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "grid_xyzs": np.ndarray[shape(ngrids, 3)] the grid points, the corners of all the cells.
+            - "mrt": np.ndarray[shape(ngrids)] mrt of each grid point, -999 if the grid point do not see any temperatures.
+            - "levels": np.ndarray[shape(ngrids)] the level the grid point was added at, 0 for the coarse grid.
+            - "ncells": int, number of leaf cells.
+            - "nuniform": int, number of grid points of a uniform grid at the finest spacing over the same extent.
+    """
+    xmin, xmax, ymin, ymax = floor_extent(voxels, margin=margin)
+    # the spacing is stretched a little so that the cells fit the extent
+    nx = max(1, int(round((xmax - xmin)/spacing)))
+    ny = max(1, int(round((ymax - ymin)/spacing)))
+    # the corners are on an integer lattice of the finest spacing, a coarse cell is 2**max_depth units wide
+    csize = 2**max_depth
+    unit = np.array([(xmax - xmin)/nx, (ymax - ymin)/ny])/csize
+    orig = np.array([xmin, ymin])
+    node_ids = {}
+    ii, jj = np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij')
+    cells = np.column_stack([ii.ravel(), jj.ravel()]) * csize
+    corner_offs = np.array([[0, 0], [1, 0], [0, 1], [1, 1]], dtype=np.int64)
+    node_ijs = _new_nodes(node_ids, (cells[:, None, :] + corner_offs * csize).reshape(-1, 2))
+    grid_xyzs = np.column_stack([orig + node_ijs*unit, np.full(len(node_ijs), height)])
+    mrts, _ = calc_grid_mrt(trace_grid(tracer, grid_xyzs, nrays, cache=cache), vx_temps, len(grid_xyzs))
+    levels = np.zeros(len(grid_xyzs), dtype=np.int64)
+    leaves = []
+    size = csize
+    for level in range(1, max_depth + 1):
+        corner_ids = np.array([node_ids[tuple(ij)] for ij in (cells[:, None, :] + corner_offs * size).reshape(-1, 2).tolist()]).reshape(-1, 4)
+        corner_mrts = mrts[corner_ids]
+        seen = np.all(corner_mrts != -999, axis=1)
+        steep = seen & (corner_mrts.max(axis=1) - corner_mrts.min(axis=1) > threshold)
+        leaves.append(cells[np.logical_not(steep)])
+        cells = cells[steep]
+        if len(cells) == 0:
+            break
+        size //= 2
+        # split each steep cell into 4 and trace the new corners
+        child_offs = np.array([[0, 0], [1, 0], [0, 1], [1, 1]], dtype=np.int64) * size
+        cells = (cells[:, None, :] + child_offs).reshape(-1, 2)
+        new_ijs = _new_nodes(node_ids, (cells[:, None, :] + corner_offs * size).reshape(-1, 2))
+        new_xyzs = np.column_stack([orig + new_ijs*unit, np.full(len(new_ijs), height)])
+        new_mrts, _ = calc_grid_mrt(trace_grid(tracer, new_xyzs, nrays, cache=cache), vx_temps, len(new_xyzs))
+        grid_xyzs = np.concatenate([grid_xyzs, new_xyzs])
+        mrts = np.concatenate([mrts, new_mrts])
+        levels = np.concatenate([levels, np.full(len(new_xyzs), level)])
+        if progress is not None:
+            progress(f"Refining the grid level {level}/{max_depth}: {len(cells)} cells, {len(grid_xyzs)} grid points")
+    leaves.append(cells)
+    ncells = int(sum(len(leaf) for leaf in leaves))
+    nuniform = (nx*csize + 1) * (ny*csize + 1)
+    return {'grid_xyzs': grid_xyzs, 'mrt': mrts, 'levels': levels, 'ncells': ncells, 'nuniform': int(nuniform)}
+
+def calc_adaptive_grid(ply_src: bytes | str, vdim: float, height: float, spacing: float, threshold: float = 0.5, max_depth: int = 3,
+                       nrays: int = 100, intx_method: str = 'dda', bvh_dir: str = None, margin: float = 0.2,
+                       progress: Callable[[str], None] = None, cache: dict = None, chunk_size: int = None) -> dict:
+    """
+    read the ply file, voxelize it and generate the adaptive grid with gen_adaptive_grid
+
+    Parameters
+    ----------
+    ply_src: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    height, spacing, threshold, max_depth, nrays, margin
+        see gen_adaptive_grid.
+
+    intx_method: str, optional
+        'slab', 'dda' or 'bvh', see raytrace_mrt_engine.gen_tracer. Default = 'dda', the grid points are traced a few at a time.
+
+    bvh_dir: str, optional
+        for 'bvh', the directory to cache the bvh in.
+
+    progress: Callable[[str], None], optional
+        function called with progress messages.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache.
+
+    chunk_size: int, optional
+        if given, read and voxelize the ply in chunks of chunk_size points, see raytrace_mrt_engine.load_scene. Default = None.
+
+    Returns
+    -------
+    dict
+        the result of gen_adaptive_grid with the "scene" from raytrace_mrt_engine.load_scene.
+    """
+    scene = load_scene(ply_src, vdim, progress=progress, cache=cache, chunk_size=chunk_size,
+                       need_key=intx_method == 'bvh' and bvh_dir is not None)
+    voxels = scene['voxels']
+    tracer = gen_tracer(voxels, intx_method=intx_method, bvh_dir=bvh_dir, key=scene['key'])
+    res = gen_adaptive_grid(tracer, voxels['temps'], voxels, height, spacing, threshold=threshold, max_depth=max_depth, nrays=nrays,
+                            margin=margin, cache=cache, progress=progress)
+    res['scene'] = scene
+    return res
@@ -0,0 +1,163 @@
+import json
+import numbers
+import tracemalloc
+from time import perf_counter
+from contextlib import contextmanager
+from typing import Iterator
+
+def gen_profile(trace_memory: bool = False) -> dict:
+    """
+    generate an empty profile to record the stages of a calculation with profile_stage
+
+    Parameters
+    ----------
+    trace_memory: bool, optional
+        if True, the peak memory allocated in each stage is traced with tracemalloc, which slows down allocation heavy stages. Default = False, only the time is recorded.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "trace_memory": bool.
+            - "stages": dict, the record of each stage by name in the order they first ran, see profile_stage.
+            - "open": list[dict], the memory of the stages running, innermost last, empty between stages.
+    """
+    return {'trace_memory': trace_memory, 'stages': {}, 'open': []}
+
+@contextmanager
+def profile_stage(profile: dict, name: str, **counters) -> Iterator[dict]:
+    """
+    record the wall time, the peak memory and the counters of the stage run in the with block.
+    A stage run more than once, e.g. for each batch, is accumulated into one record. Stages can be nested, the peak of a stage includes the stages nested in it.
+
+        with profile_stage(profile, 'project', rays=nrays) as counters:
+            ...
+            counters['hits'] = nhits
+
+    Parameters
+    ----------
+    profile: dict
+        the profile generated with gen_profile, nothing is recorded if None.
+
+    name: str
+        name of the stage.
+
+    **counters
+        counters of the work done in the stage, e.g. rays=100000. Counters can also be added to the yielded dict in the with block.
+
+    Yields
+    ------
+    dict
+        the counters of this run of the stage.
+    """
+    if profile is None:
+        yield dict(counters)
+        return
+    counters = dict(counters)
+    frame = None
+    if profile['trace_memory']:
+        open_stages = profile['open']
+        frame = {'started': not tracemalloc.is_tracing()}
+        if frame['started']:
+            tracemalloc.start()
+        elif open_stages:
+            # the peak is reset for this stage, keep the peak of the enclosing stage so far
+            open_stages[-1]['peak'] = max(open_stages[-1]['peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        frame['base'] = frame['peak'] = tracemalloc.get_traced_memory()[0]
+        open_stages.append(frame)
+    t1 = perf_counter()
+    try:
+        yield counters
+    finally:
+        dur = perf_counter() - t1
+        peak_mb = None
+        if frame is not None:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            open_stages.pop()
+            if open_stages:
+                open_stages[-1]['peak'] = max(open_stages[-1]['peak'], frame['peak'])
+            peak_mb = (frame['peak'] - frame['base'])/1e6
+            if frame['started']:
+                tracemalloc.stop()
+        add_stage(profile, name, dur, peak_mb, counters)
+
+def add_stage(profile: dict, name: str, time_s: float, peak_mb: float = None, counters: dict = None):
+    """
+    add a run of a stage measured outside of profile_stage to the profile, accumulated into the record of the stage.
+
+    Parameters
+    ----------
+    profile: dict
+        the profile generated with gen_profile.
+
+    name: str
+        name of the stage.
+
+    time_s: float
+        wall time of the run in seconds.
+
+    peak_mb: float, optional
+        peak memory allocated in the run in MB.
+
+    counters: dict, optional
+        counters of the work done in the run, numeric counters are summed over the runs.
+    """
+    stage = profile['stages'].get(name)
+    if stage is None:
+        stage = {'time_s': 0.0, 'peak_mb': None, 'calls': 0, 'counters': {}, 'rates': {}}
+        profile['stages'][name] = stage
+    stage['time_s'] += time_s
+    stage['calls'] += 1
+    if peak_mb is not None:
+        stage['peak_mb'] = peak_mb if stage['peak_mb'] is None else max(stage['peak_mb'], peak_mb)
+    if counters is not None:
+        for key, val in counters.items():
+            if _is_count(val):
+                # numpy scalars are converted so that the profile can be dumped to json
+                val = int(val) if isinstance(val, numbers.Integral) else float(val)
+                stage['counters'][key] = stage['counters'].get(key, 0) + val
+            else:
+                stage['counters'][key] = val
+    # throughput of the numeric counters, e.g. rays_per_s
+    stage['rates'] = {f"{key}_per_s": val/stage['time_s'] for key, val in stage['counters'].items()
+                      if _is_count(val) and stage['time_s'] > 0}
+
+def _is_count(val) -> bool:
+    return isinstance(val, numbers.Number) and not isinstance(val, bool)
+
+def format_profile(profile: dict) -> str:
+    """
+    format the profile as a table, one row per stage.
+
+    Parameters
+    ----------
+    profile: dict
+        the profile generated with gen_profile.
+
+    Returns
+    -------
+    str
+        the table.
+    """
+    lines = ['stage\ttime_s\tpeak_mb\tthroughput']
+    for name, stage in profile['stages'].items():
+        peak = f"{stage['peak_mb']:.1f}" if stage['peak_mb'] is not None else '-'
+        rates = ', '.join(f"{key} {val:.3g}" for key, val in stage['rates'].items())
+        lines.append(f"{name}\t{stage['time_s']:.3f}\t{peak}\t{rates}")
+    return '\n'.join(lines)
+
+def write_profile(path: str, profile: dict):
+    """
+    write the profile to a json file.
+
+    Parameters
+    ----------
+    path: str
+        path of the json file.
+
+    profile: dict
+        the profile generated with gen_profile.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
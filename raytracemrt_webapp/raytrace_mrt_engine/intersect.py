@@ -0,0 +1,184 @@
+import numpy as np
+
+def midpts2bounds(midpts: np.ndarray, vx_dim: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    convert voxel midpts into the min and max corners of the voxels
+
+    Parameters
+    ----------
+    midpts: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the midpts of the voxels.
+
+    vx_dim: list[float]
+        list[shape(3)] the x, y, z dimension of a voxel.
+
+    Returns
+    -------
+    vx_mins : np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the min corner of the voxels.
+
+    vx_maxs : np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the max corner of the voxels.
+    """
+    midpts = np.asarray(midpts, dtype=np.float64)
+    half_dim = np.asarray(vx_dim, dtype=np.float64)/2
+    vx_mins = midpts - half_dim
+    vx_maxs = midpts + half_dim
+    return vx_mins, vx_maxs
+
+def rays_voxels_intersect(origs: np.ndarray, dirxs: np.ndarray, vx_mins: np.ndarray, vx_maxs: np.ndarray,
+                          max_tests: int = 1000000) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect rays with axis-aligned voxels using batched slab tests and return the nearest hit of each ray.
+
+    Parameters
+    ----------
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    vx_mins: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the min corner of the voxels.
+
+    vx_maxs: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the max corner of the voxels.
+
+    max_tests: int, optional
+        the maximum number of ray x voxel tests in a batch, bounds the memory used per batch. Default = 1000000.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the nearest voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the nearest hit along the ray direction, np.inf if the ray did not hit any voxels.
+    """
+    origs = np.asarray(origs, dtype=np.float64)
+    dirxs = np.asarray(dirxs, dtype=np.float64)
+    vx_mins = np.asarray(vx_mins, dtype=np.float64)
+    vx_maxs = np.asarray(vx_maxs, dtype=np.float64)
+    nrays = len(origs)
+    nvox = len(vx_mins)
+    hit_idxs = np.full(nrays, -1, dtype=np.int64)
+    hit_dists = np.full(nrays, np.inf)
+    if nrays == 0 or nvox == 0:
+        return hit_idxs, hit_dists
+
+    vx_chunk = min(nvox, max_tests)
+    ray_chunk = max(1, max_tests // vx_chunk)
+    for rstart in range(0, nrays, ray_chunk):
+        rend = min(rstart + ray_chunk, nrays)
+        ray_orig = origs[rstart:rend]
+        ray_dirx = dirxs[rstart:rend]
+        for vstart in range(0, nvox, vx_chunk):
+            vend = min(vstart + vx_chunk, nvox)
+            idxs, dists = _slab_test(ray_orig, ray_dirx, vx_mins[vstart:vend], vx_maxs[vstart:vend])
+            # keep the first voxel among equally near hits, same as argmin within a chunk
+            closer = dists < hit_dists[rstart:rend]
+            hit_dists[rstart:rend] = np.where(closer, dists, hit_dists[rstart:rend])
+            hit_idxs[rstart:rend] = np.where(closer, idxs + vstart, hit_idxs[rstart:rend])
+    return hit_idxs, hit_dists
+
+def _slab_test(origs: np.ndarray, dirxs: np.ndarray, vx_mins: np.ndarray, vx_maxs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    slab test of every ray against every voxel, based on https://www.scratchapixel.com/lessons/3d-basic-rendering/minimal-ray-tracer-rendering-simple-shapes/ray-box-intersection
+
+    Parameters
+    ----------
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    vx_mins: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the min corner of the voxels.
+
+    vx_maxs: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] the max corner of the voxels.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the nearest voxel hit by each ray, undefined if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the nearest hit, np.inf if the ray did not hit any voxels.
+    """
+    nrays = len(origs)
+    nvox = len(vx_mins)
+    tnear = np.full((nrays, nvox), -np.inf)
+    tfar = np.full((nrays, nvox), np.inf)
+    # go through the axes one at a time so only (nrays, nvox) arrays are alive
+    for axis in range(3):
+        orig = origs[:, axis][:, np.newaxis]
+        dirx = dirxs[:, axis][:, np.newaxis]
+        mn = vx_mins[:, axis][np.newaxis, :]
+        mx = vx_maxs[:, axis][np.newaxis, :]
+        parallel = dirx == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_dirx = 1.0/dirx
+            t1 = (mn - orig) * inv_dirx
+            t2 = (mx - orig) * inv_dirx
+        tlo = np.minimum(t1, t2)
+        thi = np.maximum(t1, t2)
+        if parallel.any():
+            # a ray parallel to the slab either never leaves it or never enters it
+            inside = np.logical_and(orig >= mn, orig <= mx)
+            tlo = np.where(parallel, np.where(inside, -np.inf, np.inf), tlo)
+            thi = np.where(parallel, np.where(inside, np.inf, -np.inf), thi)
+        np.maximum(tnear, tlo, out=tnear)
+        np.minimum(tfar, thi, out=tfar)
+
+    is_hit = np.logical_and(tnear <= tfar, tfar >= 0)
+    # rays starting inside a voxel hit it where they exit
+    dists = np.where(tnear > 0, tnear, tfar)
+    dists = np.where(is_hit, dists, np.inf)
+    hit_idxs = np.argmin(dists, axis=1)
+    hit_dists = dists[np.arange(nrays), hit_idxs]
+    return hit_idxs, hit_dists
+
+def slab_pairs(origs: np.ndarray, dirxs: np.ndarray, box_mins: np.ndarray, box_maxs: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    slab test of each ray against the box at the same position, i.e. ray[i] against box[i].
+
+    Parameters
+    ----------
+    origs: np.ndarray
+        np.ndarray[shape(npairs, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(npairs, 3)] the directions of the rays.
+
+    box_mins: np.ndarray
+        np.ndarray[shape(npairs, 3)] the min corner of the boxes.
+
+    box_maxs: np.ndarray
+        np.ndarray[shape(npairs, 3)] the max corner of the boxes.
+
+    Returns
+    -------
+    is_hit : np.ndarray
+        np.ndarray[shape(npairs)] True if the ray hits the box.
+
+    tnear : np.ndarray
+        np.ndarray[shape(npairs)] distance to where the ray enters the box, negative if the ray starts inside the box.
+
+    tfar : np.ndarray
+        np.ndarray[shape(npairs)] distance to where the ray exits the box.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_dirxs = 1.0/dirxs
+        t1 = (box_mins - origs) * inv_dirxs
+        t2 = (box_maxs - origs) * inv_dirxs
+    parallel = dirxs == 0
+    inside = np.logical_and(origs >= box_mins, origs <= box_maxs)
+    tlo = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    thi = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    tnear = tlo.max(axis=1)
+    tfar = thi.min(axis=1)
+    is_hit = np.logical_and(tnear <= tfar, tfar >= 0)
+    return is_hit, tnear, tfar
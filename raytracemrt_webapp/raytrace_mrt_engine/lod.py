@@ -0,0 +1,80 @@
+import numpy as np
+
+def _spread_bits(vals: np.ndarray) -> np.ndarray:
+    """
+    spread the lower 21 bits of the integers so that there are 2 zero bits between each bit, to interleave 3 of them into a morton code.
+
+    Parameters
+    ----------
+    vals: np.ndarray
+        np.ndarray[shape(n)] the integers.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(n)] uint64 spread bits.
+    """
+    x = vals.astype(np.uint64) & np.uint64(0x1fffff)
+    x = (x | x << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    x = (x | x << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    x = (x | x << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    x = (x | x << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | x << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return x
+
+def gen_point_lod(xyzs: np.ndarray, max_depth: int = 16, seed: int = 0) -> dict:
+    """
+    order the points into the levels of detail of an octree over their bounding cube. Level l keeps one point in each occupied octree cell of level l,
+    so the points up to level l are the point cloud decimated to a spacing of about size/2**l. The points are sorted by level and shuffled within each level,
+    any prefix of the order is then an evenly spread decimation and a viewer only needs to change the number of points drawn.
+
+    Parameters
+    ----------
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, 3)] the points.
+
+    max_depth: int, optional
+        depth of the finest octree level, at most 17. The points sharing a cell of the finest level are put in one last level. Default = 16.
+
+    seed: int, optional
+        seed of the shuffle within the levels. Default = 0.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "order": np.ndarray[shape(npts)] index of the points sorted by level.
+            - "level_ends": np.ndarray[shape(nlevels)] number of points up to and including each level, the last is npts.
+            - "spacings": np.ndarray[shape(nlevels)] size of the octree cells of each level in meters.
+            - "center": np.ndarray[shape(3)] center of the bounding box of the points.
+            - "radius": float, half the diagonal of the bounding box.
+    """
+    max_depth = int(min(max(max_depth, 1), 17))
+    xyzs = np.asarray(xyzs, dtype=np.float64).reshape(-1, 3)
+    npts = len(xyzs)
+    if npts == 0:
+        return {'order': np.empty(0, dtype=np.int64), 'level_ends': np.zeros(1, dtype=np.int64), 'spacings': np.ones(1),
+                'center': np.zeros(3), 'radius': 0.0}
+    mns = xyzs.min(axis=0)
+    mxs = xyzs.max(axis=0)
+    size = max(float((mxs - mns).max()), 1e-9)
+    ncells = 2**max_depth
+    qs = np.clip(((xyzs - mns)/size * ncells).astype(np.int64), 0, ncells - 1)
+    codes = _spread_bits(qs[:, 0]) | _spread_bits(qs[:, 1]) << np.uint64(1) | _spread_bits(qs[:, 2]) << np.uint64(2)
+    morton_order = np.argsort(codes, kind='stable')
+    codes = codes[morton_order]
+    # a point is the first of its cell of level l when it differs from the previous point in the bits of level l,
+    # its level is the coarsest such level, set by the highest bit of the difference
+    diffs = codes[1:] ^ codes[:-1]
+    _, exps = np.frexp(diffs.astype(np.float64))
+    levels = np.empty(npts, dtype=np.int64)
+    levels[0] = 0
+    levels[1:] = np.where(diffs == 0, max_depth + 1, max_depth - (exps - 1)//3)
+    nlevels = max_depth + 2
+    rng = np.random.default_rng(seed)
+    by_level = np.lexsort((rng.random(npts), levels))
+    order = morton_order[by_level]
+    level_ends = np.cumsum(np.bincount(levels, minlength=nlevels))
+    spacings = size/2.0**np.minimum(np.arange(nlevels), max_depth)
+    return {'order': order, 'level_ends': level_ends, 'spacings': spacings, 'center': (mns + mxs)/2,
+            'radius': float(np.linalg.norm(mxs - mns)/2)}
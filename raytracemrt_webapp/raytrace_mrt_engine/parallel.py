@@ -0,0 +1,248 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+from .rays import get_unit_dirs, gen_rays_arr
+from .pipeline import trace_rays, trace_msg
+from .adaptive import calc_grid_mrt_adaptive
+
+# the tracer and its shared memory blocks, attached once in each process of the pool
+_TRACER = None
+_SHMS = []
+
+def share_arrays(arrays: dict) -> tuple[list[shared_memory.SharedMemory], dict]:
+    """
+    copy the arrays of a dictionary into shared memory so that other processes can attach to them without pickling
+
+    Parameters
+    ----------
+    arrays: dict
+        dictionary, the np.ndarray values are put in shared memory, the other values are passed as they are.
+
+    Returns
+    -------
+    shms : list[shared_memory.SharedMemory]
+        the shared memory blocks, close and unlink them when the other processes are done.
+
+    spec : dict
+        picklable description of the dictionary, pass it to attach_arrays.
+    """
+    shms = []
+    spec = {}
+    for key, val in arrays.items():
+        if isinstance(val, np.ndarray):
+            shm = shared_memory.SharedMemory(create=True, size=max(1, val.nbytes))
+            shared = np.ndarray(val.shape, dtype=val.dtype, buffer=shm.buf)
+            shared[...] = val
+            shms.append(shm)
+            spec[key] = ('shm', shm.name, val.shape, val.dtype.str)
+        else:
+            spec[key] = ('val', val)
+    return shms, spec
+
+def attach_arrays(spec: dict) -> tuple[list[shared_memory.SharedMemory], dict]:
+    """
+    attach to the arrays shared with share_arrays
+
+    Parameters
+    ----------
+    spec: dict
+        the spec from share_arrays.
+
+    Returns
+    -------
+    shms : list[shared_memory.SharedMemory]
+        the attached shared memory blocks, keep them alive while the arrays are in use.
+
+    arrays : dict
+        the dictionary with the arrays as views of the shared memory.
+    """
+    shms = []
+    arrays = {}
+    for key, val in spec.items():
+        if val[0] == 'shm':
+            _, name, shape, dtype = val
+            shm = shared_memory.SharedMemory(name=name)
+            shms.append(shm)
+            arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        else:
+            arrays[key] = val[1]
+    return shms, arrays
+
+def _init_worker(spec: dict):
+    """
+    attach the tracer in a process of the pool
+
+    Parameters
+    ----------
+    spec: dict
+        the spec of the tracer from share_arrays.
+    """
+    global _TRACER, _SHMS
+    _SHMS, _TRACER = attach_arrays(spec)
+
+def _trace_task(grid_xyzs: np.ndarray, nrays: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    trace the rays of a shard of grid points in a process of the pool
+
+    Parameters
+    ----------
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points of the shard.
+
+    nrays: int
+        number of rays to cast per grid point.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] index of the voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    rays = gen_rays_arr(grid_xyzs, nrays)
+    return trace_rays(_TRACER, rays['origs'], rays['dirxs'])
+
+def trace_grid_parallel(tracer: dict, grid_xyzs: np.ndarray, nrays: int, workers: int,
+                        progress: Callable[[str], None] = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    shard the grid points across a process pool and intersect their rays with the voxels.
+    The arrays of the tracer are put in shared memory once instead of being pickled for every task.
+    The result is identical to tracing all the rays in a single process.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with raytrace_mrt_engine.gen_tracer.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    nrays: int
+        number of rays to cast per grid point.
+
+    workers: int
+        number of processes.
+
+    progress: Callable[[str], None], optional
+        function called with a progress message after each shard.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] index of the voxel hit by each ray in the order of raytrace_mrt_engine.gen_rays_arr, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    # a few shards per process to balance the load
+    nshards = max(1, min(len(grid_xyzs), workers * 4))
+    shards = np.array_split(grid_xyzs, nshards)
+    ndir = len(get_unit_dirs(int(nrays))) * len(grid_xyzs)
+    results = [None] * nshards
+    shms, spec = share_arrays(tracer)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spec,)) as executor:
+            futures = {executor.submit(_trace_task, shard, nrays): cnt for cnt, shard in enumerate(shards)}
+            rcnt = 0
+            nhr = 0
+            for future in as_completed(futures):
+                idxs, dists = future.result()
+                results[futures[future]] = (idxs, dists)
+                rcnt += len(idxs)
+                nhr += int(np.count_nonzero(idxs != -1))
+                if progress is not None:
+                    progress(trace_msg(tracer, ndir, rcnt, nhr))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    hit_idxs = np.concatenate([res[0] for res in results])
+    hit_dists = np.concatenate([res[1] for res in results])
+    return hit_idxs, hit_dists
+
+def _adaptive_task(vx_temps: np.ndarray, grid_xyzs: np.ndarray, kwargs: dict) -> dict:
+    """
+    calculate the mrt of a shard of grid points with an adaptive number of rays in a process of the pool
+
+    Parameters
+    ----------
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points of the shard.
+
+    kwargs: dict
+        the tol, batch_rays, max_rays, min_hits and seed of raytrace_mrt_engine.calc_grid_mrt_adaptive.
+
+    Returns
+    -------
+    dict
+        the result of raytrace_mrt_engine.calc_grid_mrt_adaptive for the shard.
+    """
+    return calc_grid_mrt_adaptive(_TRACER, vx_temps, grid_xyzs, **kwargs)
+
+def calc_grid_mrt_adaptive_parallel(tracer: dict, vx_temps: np.ndarray, grid_xyzs: np.ndarray, workers: int, progress: Callable[[str], None] = None,
+                                    **kwargs) -> dict:
+    """
+    shard the grid points across a process pool and calculate their mrt with an adaptive number of rays.
+    A grid point only depends on its own rays and the rotation of each round is drawn from the seed in the same order in every shard,
+    so the result is identical to raytrace_mrt_engine.calc_grid_mrt_adaptive in a single process.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with raytrace_mrt_engine.gen_tracer.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    workers: int
+        number of processes.
+
+    progress: Callable[[str], None], optional
+        function called with a progress message after each shard.
+
+    **kwargs
+        the tol, batch_rays, max_rays, min_hits and seed of raytrace_mrt_engine.calc_grid_mrt_adaptive.
+
+    Returns
+    -------
+    dict
+        the result of raytrace_mrt_engine.calc_grid_mrt_adaptive, the rays of the "trace" are ordered by shard.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    vx_temps = np.asarray(vx_temps, dtype=np.float64)
+    # a few shards per process to balance the load, the grid points of a shard stop after different numbers of rounds
+    nshards = max(1, min(len(grid_xyzs), workers * 4))
+    shard_ids = np.array_split(np.arange(len(grid_xyzs)), nshards)
+    results = [None] * nshards
+    shms, spec = share_arrays(tracer)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spec,)) as executor:
+            futures = {executor.submit(_adaptive_task, vx_temps, grid_xyzs[ids], kwargs): cnt for cnt, ids in enumerate(shard_ids)}
+            ndone = 0
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                ndone += len(shard_ids[futures[future]])
+                if progress is not None:
+                    progress(f"Adaptive rays: {ndone}/{len(grid_xyzs)} grid points finished")
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    res = {key: np.concatenate([shard_res[key] for shard_res in results]) for key in ['mrt', 'nhits', 'nrays', 'stderr']}
+    traces = [shard_res['trace'] for shard_res in results]
+    # the grid_ids of the rays of a shard are indices into the shard
+    for trace, ids in zip(traces, shard_ids):
+        trace['grid_ids'] = ids[trace['grid_ids']] if len(ids) != 0 else trace['grid_ids']
+    res['trace'] = {key: np.concatenate([trace[key] for trace in traces]) for key in ['origs', 'dirxs', 'grid_ids', 'hit_idxs', 'hit_dists']}
+    return res
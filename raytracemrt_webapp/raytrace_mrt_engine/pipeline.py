@@ -0,0 +1,738 @@
+import csv
+import math
+from typing import Callable, Iterator
+
+import numpy as np
+
+from .intersect import midpts2bounds, rays_voxels_intersect
+from .traverse import gen_voxel_lookup, rays_voxels_traverse
+from .bvh import content_key, scene_key, gen_bvh, get_cached_bvh, bvh_intersect
+from .rays import get_unit_dirs, gen_rays_arr, separate_rays_arr
+from .voxel import voxelize, voxelize_chunks
+from .plyio import read_ply_vertex, ply_vertex_columns, iter_ply_vertex_chunks
+from .cache import cache_get, cache_put, cache_stats
+from .instrument import gen_profile, profile_stage
+
+INTX_METHODS = ['slab', 'dda', 'bvh']
+# floor of the number of rays in a default batch of iter_grid_mrt, keeps the cost of yielding and reporting a batch small against the tracing
+MIN_BATCH_RAYS = 10000
+
+def _no_progress(msg: str):
+    pass
+
+def load_scene(ply_src: bytes | str, vdim: float, progress: Callable[[str], None] = None, cache: dict = None, profile: dict = None,
+               chunk_size: int = None, nsample: int = 100000, need_key: bool = False) -> dict:
+    """
+    read the ply file and convert the points to voxels
+
+    Parameters
+    ----------
+    ply_src: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    progress: Callable[[str], None], optional
+        function called with a message at the start of each stage.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache. The parsed points are cached by the content of the ply and the voxels by the content and vdim, only what is not cached is computed.
+
+    profile: dict, optional
+        profile from raytrace_mrt_engine.gen_profile, the "read_ply" and "voxelize" stages are recorded in it, or the "stream_voxelize" stage with chunk_size.
+
+    chunk_size: int, optional
+        if given, the ply is read in chunks of chunk_size points and voxelized with raytrace_mrt_engine.voxelize_chunks without holding all the points in memory,
+        only a decimated sample of the points is kept. Default = None, the whole ply is read at once.
+
+    nsample: int, optional
+        with chunk_size, the number of points kept in the sample. Default = 100000.
+
+    need_key: bool, optional
+        if True, compute the key of the voxel model even without a cache, e.g. to cache the bvh in a directory. Default = False,
+        the key is only computed with a cache as it hashes the whole ply.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "xyzs": np.ndarray[shape(npts, 3)] the points of the ply, with chunk_size the sampled points.
+            - "temps": np.ndarray[shape(npts)] the temperatures of the points.
+            - "voxels": dict, the voxels generated with raytrace_mrt_engine.voxelize.
+            - "key": str, key identifying the voxel model, generated with raytrace_mrt_engine.scene_key. None without a cache unless need_key.
+    """
+    if progress is None:
+        progress = _no_progress
+    ckey = None
+    key = None
+    if cache is not None or need_key:
+        ckey = content_key(ply_src)
+        key = scene_key(ply_src, vdim, ckey=ckey)
+    if chunk_size is not None:
+        return _stream_scene(ply_src, vdim, chunk_size, nsample, progress, cache, profile, ckey, key)
+    #------------------------------------------------------------------
+    # region: read ply file
+    with profile_stage(profile, 'read_ply') as counters:
+        plydata = None
+        if cache is not None:
+            plydata = cache_get(cache, 'cloud', ckey)
+        counters['cached'] = plydata is not None
+        if plydata is None:
+            progress('Reading PLY file ...')
+            ply_vertex = read_ply_vertex(ply_src)
+            plydata = ply_vertex_columns(ply_vertex)
+            if cache is not None:
+                # cache copies so that the cache does not hold on to the bytes of the ply
+                plydata = {'xyzs': np.array(plydata['xyzs'], dtype=np.float64), 'temps': np.array(plydata['temps'], dtype=np.float64)}
+                cache_put(cache, 'cloud', ckey, plydata)
+        counters['pts'] = len(plydata['xyzs'])
+    # endregion: read ply file
+    #------------------------------------------------------------------
+    # region: convert ply pts to voxels
+    with profile_stage(profile, 'voxelize', pts=len(plydata['xyzs'])) as counters:
+        vxres_dict = None
+        if cache is not None:
+            vxres_dict = cache_get(cache, 'voxels', key)
+        counters['cached'] = vxres_dict is not None
+        if vxres_dict is None:
+            progress('Convert PLY pts to voxels ...')
+            vxres_dict = voxelize(plydata['xyzs'], plydata['temps'], vdim)
+            if cache is not None:
+                cache_put(cache, 'voxels', key, vxres_dict)
+        counters['voxels'] = len(vxres_dict['ijks'])
+    # endregion: convert ply pts to voxels
+    #------------------------------------------------------------------
+    return {'xyzs': plydata['xyzs'], 'temps': plydata['temps'], 'voxels': vxres_dict, 'key': key}
+
+def _stream_scene(ply_src: bytes | str, vdim: float, chunk_size: int, nsample: int, progress: Callable[[str], None], cache: dict, profile: dict,
+                  ckey: str, key: str) -> dict:
+    """
+    read the ply in chunks and voxelize it with raytrace_mrt_engine.voxelize_chunks, see load_scene. The voxels are cached with the same key as load_scene,
+    the sample is cached separately from the whole points.
+
+    Returns
+    -------
+    dict
+        the scene with the keys of load_scene, the "xyzs" and "temps" are the sampled points.
+    """
+    with profile_stage(profile, 'stream_voxelize') as counters:
+        vxres_dict = None
+        sample = None
+        skey = (ckey, nsample)
+        if cache is not None:
+            vxres_dict = cache_get(cache, 'voxels', key)
+            sample = cache_get(cache, 'sample', skey)
+        counters['cached'] = vxres_dict is not None and sample is not None
+        if not counters['cached']:
+            progress('Convert PLY pts to voxels in chunks ...')
+            def read_chunks():
+                for vertex in iter_ply_vertex_chunks(ply_src, chunk_size=chunk_size):
+                    cols = ply_vertex_columns(vertex)
+                    yield cols['xyzs'], cols['temps']
+            res = voxelize_chunks(read_chunks, vdim, nsample=nsample)
+            sample = {'xyzs': res.pop('sample_xyzs'), 'temps': res.pop('sample_temps'), 'npts': res.pop('npts')}
+            vxres_dict = res
+            if cache is not None:
+                cache_put(cache, 'voxels', key, vxres_dict)
+                cache_put(cache, 'sample', skey, sample)
+        counters['pts'] = sample['npts']
+        counters['voxels'] = len(vxres_dict['ijks'])
+    return {'xyzs': sample['xyzs'], 'temps': sample['temps'], 'voxels': vxres_dict, 'key': key}
+
+def gen_tracer(voxels: dict, intx_method: str = 'slab', bvh_dir: str = None, key: str = None) -> dict:
+    """
+    generate the arrays needed to intersect rays with the voxels using one of the intersection methods
+
+    Parameters
+    ----------
+    voxels: dict
+        the voxels generated with raytrace_mrt_engine.voxelize.
+
+    intx_method: str, optional
+        'slab' tests the rays against every voxel, 'dda' walks the rays through the voxel lattice, 'bvh' traverses the bvh of the voxels. Default = 'slab'.
+
+    bvh_dir: str, optional
+        for 'bvh', the directory to cache the bvh in. The bvh is not cached if not specified.
+
+    key: str, optional
+        key identifying the voxel model, required for 'bvh' if bvh_dir is specified and for trace_grid to cache the traced rays.
+
+    Returns
+    -------
+    dict
+        the tracer, a dictionary of arrays with the "intx_method", "nvoxels" and "key", pass it to trace_rays.
+    """
+    if intx_method not in INTX_METHODS:
+        raise ValueError(f"unknown intx_method '{intx_method}', choose from {INTX_METHODS}")
+    if intx_method == 'bvh' and bvh_dir is not None and key is None:
+        raise ValueError('a key is required to cache the bvh in bvh_dir, see load_scene')
+    midpts = voxels['midpts']
+    vx_dim = voxels['voxel_dim']
+    tracer = {'intx_method': intx_method, 'nvoxels': len(midpts), 'key': key}
+    if intx_method == 'slab':
+        vx_mins, vx_maxs = midpts2bounds(midpts, vx_dim)
+        tracer.update({'vx_mins': vx_mins, 'vx_maxs': vx_maxs})
+    elif intx_method == 'dda':
+        tracer.update(gen_voxel_lookup(voxels['ijks']))
+        tracer.update({'lattice_orig': np.asarray(voxels['lattice_orig']), 'vx_dim': np.asarray(vx_dim, dtype=np.float64)})
+    else:
+        if bvh_dir is not None:
+            tracer.update(get_cached_bvh(midpts, vx_dim, bvh_dir, key))
+        else:
+            tracer.update(gen_bvh(midpts, vx_dim))
+    return tracer
+
+def trace_rays(tracer: dict, origs: np.ndarray, dirxs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect the rays with the voxels of the tracer
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with gen_tracer.
+
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the nearest voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the nearest hit along the ray direction, np.inf if the ray did not hit any voxels.
+    """
+    intx_method = tracer['intx_method']
+    if intx_method == 'dda':
+        return rays_voxels_traverse(origs, dirxs, tracer, tracer['lattice_orig'], tracer['vx_dim'])
+    elif intx_method == 'bvh':
+        return bvh_intersect(tracer, origs, dirxs)
+    return rays_voxels_intersect(origs, dirxs, tracer['vx_mins'], tracer['vx_maxs'])
+
+def progress_chunk(tracer: dict) -> int:
+    """
+    number of rays to trace between two progress reports
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with gen_tracer.
+
+    Returns
+    -------
+    int
+        number of rays.
+    """
+    if tracer['intx_method'] == 'slab':
+        # roughly every 10 batches of the slab engine
+        aloop = 1000000
+        return max(1, int(aloop/max(1, tracer['nvoxels']))) * 10
+    return 100000
+
+def trace_msg(tracer: dict, ndir: int, rcnt: int, nhr: int) -> str:
+    """
+    progress message of the projection
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with gen_tracer.
+
+    ndir: int
+        total number of rays.
+
+    rcnt: int
+        number of rays traced so far.
+
+    nhr: int
+        number of rays traced so far that hit a voxel.
+
+    Returns
+    -------
+    str
+        the message.
+    """
+    percentage = int(rcnt/ndir * 100)
+    nmr = rcnt - nhr
+    msg = f"Projecting {ndir} ray onto {tracer['nvoxels']} Voxels ({tracer['intx_method']}) ... \n{percentage}% of rays completed"
+    msg += f"\n{nhr} rays intersection, {nmr} rays did not hit any voxels"
+    return msg
+
+def _trace_all(tracer: dict, grid_xyzs: np.ndarray, nrays: int, progress: Callable[[str], None],
+               workers: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect all the rays of the grid points with the voxels, see trace_grid.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] index of the voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    if workers > 1:
+        from .parallel import trace_grid_parallel
+        return trace_grid_parallel(tracer, grid_xyzs, nrays, workers, progress=progress)
+    rays = gen_rays_arr(grid_xyzs, nrays)
+    ndir = len(rays['origs'])
+    nparallel = max(1, math.ceil(ndir/progress_chunk(tracer)))
+    rays_ls = separate_rays_arr(rays, nparallel)
+    hit_idxs = []
+    hit_dists = []
+    nhr = 0
+    rcnt = 0
+    for rays1 in rays_ls:
+        idxs, dists = trace_rays(tracer, rays1['origs'], rays1['dirxs'])
+        hit_idxs.append(idxs)
+        hit_dists.append(dists)
+        rcnt += len(idxs)
+        nhr += int(np.count_nonzero(idxs != -1))
+        progress(trace_msg(tracer, ndir, rcnt, nhr))
+    return np.concatenate(hit_idxs), np.concatenate(hit_dists)
+
+def _trace_cached(tracer: dict, grid_xyzs: np.ndarray, nrays: int, progress: Callable[[str], None],
+                  workers: int, cache: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect the rays of the grid points with the voxels, the result of each grid point is cached by the voxel model, intx_method, number of rays and position,
+    only the grid points that are not cached are traced. See trace_grid.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] index of the voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(ngrids*nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    ngrids = len(grid_xyzs)
+    nunit = len(get_unit_dirs(int(nrays)))
+    tkey = (tracer['key'], tracer['intx_method'], nunit)
+    hit_idxs = np.full((ngrids, nunit), -1, dtype=np.int64)
+    hit_dists = np.full((ngrids, nunit), np.inf)
+    todo = []
+    for gcnt, grid_xyz in enumerate(grid_xyzs):
+        res = cache_get(cache, 'trace', tkey + (grid_xyz.tobytes(),))
+        if res is None:
+            todo.append(gcnt)
+        else:
+            hit_idxs[gcnt], hit_dists[gcnt] = res
+    if len(todo) == 0:
+        progress('Reusing the cached rays of all the grid points ...')
+    else:
+        idxs, dists = _trace_all(tracer, grid_xyzs[todo], nrays, progress, workers)
+        idxs = idxs.reshape(-1, nunit)
+        dists = dists.reshape(-1, nunit)
+        for cnt, gcnt in enumerate(todo):
+            hit_idxs[gcnt] = idxs[cnt]
+            hit_dists[gcnt] = dists[cnt]
+            cache_put(cache, 'trace', tkey + (grid_xyzs[gcnt].tobytes(),), (idxs[cnt].copy(), dists[cnt].copy()))
+    return hit_idxs.reshape(-1), hit_dists.reshape(-1)
+
+def trace_grid(tracer: dict, grid_xyzs: np.ndarray, nrays: int, progress: Callable[[str], None] = None,
+               workers: int = 1, cache: dict = None, profile: dict = None) -> dict:
+    """
+    generate the rays of the grid points and intersect them with the voxels
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with gen_tracer.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    nrays: int
+        number of rays to cast per grid point.
+
+    progress: Callable[[str], None], optional
+        function called with a progress message after each batch of rays.
+
+    workers: int, optional
+        number of processes to trace the rays with, the grid points are sharded across a process pool if > 1. Default = 1.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache, only the grid points not traced before with the same voxels, intx_method and nrays are traced.
+        Requires the tracer to be generated with a key.
+
+    profile: dict, optional
+        profile from raytrace_mrt_engine.gen_profile, the "gen_rays" and "project" stages are recorded in it.
+        The ray x voxel tests are only counted for 'slab', the other methods skip most of the voxels.
+
+    Returns
+    -------
+    dict
+        the rays generated with raytrace_mrt_engine.gen_rays_arr with the additional keys:
+            - "hit_idxs": np.ndarray[shape(nrays)] index of the voxel hit by each ray, -1 if the ray did not hit any voxels.
+            - "hit_dists": np.ndarray[shape(nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    if progress is None:
+        progress = _no_progress
+    with profile_stage(profile, 'gen_rays') as counters:
+        rays = gen_rays_arr(grid_xyzs, nrays)
+        counters['rays'] = len(rays['origs'])
+    with profile_stage(profile, 'project') as counters:
+        ntraced = len(rays['origs'])
+        if cache is not None and tracer.get('key') is not None:
+            nreused = cache['hits'].get('trace', 0)
+            hit_idxs, hit_dists = _trace_cached(tracer, grid_xyzs, nrays, progress, workers, cache)
+            # only the rays of the grid points not found in the cache are traced
+            nreused = cache['hits'].get('trace', 0) - nreused
+            ntraced -= nreused * len(rays['origs'])//max(1, len(grid_xyzs))
+            counters['cached_grids'] = nreused
+        else:
+            hit_idxs, hit_dists = _trace_all(tracer, grid_xyzs, nrays, progress, workers)
+        counters['rays'] = ntraced
+        if tracer['intx_method'] == 'slab':
+            counters['ray_voxel_tests'] = ntraced * tracer['nvoxels']
+    rays['hit_idxs'] = hit_idxs
+    rays['hit_dists'] = hit_dists
+    return rays
+
+def aggregate_grid(trace_res: dict, vx_temps: np.ndarray, ngrids: int) -> dict:
+    """
+    aggregate the flat arrays of the rays into the results of each grid point with grouped reductions over the grid_ids in one pass
+
+    Parameters
+    ----------
+    trace_res: dict
+        the result of trace_grid, only the "grid_ids" and "hit_idxs" are used.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    ngrids: int
+        number of grid points.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "mrt": np.ndarray[shape(ngrids)] mrt of each grid point, the mean temperature of the voxels hit by its rays, -999 if the grid point do not see any temperatures.
+            - "nhits": np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+            - "nrays": np.ndarray[shape(ngrids)] number of rays cast from each grid point.
+            - "miss_frac": np.ndarray[shape(ngrids)] fraction of the rays of each grid point that did not hit any voxels, -999 if no rays are cast.
+    """
+    vx_temps = np.asarray(vx_temps, dtype=np.float64)
+    hit_idxs = trace_res['hit_idxs']
+    grid_ids = trace_res['grid_ids']
+    is_hit = hit_idxs != -1
+    hit_grids = grid_ids[is_hit]
+    nrays = np.bincount(grid_ids, minlength=ngrids)
+    nhits = np.bincount(hit_grids, minlength=ngrids)
+    temp_sums = np.bincount(hit_grids, weights=vx_temps[hit_idxs[is_hit]], minlength=ngrids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mrts = np.where(nhits != 0, temp_sums/nhits, -999.0)
+        miss_fracs = np.where(nrays != 0, 1 - nhits/nrays, -999.0)
+    return {'mrt': mrts, 'nhits': nhits, 'nrays': nrays, 'miss_frac': miss_fracs}
+
+def calc_grid_mrt(trace_res: dict, vx_temps: np.ndarray, ngrids: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    calculate the mrt of each grid point as the mean temperature of the voxels hit by its rays, see aggregate_grid
+
+    Parameters
+    ----------
+    trace_res: dict
+        the result of trace_grid.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    ngrids: int
+        number of grid points.
+
+    Returns
+    -------
+    mrts : np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point, -999 if the grid point do not see any temperatures.
+
+    nhits : np.ndarray
+        np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+    """
+    agg = aggregate_grid(trace_res, vx_temps, ngrids)
+    return agg['mrt'], agg['nhits']
+
+def ray_ends(trace_res: dict, miss_dist: float = 5.0) -> np.ndarray:
+    """
+    calculate the end point of all the rays at once, the intersection point of the rays that hit a voxel and a point at miss_dist along the rays that did not
+
+    Parameters
+    ----------
+    trace_res: dict
+        the result of trace_grid.
+
+    miss_dist: float, optional
+        distance of the end point of the rays that did not hit any voxels. Default = 5.0.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nrays, 3)] the end point of each ray.
+    """
+    dists = np.where(trace_res['hit_idxs'] != -1, trace_res['hit_dists'], miss_dist)
+    return trace_res['origs'] + trace_res['dirxs'] * dists[:, np.newaxis]
+
+def iter_grid_mrt(tracer: dict, vx_temps: np.ndarray, grid_xyzs: np.ndarray, nrays: int, batch_size: int = None,
+                  cache: dict = None, profile: dict = None) -> Iterator[dict]:
+    """
+    trace the grid points batch by batch and yield the mrt of the grid points completed in each batch, so the results can be shown
+    as they arrive and the calculation can be stopped between batches by not asking for the next batch.
+
+    Parameters
+    ----------
+    tracer: dict
+        the tracer generated with gen_tracer.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    nrays: int
+        number of rays to cast per grid point.
+
+    batch_size: int, optional
+        number of grid points in a batch. Default is the number of grid points whose rays make up one progress report of the tracer,
+        but no fewer rays than MIN_BATCH_RAYS, e.g. the slab tracer of a large voxel model reports every few rays.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache, see trace_grid.
+
+    profile: dict, optional
+        profile from raytrace_mrt_engine.gen_profile, the stages of trace_grid and the "aggregate" stage are accumulated over the batches.
+
+    Yields
+    ------
+    dict
+        A dictionary containing:
+            - "grid_ids": np.ndarray[shape(nbatch)] index of the grid points of the batch.
+            - "mrt": np.ndarray[shape(nbatch)] mrt of the grid points of the batch, -999 if the grid point do not see any temperatures.
+            - "nhits": np.ndarray[shape(nbatch)] number of rays of each grid point that hit a voxel.
+            - "trace": dict, the result of trace_grid for the batch, the "grid_ids" of the rays are indices into the batch.
+            - "ndone": int, number of grid points completed so far.
+            - "msg": str, progress message.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    ngrids = len(grid_xyzs)
+    nunit = len(get_unit_dirs(int(nrays)))
+    if batch_size is None:
+        batch_size = max(1, max(progress_chunk(tracer), MIN_BATCH_RAYS)//nunit)
+    ndir = ngrids * nunit
+    rcnt = 0
+    nhr = 0
+    for start in range(0, ngrids, batch_size):
+        end = min(start + batch_size, ngrids)
+        trace_res = trace_grid(tracer, grid_xyzs[start:end], nrays, cache=cache, profile=profile)
+        with profile_stage(profile, 'aggregate', rays=len(trace_res['hit_idxs']), grids=end - start):
+            mrts, nhits = calc_grid_mrt(trace_res, vx_temps, end - start)
+        rcnt += len(trace_res['hit_idxs'])
+        nhr += int(nhits.sum())
+        yield {'grid_ids': np.arange(start, end), 'mrt': mrts, 'nhits': nhits, 'trace': trace_res, 'ndone': end,
+               'msg': trace_msg(tracer, ndir, rcnt, nhr)}
+
+def calc_mrt_arr(ply_src: bytes | str, grid_xyzs: np.ndarray, vdim: float, nrays: int, intx_method: str = 'slab',
+                 bvh_dir: str = None, workers: int = 1, progress: Callable[[str], None] = None, cache: dict = None,
+                 tol: float = 0, max_rays: int = 2000, profile: bool = False, chunk_size: int = None, trace_memory: bool = False) -> dict:
+    """
+    calc mrt, the whole pipeline on arrays without any dependency on the webapp
+
+    Parameters
+    ----------
+    ply_src: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    nrays: int
+        number of rays to cast per grid point.
+
+    intx_method: str, optional
+        'slab', 'dda' or 'bvh', see gen_tracer. Default = 'slab'.
+
+    bvh_dir: str, optional
+        for 'bvh', the directory to cache the bvh in.
+
+    workers: int, optional
+        number of processes to trace the rays with, also with tol > 0. Default = 1.
+
+    progress: Callable[[str], None], optional
+        function called with progress messages.
+
+    cache: dict, optional
+        cache from raytrace_mrt_engine.gen_cache, reused across runs so that only what changed is parsed, voxelized or traced.
+        With tol > 0 only the points and voxels are cached, the rays of the rounds are randomly rotated and cannot be reused.
+
+    tol: float, optional
+        if > 0, the rays are cast in rounds of nrays until the standard error of the mrt of each grid point is <= tol in degC,
+        see raytrace_mrt_engine.calc_grid_mrt_adaptive. Default = 0, nrays per grid point.
+
+    max_rays: int, optional
+        if tol > 0, maximum number of rays per grid point. Default = 2000.
+
+    profile: bool, optional
+        if True, record the wall time and throughput of each stage with raytrace_mrt_engine.profile_stage. Default = False.
+
+    chunk_size: int, optional
+        if given, read and voxelize the ply in chunks of chunk_size points, see load_scene. Default = None.
+
+    trace_memory: bool, optional
+        with profile, also trace the peak memory of each stage, see raytrace_mrt_engine.gen_profile. Default = False.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "scene": dict, the scene from load_scene.
+            - "grid_xyzs": np.ndarray[shape(ngrids, 3)] the grid points.
+            - "trace": dict, the result of trace_grid.
+            - "mrt": np.ndarray[shape(ngrids)] mrt of each grid point, -999 if the grid point do not see any temperatures.
+            - "nhits": np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+            - "cache": dict, the hits and misses of the cache in this run from raytrace_mrt_engine.cache_stats, None if no cache is used.
+            - "nrays": np.ndarray[shape(ngrids)] number of rays cast from each grid point.
+            - "miss_frac": np.ndarray[shape(ngrids)] fraction of the rays of each grid point that did not hit any voxels.
+            - "stderr": np.ndarray[shape(ngrids)] standard error of the mrt of each grid point, -999 if it cannot be estimated. Only if tol > 0.
+            - "profile": dict, the profile from raytrace_mrt_engine.gen_profile with the "read_ply", "voxelize", "tracer", "gen_rays", "project"
+              and "aggregate" stages, None if profile is False.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    if cache is not None:
+        cache_stats(cache, reset=True)
+    prof = gen_profile(trace_memory=trace_memory) if profile else None
+    scene = load_scene(ply_src, vdim, progress=progress, cache=cache, profile=prof, chunk_size=chunk_size,
+                       need_key=intx_method == 'bvh' and bvh_dir is not None)
+    voxels = scene['voxels']
+    with profile_stage(prof, 'tracer', voxels=len(voxels['ijks'])):
+        tracer = gen_tracer(voxels, intx_method=intx_method, bvh_dir=bvh_dir, key=scene['key'])
+    if tol > 0:
+        from .adaptive import calc_grid_mrt_adaptive
+        adapt_res = calc_grid_mrt_adaptive(tracer, voxels['temps'], grid_xyzs, tol=tol, batch_rays=nrays, max_rays=max_rays,
+                                           progress=progress, profile=prof, workers=workers)
+        cache_res = cache_stats(cache, reset=True) if cache is not None else None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            miss_fracs = np.where(adapt_res['nrays'] != 0, 1 - adapt_res['nhits']/adapt_res['nrays'], -999.0)
+        return {'scene': scene, 'grid_xyzs': grid_xyzs, 'trace': adapt_res['trace'], 'mrt': adapt_res['mrt'], 'nhits': adapt_res['nhits'],
+                'cache': cache_res, 'nrays': adapt_res['nrays'], 'miss_frac': miss_fracs, 'stderr': adapt_res['stderr'], 'profile': prof}
+    trace_res = trace_grid(tracer, grid_xyzs, nrays, progress=progress, workers=workers, cache=cache, profile=prof)
+    with profile_stage(prof, 'aggregate', rays=len(trace_res['hit_idxs']), grids=len(grid_xyzs)):
+        agg = aggregate_grid(trace_res, voxels['temps'], len(grid_xyzs))
+    cache_res = cache_stats(cache, reset=True) if cache is not None else None
+    return {'scene': scene, 'grid_xyzs': grid_xyzs, 'trace': trace_res, 'mrt': agg['mrt'], 'nhits': agg['nhits'], 'cache': cache_res,
+            'nrays': agg['nrays'], 'miss_frac': agg['miss_frac'], 'profile': prof}
+
+def read_grid_csv(path: str) -> np.ndarray:
+    """
+    read the grid points from a csv file with a header row and x, y, z columns
+
+    Parameters
+    ----------
+    path: str
+        path of the csv file.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ngrids, 3)]
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    pts = [row[0:3] for row in rows[1:] if len(row) != 0]
+    return np.array(pts).astype(float).reshape(-1, 3)
+
+def write_mrt_csv(path: str, grid_xyzs: np.ndarray, mrts: np.ndarray, nrays: np.ndarray = None, stderrs: np.ndarray = None):
+    """
+    write the mrt of the grid points to a csv file, same format as the csv downloaded from the webapp
+
+    Parameters
+    ----------
+    path: str
+        path of the csv file.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    mrts: np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point.
+
+    nrays: np.ndarray, optional
+        np.ndarray[shape(ngrids)] number of rays cast from each grid point, written as an extra column if given.
+
+    stderrs: np.ndarray, optional
+        np.ndarray[shape(ngrids)] standard error of the mrt of each grid point, written as an extra column if given.
+    """
+    header_str = ['x', 'y', 'z', 'MRT(degC)']
+    cols = [np.round(mrts, 2).tolist()]
+    if nrays is not None:
+        header_str.append('nrays')
+        cols.append(np.asarray(nrays).astype(int).tolist())
+    if stderrs is not None:
+        header_str.append('stderr(degC)')
+        cols.append(np.round(stderrs, 3).tolist())
+    rows = [header_str]
+    for cnt, grid_pt in enumerate(np.asarray(grid_xyzs).tolist()):
+        rows.append([grid_pt[0], grid_pt[1], grid_pt[2]] + [col[cnt] for col in cols])
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+
+def write_mrt_npz(path: str, grid_xyzs: np.ndarray, mrts: np.ndarray, nhits: np.ndarray = None, nrays: np.ndarray = None,
+                  stderrs: np.ndarray = None):
+    """
+    write the mrt of the grid points to a compressed .npz file with a column per array, loaded with read_mrt_npz or np.load without parsing text
+
+    Parameters
+    ----------
+    path: str
+        path of the .npz file.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points, written as float64.
+
+    mrts: np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point, written as float32.
+
+    nhits: np.ndarray, optional
+        np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel, written as int32 if given.
+
+    nrays: np.ndarray, optional
+        np.ndarray[shape(ngrids)] number of rays cast from each grid point, written as int32 if given. With nhits, the miss_frac column is also written.
+
+    stderrs: np.ndarray, optional
+        np.ndarray[shape(ngrids)] standard error of the mrt of each grid point, written as float32 if given.
+    """
+    cols = {'grid_xyzs': np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3), 'mrt': np.asarray(mrts, dtype=np.float32)}
+    if nhits is not None:
+        cols['nhits'] = np.asarray(nhits, dtype=np.int32)
+    if nrays is not None:
+        cols['nrays'] = np.asarray(nrays, dtype=np.int32)
+    if nhits is not None and nrays is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cols['miss_frac'] = np.where(cols['nrays'] != 0, 1 - cols['nhits']/cols['nrays'], -999.0).astype(np.float32)
+    if stderrs is not None:
+        cols['stderr'] = np.asarray(stderrs, dtype=np.float32)
+    np.savez_compressed(path, **cols)
+
+def read_mrt_npz(path: str) -> dict:
+    """
+    read the mrt of the grid points written with write_mrt_npz
+
+    Parameters
+    ----------
+    path: str
+        path of the .npz file.
+
+    Returns
+    -------
+    dict
+        the columns by name, "grid_xyzs" and "mrt" and the optional "nhits", "nrays", "miss_frac" and "stderr".
+    """
+    with np.load(path) as npz:
+        return {key: npz[key] for key in npz.files}
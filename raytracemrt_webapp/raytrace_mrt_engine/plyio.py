@@ -0,0 +1,284 @@
+import io
+import os
+import sys
+from typing import Iterator
+
+import numpy as np
+from numpy.lib import recfunctions
+from plyfile import PlyData
+
+PLY_DTYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2',
+              'ushort': 'u2', 'uint16': 'u2', 'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+              'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+PLY_BYTE_ORDERS = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': '='}
+
+def parse_ply_header(header_bytes: bytes) -> dict:
+    """
+    parse the header of a ply file
+
+    Parameters
+    ----------
+    header_bytes: bytes
+        the start of the ply file, needs to contain the whole header up to end_header.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "format": str, 'ascii', 'binary_little_endian' or 'binary_big_endian'.
+            - "elements": list[dict], each element has a "name", "count" and "props", a list of (name, type), the type is None for list properties.
+            - "header_len": int, number of bytes of the header including the end_header line.
+    """
+    end = header_bytes.find(b'end_header')
+    if not header_bytes.startswith(b'ply') or end == -1:
+        raise ValueError('not a ply file or the header is incomplete')
+    header_len = header_bytes.index(b'\n', end) + 1
+    lines = bytes(header_bytes[:header_len]).decode('ascii').splitlines()
+    fmt = None
+    elements = []
+    for line in lines:
+        words = line.split()
+        if len(words) == 0:
+            continue
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append({'name': words[1], 'count': int(words[2]), 'props': []})
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1]['props'].append((words[-1], None))
+            else:
+                elements[-1]['props'].append((words[2], words[1]))
+    return {'format': fmt, 'elements': elements, 'header_len': header_len}
+
+def _vertex_dtype(header: dict) -> np.dtype:
+    """
+    numpy dtype of the vertex element if the vertex records can be read directly from a binary ply, otherwise None.
+
+    Parameters
+    ----------
+    header: dict
+        the header parsed with parse_ply_header.
+
+    Returns
+    -------
+    np.dtype
+        structured dtype of the vertex element, None if it cannot be read directly.
+    """
+    if header['format'] == 'ascii':
+        return None
+    elements = header['elements']
+    if len(elements) == 0 or elements[0]['name'] != 'vertex':
+        return None
+    props = elements[0]['props']
+    if any(ptype is None for _, ptype in props):
+        return None
+    byte_order = PLY_BYTE_ORDERS[header['format']]
+    return np.dtype([(name, byte_order + PLY_DTYPES[ptype]) for name, ptype in props])
+
+def read_ply_vertex(source: bytes | str) -> np.ndarray:
+    """
+    read the vertex element of a ply file as a structured numpy array without converting the rows to python objects.
+    Binary little/big endian vertex data is viewed directly from the bytes or memory-mapped from the file, ascii ply is parsed with plyfile.
+
+    Parameters
+    ----------
+    source: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(npts)] structured array with a field for each vertex property.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            header = parse_ply_header(_read_header_bytes(f))
+        vx_dtype = _vertex_dtype(header)
+        if vx_dtype is None:
+            return PlyData.read(source)['vertex'].data
+        count = header['elements'][0]['count']
+        if sys.platform == 'emscripten':
+            # no memory mapping on the pyodide virtual file system
+            return np.fromfile(source, dtype=vx_dtype, count=count, offset=header['header_len'])
+        return np.memmap(source, dtype=vx_dtype, mode='c', offset=header['header_len'], shape=(count,))
+
+    buf = memoryview(source).cast('B')
+    header = parse_ply_header(buf[:_header_search_len(buf)].tobytes())
+    vx_dtype = _vertex_dtype(header)
+    if vx_dtype is None:
+        return PlyData.read(io.BytesIO(buf))['vertex'].data
+    count = header['elements'][0]['count']
+    return np.frombuffer(buf, dtype=vx_dtype, count=count, offset=header['header_len'])
+
+def _header_search_len(buf: memoryview) -> int:
+    """
+    number of bytes from the start of the ply containing the whole header.
+
+    Parameters
+    ----------
+    buf: memoryview
+        the content of the ply file.
+
+    Returns
+    -------
+    int
+        number of bytes to pass to parse_ply_header.
+    """
+    search_len = 4096
+    while search_len < len(buf) and buf[:search_len].tobytes().find(b'end_header') == -1:
+        search_len *= 2
+    return min(search_len, len(buf))
+
+def _read_header_bytes(f: io.BufferedReader) -> bytes:
+    """
+    read the start of an opened ply file containing the whole header.
+
+    Parameters
+    ----------
+    f: io.BufferedReader
+        the ply file opened in binary mode.
+
+    Returns
+    -------
+    bytes
+        the bytes to pass to parse_ply_header.
+    """
+    header_bytes = b''
+    while True:
+        chunk = f.read(4096)
+        header_bytes += chunk
+        if len(chunk) == 0 or header_bytes.find(b'end_header') != -1:
+            # make sure the end_header line is complete
+            return header_bytes + f.readline()
+
+def ply_vertex_columns(vertex: np.ndarray, temp_field: str = 'temperature') -> dict:
+    """
+    select the xyzs and temperatures of the ply vertex by the property names. The columns are views of the vertex array whenever possible.
+
+    Parameters
+    ----------
+    vertex: np.ndarray
+        np.ndarray[shape(npts)] structured array from read_ply_vertex.
+
+    temp_field: str, optional
+        name of the temperature property, a ply that stores the temperatures under another name needs it passed explicitly. A ValueError listing the properties
+        of the ply is raised if the vertex has no property with this name. Default = 'temperature'.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "xyzs": np.ndarray[(n_pts, 3)].
+            - "temps": np.ndarray[(n_pts)].
+    """
+    names = vertex.dtype.names
+    if temp_field not in names:
+        raise ValueError(f"the ply vertex has no '{temp_field}' property, properties found: {names}, pass the name of the temperature property as temp_field")
+    xyzs = recfunctions.structured_to_unstructured(vertex[['x', 'y', 'z']], copy=False)
+    temps = vertex[temp_field]
+    return {'xyzs': xyzs, 'temps': temps}
+
+def _ascii_vertex_dtype(header: dict) -> np.dtype:
+    """
+    numpy dtype to parse the vertex lines of an ascii ply with np.loadtxt, None if the vertex element cannot be parsed line by line.
+
+    Parameters
+    ----------
+    header: dict
+        the header parsed with parse_ply_header.
+
+    Returns
+    -------
+    np.dtype
+        structured dtype of the vertex element, None if it cannot be parsed directly.
+    """
+    elements = header['elements']
+    if len(elements) == 0 or elements[0]['name'] != 'vertex':
+        return None
+    props = elements[0]['props']
+    if any(ptype is None for _, ptype in props):
+        return None
+    return np.dtype([(name, PLY_DTYPES[ptype]) for name, ptype in props])
+
+def ply_vertex_count(source: bytes | str) -> int:
+    """
+    number of vertices of a ply file read from the header only
+
+    Parameters
+    ----------
+    source: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    Returns
+    -------
+    int
+        the count of the vertex element, 0 if the ply has no vertex element.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            header = parse_ply_header(_read_header_bytes(f))
+    else:
+        buf = memoryview(source).cast('B')
+        header = parse_ply_header(buf[:_header_search_len(buf)].tobytes())
+    for element in header['elements']:
+        if element['name'] == 'vertex':
+            return element['count']
+    return 0
+
+def iter_ply_vertex_chunks(source: bytes | str, chunk_size: int = 1000000) -> Iterator[np.ndarray]:
+    """
+    read the vertex element of a ply file in chunks of chunk_size vertices, so that only one chunk is in memory at a time.
+    Binary vertex data of a file is read chunk by chunk and viewed without copies from bytes, the vertex lines of an ascii ply are parsed chunk by chunk.
+    A ply the chunks cannot be read from directly, e.g. with list properties in the vertex element, is read whole with read_ply_vertex and sliced.
+
+    Parameters
+    ----------
+    source: bytes | str
+        the content of the ply file as a bytes-like object or the path of the ply file.
+
+    chunk_size: int, optional
+        number of vertices per chunk. Default = 1000000.
+
+    Yields
+    ------
+    np.ndarray
+        np.ndarray[shape(nchunk)] structured array with a field for each vertex property, the last chunk can be shorter.
+    """
+    chunk_size = max(1, int(chunk_size))
+    is_path = isinstance(source, (str, os.PathLike))
+    if is_path:
+        with open(source, 'rb') as f:
+            header = parse_ply_header(_read_header_bytes(f))
+    else:
+        buf = memoryview(source).cast('B')
+        header = parse_ply_header(buf[:_header_search_len(buf)].tobytes())
+    vx_dtype = _vertex_dtype(header)
+    txt_dtype = _ascii_vertex_dtype(header) if header['format'] == 'ascii' else None
+    if vx_dtype is None and txt_dtype is None:
+        vertex = read_ply_vertex(source)
+        for start in range(0, len(vertex), chunk_size):
+            yield vertex[start:start + chunk_size]
+        return
+
+    count = header['elements'][0]['count']
+    if vx_dtype is not None and not is_path:
+        for start in range(0, count, chunk_size):
+            nchunk = min(chunk_size, count - start)
+            yield np.frombuffer(buf, dtype=vx_dtype, count=nchunk, offset=header['header_len'] + start*vx_dtype.itemsize)
+        return
+
+    f = open(source, 'rb') if is_path else io.BytesIO(buf)
+    with f:
+        f.seek(header['header_len'])
+        for start in range(0, count, chunk_size):
+            nchunk = min(chunk_size, count - start)
+            if vx_dtype is not None:
+                chunk = np.frombuffer(f.read(nchunk*vx_dtype.itemsize), dtype=vx_dtype)
+                if len(chunk) != nchunk:
+                    raise ValueError(f"the ply file ends after {start + len(chunk)} of {count} vertices")
+            else:
+                lines = [f.readline() for _ in range(nchunk)]
+                chunk = np.loadtxt(lines, dtype=txt_dtype, ndmin=1)
+            yield chunk
@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import geomie3d
+import numpy as np
+
+@lru_cache(maxsize=16)
+def get_unit_dirs(ndirs: int) -> np.ndarray:
+    """
+    get the directions of the unit sphere used to cast the rays. The directions are generated once for each ndirs and reused.
+
+    Parameters
+    ----------
+    ndirs: int
+        The number of rays for each grid point.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ndirs, 3)] read-only array of the directions, ndirs is rounded up to an even number.
+    """
+    unitball = geomie3d.d4pispace.tgDirs(int(ndirs))
+    dirxs = np.array([[dix.x, dix.y, dix.z] for dix in unitball.getDirList()], dtype=np.float64)
+    dirxs.flags.writeable = False
+    return dirxs
+
+def gen_rays_arr(grid_xyzs: list[list[float]], ndirs: int) -> dict:
+    """
+    generate rays for each mrt point as arrays, same rays as raytrace_mrt_lib.gen_rays without creating a geomie3d.utility.Ray for each ray.
+
+    Parameters
+    ----------
+    grid_xyzs : list[list[float]]
+        list[shape(npts, 3)] the mrt grids to calc the MRT.
+
+    ndirs: int
+        The number of rays for each grid point.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "origs": np.ndarray[shape(npts*ndirs, 3)] the origins of the rays.
+            - "dirxs": np.ndarray[shape(npts*ndirs, 3)] the directions of the rays.
+            - "grid_ids": np.ndarray[shape(npts*ndirs)] index of the grid point of each ray.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    unit_dirs = get_unit_dirs(int(ndirs))
+    ngrids = len(grid_xyzs)
+    nunit = len(unit_dirs)
+    origs = np.repeat(grid_xyzs, nunit, axis=0)
+    dirxs = np.tile(unit_dirs, (ngrids, 1))
+    grid_ids = np.repeat(np.arange(ngrids), nunit)
+    return {'origs': origs, 'dirxs': dirxs, 'grid_ids': grid_ids}
+
+def separate_rays_arr(rays: dict, nparallel: int) -> list[dict]:
+    """
+    separate the rays into roughly list[shape(nparallel, nrays/nparallel)], same as raytrace_mrt_lib.separate_rays for the rays generated by gen_rays_arr.
+    The arrays of each group are views of the arrays of rays, nothing is copied.
+
+    Parameters
+    ----------
+    rays: dict
+        the rays generated from gen_rays_arr.
+
+    nparallel : int
+        the number of groups
+
+    Returns
+    -------
+    list[dict]
+        list[shape(nparallel)] the rays of each group with the same keys as gen_rays_arr.
+    """
+    rays_ls = []
+    nrays = len(rays['origs'])
+    interval = nrays/nparallel
+    for i in range(nparallel):
+        start = int(interval*i)
+        end = int(interval*(i+1))
+        rays_ls.append({key: val[start:end] for key, val in rays.items()})
+    return rays_ls
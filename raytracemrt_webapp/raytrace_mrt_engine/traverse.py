@@ -0,0 +1,155 @@
+import numpy as np
+
+from .intersect import slab_pairs
+
+def gen_voxel_lookup(ijks: np.ndarray, max_dense: int = 16777216) -> dict:
+    """
+    generate a lookup of the occupied voxels of a voxel lattice, the lookup maps an ijk to the index of the voxel.
+
+    Parameters
+    ----------
+    ijks: np.ndarray
+        np.ndarray[shape(nvoxels, 3)] integer ijk of the occupied voxels, as the keys of geomie3d.modify.xyzs2voxs.
+
+    max_dense: int, optional
+        if the lattice has fewer cells than this, a dense table of voxel indices is used, otherwise the sorted linear keys of the occupied cells are searched. Default = 16777216.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "shape": np.ndarray[shape(3)] number of cells of the lattice in i, j, k.
+            - "dense": np.ndarray[shape(ncells)] voxel index of each cell, -1 if empty. None if the lattice is too big.
+            - "keys": np.ndarray[shape(nvoxels)] sorted linear keys of the occupied cells.
+            - "order": np.ndarray[shape(nvoxels)] voxel index of each of the sorted keys.
+    """
+    ijks = np.asarray(ijks, dtype=np.int64).reshape(-1, 3)
+    shape = ijks.max(axis=0) + 1
+    keys = np.ravel_multi_index(ijks.T, shape)
+    ncells = int(np.prod(shape))
+    dense = None
+    if ncells <= max_dense:
+        dense = np.full(ncells, -1, dtype=np.int64)
+        dense[keys] = np.arange(len(ijks))
+    order = np.argsort(keys)
+    keys = keys[order]
+    return {'shape': shape, 'dense': dense, 'keys': keys, 'order': order}
+
+def find_voxels(lookup: dict, ijks: np.ndarray) -> np.ndarray:
+    """
+    find the voxel index of the ijks, the ijks need to be within the lattice.
+
+    Parameters
+    ----------
+    lookup: dict
+        the lookup generated from gen_voxel_lookup.
+
+    ijks: np.ndarray
+        np.ndarray[shape(n, 3)] integer ijks to find.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(n)] voxel index of the ijks, -1 if the cell is empty.
+    """
+    keys = np.ravel_multi_index(ijks.T, lookup['shape'])
+    if lookup['dense'] is not None:
+        return lookup['dense'][keys]
+    sorted_keys = lookup['keys']
+    pos = np.searchsorted(sorted_keys, keys)
+    pos = np.minimum(pos, len(sorted_keys) - 1)
+    found = sorted_keys[pos] == keys
+    return np.where(found, lookup['order'][pos], -1)
+
+def rays_voxels_traverse(origs: np.ndarray, dirxs: np.ndarray, lookup: dict, lattice_orig: list[float],
+                         vx_dim: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    walk the rays through the voxel lattice cell by cell (Amanatides & Woo 3D-DDA) and stop at the first occupied cell.
+    The cost scales with the length of the path through the lattice instead of the number of voxels.
+
+    Parameters
+    ----------
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    lookup: dict
+        the lookup of the occupied voxels generated from gen_voxel_lookup.
+
+    lattice_orig: list[float]
+        list[shape(3)] the min corner of voxel (0,0,0), the min xyz of the points voxelized by geomie3d.modify.xyzs2voxs.
+
+    vx_dim: list[float]
+        list[shape(3)] the x, y, z dimension of a voxel.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the first occupied voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the hit along the ray direction, np.inf if the ray did not hit any voxels.
+    """
+    origs = np.asarray(origs, dtype=np.float64)
+    dirxs = np.asarray(dirxs, dtype=np.float64)
+    lattice_orig = np.asarray(lattice_orig, dtype=np.float64)
+    vx_dim = np.asarray(vx_dim, dtype=np.float64)
+    shape = lookup['shape']
+    nrays = len(origs)
+    hit_idxs = np.full(nrays, -1, dtype=np.int64)
+    hit_dists = np.full(nrays, np.inf)
+    if nrays == 0:
+        return hit_idxs, hit_dists
+    #------------------------------------------------------------------
+    # region: clip the rays to the bounds of the lattice
+    lattice_mn = lattice_orig
+    lattice_mx = lattice_orig + shape * vx_dim
+    enter_true, tnear, tfar = slab_pairs(origs, dirxs, lattice_mn, lattice_mx)
+    parallel = dirxs == 0
+    ray_ids = np.where(enter_true)[0]
+    # endregion: clip the rays to the bounds of the lattice
+    #------------------------------------------------------------------
+    # region: setup the traversal
+    orig = origs[ray_ids]
+    dirx = dirxs[ray_ids]
+    t_enter = np.maximum(tnear[ray_ids], 0.0)
+    entry_pts = orig + dirx * t_enter[:, np.newaxis]
+    ijk = np.floor((entry_pts - lattice_mn) / vx_dim).astype(np.int64)
+    ijk = np.clip(ijk, 0, shape - 1)
+    step = np.sign(dirx).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_delta = np.where(parallel[ray_ids], np.inf, vx_dim / np.abs(dirx))
+        bound = lattice_mn + (ijk + (step > 0)) * vx_dim
+        t_next = np.where(parallel[ray_ids], np.inf, (bound - orig) / dirx)
+    # endregion: setup the traversal
+    #------------------------------------------------------------------
+    # region: walk the lattice
+    while len(ray_ids) != 0:
+        vx_ids = find_voxels(lookup, ijk)
+        hit_true = vx_ids != -1
+        if hit_true.any():
+            # rays starting inside an occupied voxel hit it where they exit, same as the slab test
+            t_exit = t_next[hit_true].min(axis=1)
+            t_hit = np.where(t_enter[hit_true] > 0, t_enter[hit_true], t_exit)
+            hit_ids = ray_ids[hit_true]
+            hit_idxs[hit_ids] = vx_ids[hit_true]
+            hit_dists[hit_ids] = t_hit
+        # step into the next cell along the axis with the nearest boundary
+        axis = np.argmin(t_next, axis=1)
+        nrows = np.arange(len(ray_ids))
+        t_enter = t_next[nrows, axis]
+        ijk[nrows, axis] += step[nrows, axis]
+        t_next[nrows, axis] += t_delta[nrows, axis]
+        in_lattice = np.logical_and(ijk >= 0, ijk < shape).all(axis=1)
+        cont_true = np.logical_and(np.logical_not(hit_true), in_lattice)
+        cont_true = np.logical_and(cont_true, np.isfinite(t_enter))
+        ray_ids = ray_ids[cont_true]
+        ijk = ijk[cont_true]
+        step = step[cont_true]
+        t_enter = t_enter[cont_true]
+        t_next = t_next[cont_true]
+        t_delta = t_delta[cont_true]
+    # endregion: walk the lattice
+    return hit_idxs, hit_dists
@@ -0,0 +1,200 @@
+from typing import Callable
+
+import numpy as np
+
+from .traverse import gen_voxel_lookup, find_voxels
+from .plyio import read_ply_vertex, ply_vertex_columns
+
+def gen_view_matrix(trace_res: dict, voxels: dict, grid_xyzs: np.ndarray) -> dict:
+    """
+    convert the rays traced from the grid points into a sparse grid point x voxel matrix of the fraction of the hits of each grid point on each voxel.
+    The geometry is traced once, the mrt of any temperatures on the same voxels is then one sparse matrix-vector product, see view_matrix_mrt.
+
+    Parameters
+    ----------
+    trace_res: dict
+        the result of raytrace_mrt_engine.trace_grid.
+
+    voxels: dict
+        the voxels the rays are traced onto, generated with raytrace_mrt_engine.voxelize.
+
+    grid_xyzs: np.ndarray
+        np.ndarray[shape(ngrids, 3)] the grid points.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "indptr": np.ndarray[shape(ngrids + 1)] the rows of the csr matrix, the entries of grid point i are indptr[i]:indptr[i+1].
+            - "indices": np.ndarray[shape(nnz)] the voxel index of each entry.
+            - "data": np.ndarray[shape(nnz)] the fraction of the hits of the grid point on the voxel, each row with hits sums to 1.
+            - "nhits": np.ndarray[shape(ngrids)] number of rays of each grid point that hit a voxel.
+            - "nrays": np.ndarray[shape(ngrids)] number of rays cast from each grid point.
+            - "grid_xyzs": np.ndarray[shape(ngrids, 3)] the grid points.
+            - "vdim": float, dimension of a voxel in meters.
+            - "lattice_orig": np.ndarray[shape(3)] the min corner of voxel (0,0,0).
+            - "ijks": np.ndarray[shape(nvoxels, 3)] integer ijk of the voxels.
+    """
+    grid_xyzs = np.asarray(grid_xyzs, dtype=np.float64).reshape(-1, 3)
+    ngrids = len(grid_xyzs)
+    ijks = np.asarray(voxels['ijks'], dtype=np.int64).reshape(-1, 3)
+    nvox = len(ijks)
+    hit_idxs = np.asarray(trace_res['hit_idxs'])
+    grid_ids = np.asarray(trace_res['grid_ids'])
+    is_hit = hit_idxs != -1
+    # count the hits of each (grid point, voxel) pair, the sorted unique pair keys are already in csr order
+    pair_keys = grid_ids[is_hit].astype(np.int64) * nvox + hit_idxs[is_hit]
+    uniq_keys, counts = np.unique(pair_keys, return_counts=True)
+    rows = uniq_keys // nvox
+    indices = uniq_keys % nvox
+    nhits = np.bincount(grid_ids[is_hit], minlength=ngrids)
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=ngrids))))
+    data = counts/nhits[rows]
+    return {'indptr': indptr, 'indices': indices, 'data': data, 'nhits': nhits,
+            'nrays': np.bincount(grid_ids, minlength=ngrids), 'grid_xyzs': grid_xyzs, 'vdim': float(voxels['voxel_dim'][0]),
+            'lattice_orig': np.asarray(voxels['lattice_orig'], dtype=np.float64), 'ijks': ijks}
+
+def save_view_matrix(path: str, vmat: dict):
+    """
+    save the view matrix to a compressed .npz file
+
+    Parameters
+    ----------
+    path: str
+        path of the .npz file.
+
+    vmat: dict
+        the view matrix generated with gen_view_matrix.
+    """
+    np.savez_compressed(path, **vmat)
+
+def load_view_matrix(path: str) -> dict:
+    """
+    load a view matrix saved with save_view_matrix
+
+    Parameters
+    ----------
+    path: str
+        path of the .npz file.
+
+    Returns
+    -------
+    dict
+        the view matrix with the keys of gen_view_matrix.
+    """
+    with np.load(path) as npz:
+        vmat = {key: npz[key] for key in npz.files}
+    vmat['vdim'] = float(vmat['vdim'])
+    return vmat
+
+def frame_voxel_temps(vmat: dict, xyzs: np.ndarray, temps: np.ndarray, lookup: dict = None) -> np.ndarray:
+    """
+    aggregate the temperatures of a new frame of the same space onto the voxels of the view matrix.
+
+    Parameters
+    ----------
+    vmat: dict
+        the view matrix generated with gen_view_matrix.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, 3)] the points of the frame.
+
+    temps: np.ndarray
+        np.ndarray[shape(npts)] the temperature of each point.
+
+    lookup: dict, optional
+        the lookup of the ijks of the view matrix generated with gen_voxel_lookup, pass it in to reuse it over the frames. Default = None, generated here.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nvoxels)] mean temperature of the points in each voxel, nan if the frame has no points in the voxel.
+        Points outside the voxels of the view matrix are ignored.
+    """
+    xyzs = np.asarray(xyzs, dtype=np.float64).reshape(-1, 3)
+    temps = np.asarray(temps, dtype=np.float64)
+    ijks = vmat['ijks']
+    nvox = len(ijks)
+    if lookup is None:
+        lookup = gen_voxel_lookup(ijks)
+    pt_ijks = np.floor((xyzs - vmat['lattice_orig'])/vmat['vdim']).astype(np.int64)
+    inside = np.all((pt_ijks >= 0) & (pt_ijks < lookup['shape']), axis=1)
+    pt_vx_ids = np.full(len(xyzs), -1, dtype=np.int64)
+    pt_vx_ids[inside] = find_voxels(lookup, pt_ijks[inside])
+    is_vox = pt_vx_ids != -1
+    counts = np.bincount(pt_vx_ids[is_vox], minlength=nvox)
+    temp_sums = np.bincount(pt_vx_ids[is_vox], weights=temps[is_vox], minlength=nvox)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return temp_sums/counts
+
+def view_matrix_mrt(vmat: dict, vx_temps: np.ndarray, radiant: bool = False) -> np.ndarray:
+    """
+    calculate the mrt of the grid points from the temperatures of the voxels with one sparse matrix-vector product
+
+    Parameters
+    ----------
+    vmat: dict
+        the view matrix generated with gen_view_matrix.
+
+    vx_temps: np.ndarray
+        np.ndarray[shape(nvoxels)] temperature of each voxel in degC, voxels with nan are left out and the hit fractions of the rest are renormalized.
+
+    radiant: bool, optional
+        if True, average the temperatures in kelvin to the 4th power and take the 4th root, otherwise the arithmetic mean as calc_grid_mrt. Default = False.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ngrids)] mrt of each grid point, -999 if the grid point do not see any temperatures.
+    """
+    vx_temps = np.asarray(vx_temps, dtype=np.float64)
+    indptr = vmat['indptr']
+    ngrids = len(indptr) - 1
+    rows = np.repeat(np.arange(ngrids), np.diff(indptr))
+    hit_temps = vx_temps[vmat['indices']]
+    valid = np.logical_not(np.isnan(hit_temps))
+    if radiant:
+        hit_temps = (hit_temps + 273.15)**4
+    weights = vmat['data'][valid]
+    wsums = np.bincount(rows[valid], weights=weights, minlength=ngrids)
+    temp_sums = np.bincount(rows[valid], weights=weights*hit_temps[valid], minlength=ngrids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mrts = temp_sums/wsums
+    if radiant:
+        mrts = mrts**0.25 - 273.15
+    return np.where(wsums > 0, mrts, -999.0)
+
+def calc_frames_mrt(vmat: dict, ply_srcs: list, radiant: bool = False, progress: Callable[[str], None] = None) -> np.ndarray:
+    """
+    calculate the mrt of the grid points of the view matrix for each frame of a time series of ply files of the same space
+
+    Parameters
+    ----------
+    vmat: dict
+        the view matrix generated with gen_view_matrix.
+
+    ply_srcs: list
+        the frames, the content of each ply file as a bytes-like object or the path of the ply file.
+
+    radiant: bool, optional
+        see view_matrix_mrt. Default = False.
+
+    progress: Callable[[str], None], optional
+        function called with a message after each frame.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nframes, ngrids)] mrt of each grid point in each frame, -999 if the grid point do not see any temperatures.
+    """
+    nframes = len(ply_srcs)
+    mrts = np.full((nframes, len(vmat['indptr']) - 1), -999.0)
+    # the voxels are the same in every frame
+    lookup = gen_voxel_lookup(vmat['ijks'])
+    for cnt, ply_src in enumerate(ply_srcs):
+        plydata = ply_vertex_columns(read_ply_vertex(ply_src))
+        vx_temps = frame_voxel_temps(vmat, plydata['xyzs'], plydata['temps'], lookup=lookup)
+        mrts[cnt] = view_matrix_mrt(vmat, vx_temps, radiant=radiant)
+        if progress is not None:
+            progress(f"Frame {cnt + 1}/{nframes} done")
+    return mrts
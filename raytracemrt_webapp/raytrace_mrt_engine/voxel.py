@@ -0,0 +1,231 @@
+import math
+from typing import Callable, Iterator
+
+import numpy as np
+
+def voxelize(xyzs: np.ndarray, temps: np.ndarray, vdim: float, stats: list[str] = None) -> dict:
+    """
+    group the points into a 3d voxel grid and aggregate the temperatures of each voxel. Same voxels as geomie3d.modify.xyzs2voxs,
+    computed with array reductions instead of a dictionary entry for each voxel.
+
+    Parameters
+    ----------
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, 3)] the points to voxelize.
+
+    temps: np.ndarray
+        np.ndarray[shape(npts)] the temperature of each point.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    stats: list[str], optional
+        extra statistics of the temperatures to compute, any of 'min', 'max', 'std'. Default = None.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "voxel_dim": list[shape(3)] the x, y, z dimension of a voxel.
+            - "lattice_orig": np.ndarray[shape(3)] the min corner of voxel (0,0,0).
+            - "ijks": np.ndarray[shape(nvoxels, 3)] integer ijk of the voxels, ordered by the first point in each voxel.
+            - "midpts": np.ndarray[shape(nvoxels, 3)] the midpts of the voxels.
+            - "counts": np.ndarray[shape(nvoxels)] number of points in each voxel.
+            - "temp_sums": np.ndarray[shape(nvoxels)] sum of the temperatures of each voxel.
+            - "temps": np.ndarray[shape(nvoxels)] mean temperature of each voxel.
+            - "pt_vx_ids": np.ndarray[shape(npts)] index of the voxel of each point.
+            - "temp_mins", "temp_maxs", "temp_stds": np.ndarray[shape(nvoxels)] only when requested in stats.
+    """
+    if stats is None:
+        stats = []
+    xyzs = np.asarray(xyzs, dtype=np.float64).reshape(-1, 3)
+    temps = np.asarray(temps, dtype=np.float64)
+    vx_dim = [vdim, vdim, vdim]
+    lattice_orig = np.amin(xyzs, axis=0)
+    pt_ijks = np.fix((xyzs - lattice_orig)/np.array(vx_dim)).astype(np.int64)
+    shape = pt_ijks.max(axis=0) + 1
+    keys = np.ravel_multi_index(pt_ijks.T, shape)
+    _, first_idxs, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # number the voxels in the order their first point appears, same as xyzs2voxs
+    order = np.argsort(first_idxs, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    pt_vx_ids = rank[inverse.reshape(-1)]
+    ijks = pt_ijks[first_idxs[order]]
+    midpts = ijks * np.array(vx_dim) + np.array(vx_dim)/2 + lattice_orig
+
+    nvox = len(ijks)
+    counts = np.bincount(pt_vx_ids, minlength=nvox)
+    temp_sums = np.bincount(pt_vx_ids, weights=temps, minlength=nvox)
+    mean_temps = temp_sums/counts
+    vox_props = {'voxel_dim': vx_dim, 'lattice_orig': lattice_orig, 'ijks': ijks, 'midpts': midpts,
+                 'counts': counts, 'temp_sums': temp_sums, 'temps': mean_temps, 'pt_vx_ids': pt_vx_ids}
+    if 'min' in stats or 'max' in stats:
+        pt_order = np.argsort(pt_vx_ids, kind='stable')
+        sorted_temps = temps[pt_order]
+        starts = np.cumsum(counts) - counts
+        if 'min' in stats:
+            vox_props['temp_mins'] = np.minimum.reduceat(sorted_temps, starts)
+        if 'max' in stats:
+            vox_props['temp_maxs'] = np.maximum.reduceat(sorted_temps, starts)
+    if 'std' in stats:
+        sq_devs = (temps - mean_temps[pt_vx_ids])**2
+        vox_props['temp_stds'] = np.sqrt(np.bincount(pt_vx_ids, weights=sq_devs, minlength=nvox)/counts)
+    return vox_props
+
+def voxelize_chunks(read_chunks: Callable[[], Iterator[tuple[np.ndarray, np.ndarray]]], vdim: float, nsample: int = 0) -> dict:
+    """
+    voxelize points read in chunks without holding all the points in memory, the voxels are the same as voxelize.
+    The chunks are read twice, once for the bounds of the lattice and once to reduce the points of each chunk to sparse per-voxel counts and temperature sums
+    that are merged with _merge_voxel_parts, so the memory is bounded by the number of voxels and the size of a chunk instead of the number of points.
+
+    Parameters
+    ----------
+    read_chunks: Callable[[], Iterator[tuple[np.ndarray, np.ndarray]]]
+        function returning a new iterator over the chunks of the points, each a tuple of the xyzs np.ndarray[shape(nchunk, 3)] and temps np.ndarray[shape(nchunk)].
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    nsample: int, optional
+        keep about nsample points evenly spread over the points, e.g. for display. Default = 0, no points are kept.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the keys of voxelize except "pt_vx_ids", and:
+            - "npts": int, number of points.
+            - "sample_xyzs": np.ndarray[shape(nkept, 3)] the kept points.
+            - "sample_temps": np.ndarray[shape(nkept)] the temperatures of the kept points.
+    """
+    vx_dim = [vdim, vdim, vdim]
+    #------------------------------------------------------------------
+    # region: first pass for the bounds of the lattice
+    mns = np.full(3, np.inf)
+    mxs = np.full(3, -np.inf)
+    npts = 0
+    for xyzs, _ in read_chunks():
+        xyzs = np.asarray(xyzs, dtype=np.float64).reshape(-1, 3)
+        if len(xyzs) == 0:
+            continue
+        mns = np.minimum(mns, xyzs.min(axis=0))
+        mxs = np.maximum(mxs, xyzs.max(axis=0))
+        npts += len(xyzs)
+    if npts == 0:
+        raise ValueError('there are no points to voxelize')
+    lattice_orig = mns
+    shape = np.fix((mxs - lattice_orig)/np.array(vx_dim)).astype(np.int64) + 1
+    # endregion: first pass for the bounds of the lattice
+    #------------------------------------------------------------------
+    # region: second pass to accumulate the voxels
+    # the sparse per-voxel sums of each chunk are kept as parts and merged into the accumulator once they are as many voxels as it holds,
+    # so each voxel is merged a logarithmic number of times instead of the accumulator being copied for every chunk
+    acc = None
+    parts = []
+    npending = 0
+    stride = max(1, math.ceil(npts/nsample)) if nsample > 0 else 0
+    sample_xyzs = []
+    sample_temps = []
+    offset = 0
+    for xyzs, temps in read_chunks():
+        xyzs = np.asarray(xyzs, dtype=np.float64).reshape(-1, 3)
+        temps = np.asarray(temps, dtype=np.float64)
+        if len(xyzs) == 0:
+            continue
+        pt_ijks = np.fix((xyzs - lattice_orig)/np.array(vx_dim)).astype(np.int64)
+        keys = np.ravel_multi_index(pt_ijks.T, shape)
+        ch_keys, ch_firsts, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        ch_counts = np.bincount(inverse, minlength=len(ch_keys))
+        ch_sums = np.bincount(inverse, weights=temps, minlength=len(ch_keys))
+        parts.append((ch_keys, ch_counts, ch_sums, ch_firsts + offset))
+        npending += len(ch_keys)
+        if acc is None or npending >= len(acc[0]):
+            acc = _merge_voxel_parts(parts if acc is None else [acc] + parts)
+            parts = []
+            npending = 0
+        if stride > 0:
+            keep = np.arange(-offset % stride, len(xyzs), stride)
+            sample_xyzs.append(xyzs[keep])
+            sample_temps.append(temps[keep])
+        offset += len(xyzs)
+    if parts:
+        acc = _merge_voxel_parts([acc] + parts)
+    acc_keys, acc_counts, acc_sums, acc_firsts = acc
+    # endregion: second pass to accumulate the voxels
+    #------------------------------------------------------------------
+    order = np.argsort(acc_firsts, kind='stable')
+    ijks = np.column_stack(np.unravel_index(acc_keys[order], shape)).astype(np.int64)
+    midpts = ijks * np.array(vx_dim) + np.array(vx_dim)/2 + lattice_orig
+    counts = acc_counts[order]
+    temp_sums = acc_sums[order]
+    return {'voxel_dim': vx_dim, 'lattice_orig': lattice_orig, 'ijks': ijks, 'midpts': midpts,
+            'counts': counts, 'temp_sums': temp_sums, 'temps': temp_sums/counts, 'npts': npts,
+            'sample_xyzs': np.concatenate(sample_xyzs) if sample_xyzs else np.empty((0, 3)),
+            'sample_temps': np.concatenate(sample_temps) if sample_temps else np.empty(0)}
+
+def _merge_voxel_parts(parts: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    merge the sparse per-voxel sums of chunks of points into one, see voxelize_chunks.
+
+    Parameters
+    ----------
+    parts: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]
+        the keys, counts, temperature sums and index of the first point of the voxels of each part, the parts in the order of their points.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        the keys, counts, temperature sums and index of the first point of the merged voxels, sorted by the key.
+    """
+    keys = np.concatenate([part[0] for part in parts])
+    # the first occurrence of a key is in the earliest part, which has the first point of the voxel
+    mrg_keys, first_pos, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, weights=np.concatenate([part[1] for part in parts]), minlength=len(mrg_keys)).astype(np.int64)
+    sums = np.bincount(inverse, weights=np.concatenate([part[2] for part in parts]), minlength=len(mrg_keys))
+    firsts = np.concatenate([part[3] for part in parts])[first_pos]
+    return mrg_keys, counts, sums, firsts
+
+def pack_voxels(voxels: dict) -> np.ndarray:
+    """
+    pack the voxel arrays needed for the ray tracing into a single flat float64 array, so they can be copied once into a shared buffer and broadcast to other workers.
+
+    Parameters
+    ----------
+    voxels: dict
+        the voxels generated with voxelize.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(3 + nvoxels*7)] the lattice_orig, midpts, ijks and temps of the voxels one after another.
+    """
+    return np.concatenate((np.asarray(voxels['lattice_orig'], dtype=np.float64).ravel(),
+                           np.asarray(voxels['midpts'], dtype=np.float64).ravel(),
+                           np.asarray(voxels['ijks'], dtype=np.float64).ravel(),
+                           np.asarray(voxels['temps'], dtype=np.float64).ravel()))
+
+def unpack_voxels(packed: np.ndarray, vdim: float) -> dict:
+    """
+    unpack the voxel arrays packed with pack_voxels. The midpts and temps are views of the packed array.
+
+    Parameters
+    ----------
+    packed: np.ndarray
+        np.ndarray[shape(3 + nvoxels*7)] the array from pack_voxels.
+
+    vdim: float
+        dimension of a voxel in meters.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the "voxel_dim", "lattice_orig", "ijks", "midpts" and "temps" of voxelize.
+    """
+    packed = np.asarray(packed, dtype=np.float64)
+    nvox = (len(packed) - 3)//7
+    midpts = packed[3:3 + nvox*3].reshape(nvox, 3)
+    ijks = packed[3 + nvox*3:3 + nvox*6].reshape(nvox, 3).astype(np.int64)
+    temps = packed[3 + nvox*6:]
+    return {'voxel_dim': [vdim, vdim, vdim], 'lattice_orig': packed[:3], 'ijks': ijks, 'midpts': midpts, 'temps': temps}
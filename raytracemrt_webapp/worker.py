@@ -1,13 +1,30 @@
 import io
 import csv
 
-import geomie3d
 import numpy as np
 
-from raytrace_mrt_lib import separate_rays, gen_rays
-from pyscript_3dapp_lib.utils import read_csv_web, convertxyz2zxy, read_ply_web, get_cam_place_from_xyzs
+from raytrace_mrt_engine import load_scene, gen_tracer, ray_ends, iter_grid_mrt, iter_grid_mrt_adaptive, pack_voxels, unpack_voxels, gen_cache, cache_stats, gen_profile, profile_stage, calc_adaptive_grid, ply_vertex_count, gen_point_lod
+from pyscript_3dapp_lib.utils import read_csv_web, convertxyz2zxy, get_cam_place_from_xyzs
 from pyscript import sync
 
+# bvh of the voxel models are kept here and reused when the same ply is voxelized with the same vdim
+BVH_CACHE_DIR = './bvh_cache'
+# the tracer of the voxels broadcast to this worker of the pool and the temperatures of the voxels
+TRACER = None
+VX_TEMPS = None
+# the worker is kept alive across submissions, the key and method of the loaded tracer are kept to skip the work when they are reused
+TRACER_ID = None
+# the parsed points, voxels and traced rays of the grid points are cached across submissions, only what changed is recomputed
+CACHE_MAX_BYTES = 268435456
+CACHE = gen_cache(CACHE_MAX_BYTES)
+# point clouds with more points than STREAM_MIN_PTS are read and voxelized in chunks of STREAM_CHUNK_PTS points, only DISPLAY_PTS of their points are kept for get_cloud
+STREAM_MIN_PTS = 2000000
+STREAM_CHUNK_PTS = 500000
+DISPLAY_PTS = 1000000
+# the point cloud of the last scene and the rays of the last calculation, fetched on demand by the main script
+CLOUD = None
+LAST_RAYS = None
+
 def process_grid_data(csv_rows: list[list]) -> list[list]:
     """
     read csv file for webapp
@@ -20,36 +37,136 @@ def process_grid_data(csv_rows: list[list]) -> list[list]:
     Returns
     -------
     list[list]
-        list[shape(ngrid_pts, 3)]
+        list[shape(ngrid_pts, 3)], only the x, y, z columns are read so a csv of the mrt results can be used as a grid
     """
-    pts = csv_rows[1:]
+    pts = [row[0:3] for row in csv_rows[1:] if len(row) != 0]
     pts_arr = np.array(pts)
     pts_arr = pts_arr.astype(float).tolist()
     return pts_arr
     
-def process_plydata(plydata: np.ndarray) -> dict:
+def grid_ray_ends(trace_res: dict, grid_id: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    get the intersection points and the end points of the missed rays of a grid point
+
+    Parameters
+    ----------
+    trace_res: dict
+        the result of raytrace_mrt_engine.trace_grid.
+
+    grid_id: int
+        index of the grid point in the traced grid points.
+
+    Returns
+    -------
+    intxs : np.ndarray
+        np.ndarray[shape(nhits, 3)] intersection points of the grid point.
+
+    ms_ends : np.ndarray
+        np.ndarray[shape(nmiss, 3)] end points of the rays that did not hit any voxels.
+    """
+    ray_ids = np.flatnonzero(trace_res['grid_ids'] == grid_id)
+    grid_rays = {key: trace_res[key][ray_ids] for key in ['origs', 'dirxs', 'hit_idxs', 'hit_dists']}
+    is_hit = grid_rays['hit_idxs'] != -1
+    end_xyzs = ray_ends(grid_rays)
+    return end_xyzs[is_hit], end_xyzs[np.logical_not(is_hit)]
+
+def stream_chunk_size(ply_bytes: bytes) -> int | None:
+    """
+    number of points per chunk to read the ply with, so that large point clouds are voxelized without running the worker out of memory
+
+    Parameters
+    ----------
+    ply_bytes: bytes
+        the content of the ply file.
+
+    Returns
+    -------
+    int | None
+        STREAM_CHUNK_PTS if the ply has more than STREAM_MIN_PTS points, otherwise None and the ply is read at once.
+    """
+    if ply_vertex_count(ply_bytes) > STREAM_MIN_PTS:
+        return STREAM_CHUNK_PTS
+    return None
+
+def scene_payload(scene: dict, grid_pts: list[list[float]]) -> dict:
+    """
+    keep the point cloud of the scene in the worker for get_cloud and pack the data needed by the main script into float32 buffers
+
+    Parameters
+    ----------
+    scene: dict
+        the scene from raytrace_mrt_engine.load_scene.
+
+    grid_pts: list[list[float]]
+        list[shape(ngrids, 3)] the grid points.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "midpts": np.ndarray[shape(nvoxels*3)] float32 flat midpts of the voxels in zxy.
+            - "temps": np.ndarray[shape(nvoxels)] float32 temperature of the voxels.
+            - "cam": np.ndarray[shape(6)] float32 flat camera position and look at position in zxy.
+            - "grid_xyzs": np.ndarray[shape(ngrids*3)] float64 flat grid points in xyz, kept in float64 for the csv of the results.
+            - "npts": int, number of points of the point cloud, fetched with get_cloud.
+    """
+    global CLOUD
+    CLOUD = {'xyzs': scene['xyzs'], 'temps': scene['temps']}
+    vxres_dict = scene['voxels']
+    midpts = vxres_dict['midpts']
+    cam_place = get_cam_place_from_xyzs(midpts, zoom_out_val = 5)
+    return {'midpts': np.asarray(convertxyz2zxy(midpts), dtype=np.float32).ravel(), 'temps': vxres_dict['temps'].astype(np.float32),
+            'cam': np.asarray(convertxyz2zxy(cam_place), dtype=np.float32).ravel(), 'grid_xyzs': np.asarray(grid_pts, dtype=np.float64).ravel(),
+            'npts': len(scene['xyzs'])}
+
+def get_cloud() -> dict:
     """
-    separate the plydata into xyzs and temperatures
+    get the point cloud of the last scene, fetched by the main script only when the point cloud is visualized.
+    The points are sorted into levels of detail with raytrace_mrt_engine.gen_point_lod, so the main script only draws the first points of the order.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "pts": np.ndarray[shape(npts*3)] float32 flat points in zxy, sorted by level of detail.
+            - "temps": np.ndarray[shape(npts)] float32 temperatures of the points.
+            - "level_ends": np.ndarray[shape(nlevels)] int32 number of points up to and including each level.
+            - "spacings": np.ndarray[shape(nlevels)] float32 spacing of the points of each level.
+            - "center": np.ndarray[shape(3)] float32 center of the points in zxy.
+            - "radius": float, half the diagonal of the bounding box of the points.
+    """
+    if 'lod' not in CLOUD:
+        CLOUD['lod'] = gen_point_lod(CLOUD['xyzs'])
+    lod = CLOUD['lod']
+    order = lod['order']
+    xyzs = np.asarray(CLOUD['xyzs'])[order]
+    return {'pts': np.asarray(convertxyz2zxy(xyzs), dtype=np.float32).ravel(), 'temps': np.asarray(CLOUD['temps'], dtype=np.float32)[order],
+            'level_ends': lod['level_ends'].astype(np.int32), 'spacings': lod['spacings'].astype(np.float32),
+            'center': np.asarray(convertxyz2zxy(lod['center'][np.newaxis, :]), dtype=np.float32).ravel(), 'radius': lod['radius']}
+
+def get_grid_rays(grid_id: int) -> dict:
+    """
+    get the rays of a grid point of the last calculation, fetched by the main script only when the rays are visualized
 
     Parameters
     ----------
-    plydata: np.ndarray
-        np.ndarray[shape(n_pts, n_attributes)] 
+    grid_id: int
+        index of the grid point in the grid points traced by this worker.
 
     Returns
     -------
     dict
         A dictionary containing:
-            - "xyzs": np.ndarray[(n_pts, 3)].
-            - "temps": np.ndarray[(n_pts)].
+            - "rays": np.ndarray[shape(nhits*3)] float32 flat intersection points in xyz.
+            - "miss_rays": np.ndarray[shape(nmiss*3)] float32 flat end points of the rays that did not hit any voxels in xyz.
     """
-    temps = plydata[:, 3]
-    vertices = plydata[:, 0:3]
-    return {'xyzs': vertices, 'temps': temps}
+    intxs, ms_ends = grid_ray_ends(LAST_RAYS, grid_id)
+    return {'rays': np.asarray(intxs, dtype=np.float32).ravel(), 'miss_rays': np.asarray(ms_ends, dtype=np.float32).ravel()}
 
-def calc_mrt(ply_bytes: bytes, grid_bytes: bytes, vdim: float, nrays: int) -> dict:
+def prepare_scene(ply_bytes: bytes, grid_bytes: bytes, vdim: float, trace_memory: bool = False) -> dict:
     """
-    calc mrt
+    voxelize the point cloud and read the grid points once for the pool of workers, the voxels are packed into a flat array to be broadcast to the other workers.
+    The parsed points and voxels are cached in the worker and reused if the same ply is submitted again.
 
     Parameters
     ----------
@@ -62,156 +179,213 @@ def calc_mrt(ply_bytes: bytes, grid_bytes: bytes, vdim: float, nrays: int) -> di
     vdim: float
         dimesion of a voxel in meters.
 
+    trace_memory: bool, optional
+        if True, trace the peak memory of each stage in the profile, which slows down the calculation. Default = False.
+
+    Returns
+    -------
+    dict
+        the buffers of scene_payload with the additional keys:
+            - "voxels": np.ndarray[shape(3 + nvoxels*7)] the voxels packed with raytrace_mrt_engine.pack_voxels.
+            - "key": str, key of the voxel model for the bvh cache.
+            - "cache": dict, hits and misses of the cache of this worker from raytrace_mrt_engine.cache_stats.
+            - "profile": dict, the "read_ply", "voxelize", "read_csv" and "pack_voxels" stages from raytrace_mrt_engine.gen_profile.
+    """
+    ply_bytes = ply_bytes.to_py()
+    cache_stats(CACHE, reset=True)
+    profile = gen_profile(trace_memory=trace_memory)
+    scene = load_scene(ply_bytes, vdim, progress=sync.change_dialog_text, cache=CACHE, profile=profile,
+                       chunk_size=stream_chunk_size(ply_bytes), nsample=DISPLAY_PTS)
+    sync.change_dialog_text('Reading CSV file ...')
+    with profile_stage(profile, 'read_csv') as counters:
+        csv_rows = read_csv_web(grid_bytes)
+        grid_pts = process_grid_data(csv_rows)
+        counters['grids'] = len(grid_pts)
+    payload = scene_payload(scene, grid_pts)
+    with profile_stage(profile, 'pack_voxels', voxels=len(scene['voxels']['ijks'])):
+        packed = pack_voxels(scene['voxels'])
+    payload.update({'voxels': packed, 'key': scene['key'], 'cache': cache_stats(CACHE, reset=True), 'profile': profile})
+    return payload
+
+def load_voxels(voxel_buf, vdim: float, key: str, intx_method: str = 'slab', trace_memory: bool = False) -> dict:
+    """
+    load the voxels broadcast from prepare_scene and generate the tracer of this worker. Nothing is done if the worker already holds the tracer of the same voxels.
+
+    Parameters
+    ----------
+    voxel_buf: Float64Array
+        JS Float64Array of the packed voxels, a view of a SharedArrayBuffer when the page is cross-origin isolated. Copied into the worker with .to_py() function.
+
+    vdim: float
+        dimesion of a voxel in meters.
+
+    key: str
+        key of the voxel model for the bvh cache.
+
+    intx_method: str, optional
+        method used to intersect the rays with the voxels. 'slab' tests the rays against every voxel with the array based engine in raytrace_mrt_engine, 'dda' walks the rays through the occupied cells of the voxel lattice, 'bvh' traverses a bvh of the voxels cached in BVH_CACHE_DIR. Default = 'slab'.
+
+    trace_memory: bool, optional
+        if True, trace the peak memory of each stage in the profile, which slows down the calculation. Default = False.
+
+    Returns
+    -------
+    dict
+        the profile from raytrace_mrt_engine.gen_profile with the "tracer" stage, no stages if the tracer is reused.
+    """
+    global TRACER, VX_TEMPS, TRACER_ID
+    profile = gen_profile(trace_memory=trace_memory)
+    if TRACER_ID == (key, intx_method):
+        return profile
+    with profile_stage(profile, 'tracer') as counters:
+        packed = np.frombuffer(voxel_buf.to_py(), dtype=np.float64)
+        voxels = unpack_voxels(packed, vdim)
+        TRACER = gen_tracer(voxels, intx_method=intx_method, bvh_dir=BVH_CACHE_DIR, key=key)
+        counters['voxels'] = len(voxels['ijks'])
+    VX_TEMPS = voxels['temps']
+    TRACER_ID = (key, intx_method)
+    return profile
+
+def concat_traces(traces: list[dict]) -> dict:
+    """
+    concatenate the traces of the batches of a shard
+
+    Parameters
+    ----------
+    traces: list[dict]
+        the traces of the batches from raytrace_mrt_engine.iter_grid_mrt with the grid_ids offset to the index in the shard.
+
+    Returns
+    -------
+    dict
+        the trace of all the batches with the keys of raytrace_mrt_engine.trace_grid.
+    """
+    if len(traces) == 0:
+        return {'origs': np.zeros((0, 3)), 'dirxs': np.zeros((0, 3)), 'grid_ids': np.zeros(0, dtype=np.int64),
+                'hit_idxs': np.zeros(0, dtype=np.int64), 'hit_dists': np.zeros(0)}
+    return {key: np.concatenate([trace[key] for trace in traces]) for key in ['origs', 'dirxs', 'grid_ids', 'hit_idxs', 'hit_dists']}
+
+def trace_grid_shard(grid_xyzs: list[list[float]], nrays: int, progress_id: int = 0, tol: float = 0, max_rays: int = 2000,
+                     trace_memory: bool = False) -> dict:
+    """
+    cast the rays of a shard of the grid points onto the voxels loaded with load_voxels batch by batch.
+    The mrts of each batch are streamed to the main script with sync.report_partial, the shard is stopped between batches when it returns False.
+
+    Parameters
+    ----------
+    grid_xyzs: list[list[float]]
+        JS array[shape(ngrids, 3)] the grid points of the shard. Need to be converted to python with .to_py() function.
+
+    nrays: int
+        number of rays to cast per grid point, the number of rays of each round if tol > 0.
+
+    progress_id: int, optional
+        id of the worker passed back to sync.report_partial with the results of each batch. Default = 0.
+
+    tol: float, optional
+        if > 0, the rays are cast in rounds until the standard error of the mrt of each grid point is <= tol in degC,
+        see raytrace_mrt_engine.iter_grid_mrt_adaptive. Default = 0, nrays per grid point.
+
+    max_rays: int, optional
+        if tol > 0, maximum number of rays per grid point. Default = 2000.
+
+    trace_memory: bool, optional
+        if True, trace the peak memory of each stage in the profile, which slows down the calculation. Default = False.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+            - "mrt": np.ndarray[shape(ngrids)] float32 mrt of each grid point of the shard, -999 if the grid point do not see any temperatures, nan if it is not calculated because the shard was cancelled. The rays are kept in the worker for get_grid_rays.
+            - "nrays": np.ndarray[shape(ngrids)] int32 number of rays cast from each grid point, 0 if it is not calculated.
+            - "nhits": np.ndarray[shape(ngrids)] int32 number of rays of each grid point that hit a voxel.
+            - "stderr": np.ndarray[shape(ngrids)] float32 standard error of the mrt of each grid point if tol > 0, -999 if it cannot be estimated, nan otherwise.
+            - "ndone": int, number of grid points calculated.
+            - "cancelled": bool, True if the shard was cancelled.
+            - "cache": dict, hits and misses of the cache of this worker from raytrace_mrt_engine.cache_stats.
+            - "profile": dict, the "gen_rays", "project" and "aggregate" stages of the shard from raytrace_mrt_engine.gen_profile.
+    """
+    global LAST_RAYS
+    grid_xyzs = grid_xyzs.to_py()
+    ngrids = len(grid_xyzs)
+    cache_stats(CACHE, reset=True)
+    profile = gen_profile(trace_memory=trace_memory)
+    mrts = np.full(ngrids, np.nan, dtype=np.float32)
+    ngrid_rays = np.zeros(ngrids, dtype=np.int32)
+    nhits = np.zeros(ngrids, dtype=np.int32)
+    stderrs = np.full(ngrids, np.nan, dtype=np.float32)
+    traces = []
+    ndone = 0
+    cancelled = False
+    if tol > 0:
+        batches = iter_grid_mrt_adaptive(TRACER, VX_TEMPS, grid_xyzs, tol=tol, batch_rays=nrays, max_rays=max_rays, profile=profile)
+    else:
+        batches = iter_grid_mrt(TRACER, VX_TEMPS, grid_xyzs, nrays, cache=CACHE, profile=profile)
+    for batch in batches:
+        grid_ids = batch['grid_ids']
+        mrts[grid_ids] = batch['mrt']
+        nhits[grid_ids] = batch['nhits']
+        trace_res = batch['trace']
+        if tol > 0:
+            # the rounds trace all the grid points still running, the grid_ids are already indices into the shard
+            ngrid_rays[grid_ids] = batch['nrays']
+            stderrs[grid_ids] = batch['stderr']
+        elif len(grid_ids) != 0:
+            ngrid_rays[grid_ids] = len(trace_res['origs'])//len(grid_ids)
+            trace_res['grid_ids'] = trace_res['grid_ids'] + grid_ids[0]
+        traces.append(trace_res)
+        ndone = batch['ndone']
+        keep_going = sync.report_partial(progress_id, grid_ids.astype(np.int32), batch['mrt'].astype(np.float32), batch['msg'])
+        if not keep_going:
+            cancelled = ndone < ngrids
+            break
+    LAST_RAYS = concat_traces(traces)
+    return {'mrt': mrts, 'nrays': ngrid_rays, 'nhits': nhits, 'stderr': stderrs, 'ndone': ndone, 'cancelled': cancelled, 'cache': cache_stats(CACHE, reset=True),
+            'profile': profile}
+
+def gen_grid(ply_bytes: bytes, vdim: float, height: float, spacing: float, threshold: float, max_depth: int, nrays: int) -> dict:
+    """
+    generate a grid over the floor of the voxel model refined where the mrt is steep, see raytrace_mrt_engine.gen_adaptive_grid
+
+    Parameters
+    ----------
+    ply_bytes: bytes
+        JS bytes from the file specified. Need to be converted to python with .to_py() function.
+
+    vdim: float
+        dimesion of a voxel in meters.
+
+    height: float
+        height of the grid in meters.
+
+    spacing: float
+        coarse spacing of the grid in meters.
+
+    threshold: float
+        a cell is split when the mrts at its corners differ by more than the threshold in degC.
+
+    max_depth: int
+        maximum number of times a coarse cell is split.
+
     nrays: int
         number of rays to cast per grid point.
-        
+
     Returns
     -------
-    flatten_mesh_xyzs : np.ndarray
-        np.ndarray[shape(ntri * 3 * 3)]
-    """
-    #------------------------------------------------------------------
-    # region: read ply file
-    sync.change_dialog_text('Reading PLY file ...')
-    plydata = read_ply_web(ply_bytes)
-    plydata = process_plydata(plydata)
-    ply_xyzs = plydata['xyzs']
-    ply_temps = plydata['temps']
-    # endregion: read ply file
-    #------------------------------------------------------------------
-    # region: convert ply pts to voxels
-    sync.change_dialog_text('Convert PLY pts to voxels ...')
-    vxres_dict = geomie3d.modify.xyzs2voxs(ply_xyzs, vdim, vdim, vdim)
-    #convert the voxels to bboxes
-    vxs = vxres_dict['voxels']
-    vx_dim = vxres_dict['voxel_dim']
-    ijks = vxs.keys()
-    nijk = len(ijks)
-    midpts = []
-    avg_temps = []
-    atts = []
-    xdims = np.array([vx_dim[0]])
-    xdims = np.repeat(xdims, nijk)
-    ydims = np.array([vx_dim[1]])
-    ydims = np.repeat(ydims, nijk)
-    zdims = np.array([vx_dim[2]])
-    zdims = np.repeat(zdims, nijk)
-    sync.change_dialog_text('Convert voxels to bounding boxes ...')
-    for ijk in ijks:
-        vx = vxs[ijk]
-        midpt = vx['midpt']
-        midpt = list(map(float, midpt))
-        idxs = vx['idx']
-        sel_temps = np.take(ply_temps, idxs)
-        avg_temp = float(np.mean(sel_temps))
-        att = {'idx': vx['idx'], 'ijk': ijk, 'midpt':midpt, 'temperature': avg_temp}
-        avg_temps.append(avg_temp)
-        midpts.append(midpt)
-        atts.append(att)
-    bbx_ls = geomie3d.create.bboxes_frm_midpts(midpts, xdims, ydims, zdims, attributes_list = atts)
-    # endregion: read ply file
-    #------------------------------------------------------------------
-    # region: read csv file and convert them into rays for projection
-    sync.change_dialog_text('Reading CSV file and generating rays ...')
-    csv_rows = read_csv_web(grid_bytes)
-    grid_pts = process_grid_data(csv_rows)
-    ngrids = len(grid_pts)
-    rays = gen_rays(grid_pts, nrays)
-
-    aloop = 1000000#30
-    nbbox = len(bbx_ls)
-    ndir = len(rays)
-    ttl = ndir*nbbox
-    nparallel = int(ttl/aloop)
-    
-    if nparallel != 0:
-        rays_ls = separate_rays(rays, nparallel)
-    else:
-        rays_ls = [rays]
-    # endregion: read csv file and convert them into rays for projection
-    #------------------------------------------------------------------
-    # region: project the rays onto the bboxes
-    sync.change_dialog_text('Projecting ray onto bboxes ...')
-    ttl_k = int(ttl/1000)
-    proj_rays = []
-    ms_rays = []
-    rcnt = 0
-    for rays1 in rays_ls:
-        rcnt += len(rays1)
-        percentage = int((rcnt*nbbox)/ttl * 100)
-        hrs, mrs, hbs, mbs = geomie3d.calculate.rays_bboxes_intersect(rays1, bbx_ls)
-        nhr = len(hrs)
-        nmr = len(mrs)
-        msg = f"Projecting {ndir} ray onto {nbbox} Voxels ... \n{percentage}% of {ttl_k}k calculations completed"
-        msg += f"\n{nhr} rays intersection, {nmr} rays did not hit any voxels"
-        sync.change_dialog_text(msg)
-        proj_rays.extend(hrs)
-        ms_rays.extend(mrs)
-    # endregion: project the rays onto the bboxes
-    #------------------------------------------------------------------
-    # region: process the raytracing results
-    grid_temps = []
-    for _ in range(ngrids):
-        grid_temps.append([])
-
-    grid_intxs = []
-    for _ in range(ngrids):
-        grid_intxs.append([])
-
-    grid_ms_rays = []
-    for _ in range(ngrids):
-        grid_ms_rays.append([])
-    
-    for proj_ray in proj_rays:
-        grid_id = proj_ray.attributes['grid_id']
-        intx_att = proj_ray.attributes['rays_bboxes_intersection']
-        hit_bbxs = intx_att['hit_bbox']
-        if len(hit_bbxs) == 1:
-            if 'temperature' in hit_bbxs[0].attributes:
-                intxs = intx_att['intersection']
-                temp = hit_bbxs[0].attributes['temperature']
-                grid_temps[grid_id].append(temp)
-                grid_intxs[grid_id].extend(intxs)
-        else:
-            ijks = [hb.attributes['ijk'] for hb in hit_bbxs]
-            unq = np.unique(ijks, axis=0)
-            if len(unq) == 1:
-                intxs = intx_att['intersection']
-                temp = hit_bbxs[0].attributes['temperature']
-                grid_temps[grid_id].append(temp)
-                grid_intxs[grid_id].extend(intxs)
-            else:
-                print('not sure what is happening please debug')
-
-    for ms_ray in ms_rays:
-        grid_id = ms_ray.attributes['grid_id']
-        orig = ms_ray.origin
-        dirx = ms_ray.dirx
-        mv_xyzs = geomie3d.calculate.move_xyzs([orig], [dirx], [5])
-        grid_ms_rays[grid_id].extend(mv_xyzs)
-
-    mrt_ls = []
-    for gcnt,gt in enumerate(grid_temps):
-        if len(gt) != 0:
-            avg = sum(gt)/len(gt)
-            mrt_ls.append(avg)
-        else:
-            print(f"grid pt {gcnt} do not see any temperatures")
-            mrt_ls.append(-999)
-
-    # endregion: process the raytracing results
-    #------------------------------------------------------------------
-    # region: prepare data to return to main script
-    cam_place = get_cam_place_from_xyzs(midpts, zoom_out_val = 5)
-    cam_place_zxy = convertxyz2zxy(cam_place) 
-    midpts_zxy = convertxyz2zxy(midpts)
-    grid_pts_zxy = convertxyz2zxy(grid_pts)
-    ply_zxy = convertxyz2zxy(ply_xyzs)
-    ply_zxy = ply_zxy.flatten()
-    # grid_intxs_zxy = convertxyz2zxy(grid_intxs)
-    return {'midpts': midpts_zxy, 'temps': avg_temps, 'mrt': mrt_ls, 'cam': cam_place_zxy, 'grid': grid_pts_zxy, 'pts': ply_zxy, 
-            'pts_temp': ply_temps, 'rays': grid_intxs, 'miss_rays': grid_ms_rays}
-    # endregion: prepare data to return to main script
-    #------------------------------------------------------------------
-
-sync.calc_mrt = calc_mrt
\ No newline at end of file
+    dict
+        A dictionary containing:
+            - "grid_xyzs": np.ndarray[shape(ngrids*3)] float64 flat grid points in xyz.
+            - "mrt": np.ndarray[shape(ngrids)] float32 mrt of each grid point, -999 if the grid point do not see any temperatures.
+            - "nuniform": int, number of grid points of a uniform grid at the finest spacing.
+    """
+    ply_bytes = ply_bytes.to_py()
+    res = calc_adaptive_grid(ply_bytes, vdim, height, spacing, threshold=threshold, max_depth=int(max_depth), nrays=nrays,
+                             progress=sync.change_dialog_text, cache=CACHE, chunk_size=stream_chunk_size(ply_bytes))
+    return {'grid_xyzs': res['grid_xyzs'].ravel(), 'mrt': res['mrt'].astype(np.float32), 'nuniform': res['nuniform']}
+
+sync.prepare_scene = prepare_scene
+sync.load_voxels = load_voxels
+sync.trace_grid_shard = trace_grid_shard
+sync.get_cloud = get_cloud
+sync.get_grid_rays = get_grid_rays
+sync.gen_grid = gen_grid
\ No newline at end of file
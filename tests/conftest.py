@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+import plyfile
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBAPP_DIR = os.path.join(ROOT_DIR, 'raytracemrt_webapp')
+EXAMPLE_DIR = os.path.join(ROOT_DIR, 'examples', 'simple_example')
+# the engine is imported the same way as the webapp imports it, from the webapp directory
+sys.path.insert(0, WEBAPP_DIR)
+
+@pytest.fixture(scope='session')
+def example_ply() -> str:
+    """
+    path of the point cloud of the simple example
+    """
+    return os.path.join(EXAMPLE_DIR, 'SoLo_Therm_08-08-2025_13-51-50_LWpointCloud_13k_projected.ply')
+
+@pytest.fixture(scope='session')
+def example_grid() -> str:
+    """
+    path of the mrt grid of the simple example
+    """
+    return os.path.join(EXAMPLE_DIR, 'mrt_grid.csv')
+
+@pytest.fixture(scope='session')
+def example_grid_xyzs(example_grid: str) -> np.ndarray:
+    """
+    np.ndarray[shape(ngrids, 3)] the grid points of the simple example
+    """
+    return np.loadtxt(example_grid, delimiter=',', skiprows=1, ndmin=2)
+
+@pytest.fixture(scope='session')
+def example_cloud(example_ply: str) -> dict:
+    """
+    the "xyzs" and "temps" of the points of the simple example as float64 arrays, read with plyfile as the webapp did before the engine
+    """
+    vertex = plyfile.PlyData.read(example_ply)['vertex']
+    xyzs = np.column_stack([vertex['x'], vertex['y'], vertex['z']]).astype(np.float64)
+    return {'xyzs': xyzs, 'temps': np.asarray(vertex['temperature'], dtype=np.float64)}
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import get_unit_dirs, load_scene, gen_tracer, calc_grid_mrt_adaptive, calc_mrt_arr
+
+VDIM = 0.3
+BATCH_RAYS = 20
+MAX_RAYS = 200
+
+@pytest.fixture(scope='module')
+def example_scene(example_ply: str) -> dict:
+    scene = load_scene(example_ply, VDIM)
+    scene['tracer'] = gen_tracer(scene['voxels'])
+    return scene
+
+@pytest.mark.parametrize('tol', [0.05, 0.5])
+def test_adaptive_stopping(example_scene: dict, example_grid_xyzs: np.ndarray, tol: float):
+    vx_temps = example_scene['voxels']['temps']
+    res = calc_grid_mrt_adaptive(example_scene['tracer'], vx_temps, example_grid_xyzs, tol=tol, batch_rays=BATCH_RAYS, max_rays=MAX_RAYS)
+    nunit = len(get_unit_dirs(BATCH_RAYS))
+    assert np.all(res['nrays'] % nunit == 0)
+    assert np.all(res['nrays'] <= MAX_RAYS)
+    # a grid point stops when its standard error is within tol or when another round would pass max_rays
+    converged = (res['nhits'] >= 10) & (res['stderr'] >= 0) & (res['stderr'] <= tol)
+    assert np.all(converged | (res['nrays'] + nunit > MAX_RAYS))
+    # and not a round earlier, the grid points stopped in the first round converged
+    assert np.all(converged[res['nrays'] == nunit])
+    trace = res['trace']
+    for grid_id in range(len(example_grid_xyzs)):
+        is_grid = trace['grid_ids'] == grid_id
+        assert np.count_nonzero(is_grid) == res['nrays'][grid_id]
+        hit_temps = vx_temps[trace['hit_idxs'][is_grid & (trace['hit_idxs'] != -1)]]
+        assert len(hit_temps) == res['nhits'][grid_id]
+        np.testing.assert_allclose(res['mrt'][grid_id], hit_temps.mean())
+        np.testing.assert_allclose(res['stderr'][grid_id], hit_temps.std(ddof=1)/np.sqrt(len(hit_temps)))
+
+def test_adaptive_tolerance_sets_rays(example_scene: dict, example_grid_xyzs: np.ndarray):
+    vx_temps = example_scene['voxels']['temps']
+    loose = calc_grid_mrt_adaptive(example_scene['tracer'], vx_temps, example_grid_xyzs, tol=0.5, batch_rays=BATCH_RAYS, max_rays=MAX_RAYS)
+    tight = calc_grid_mrt_adaptive(example_scene['tracer'], vx_temps, example_grid_xyzs, tol=0.05, batch_rays=BATCH_RAYS, max_rays=MAX_RAYS)
+    assert np.all(tight['nrays'] >= loose['nrays'])
+    assert tight['nrays'].sum() > loose['nrays'].sum()
+
+def test_adaptive_workers_match_serial(example_scene: dict, example_grid_xyzs: np.ndarray):
+    vx_temps = example_scene['voxels']['temps']
+    serial = calc_grid_mrt_adaptive(example_scene['tracer'], vx_temps, example_grid_xyzs, tol=0.1, batch_rays=BATCH_RAYS, max_rays=MAX_RAYS)
+    sharded = calc_grid_mrt_adaptive(example_scene['tracer'], vx_temps, example_grid_xyzs, tol=0.1, batch_rays=BATCH_RAYS, max_rays=MAX_RAYS,
+                                     workers=3)
+    for key in ['mrt', 'nhits', 'nrays', 'stderr']:
+        np.testing.assert_array_equal(sharded[key], serial[key])
+
+def test_calc_mrt_arr_adaptive(example_ply: str, example_grid_xyzs: np.ndarray, example_scene: dict):
+    res = calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, BATCH_RAYS, tol=0.1, max_rays=MAX_RAYS)
+    adapt_res = calc_grid_mrt_adaptive(example_scene['tracer'], example_scene['voxels']['temps'], example_grid_xyzs, tol=0.1,
+                                       batch_rays=BATCH_RAYS, max_rays=MAX_RAYS)
+    for key in ['mrt', 'nhits', 'nrays', 'stderr']:
+        np.testing.assert_array_equal(res[key], adapt_res[key])
@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import get_unit_dirs, read_mrt_npz
+from raytrace_mrt_engine.batch import read_manifest, plan_tasks, run_batch, JOB_DEFAULTS
+from raytrace_mrt_engine.__main__ import main
+
+def write_json_manifest(path, jobs: list[dict]) -> str:
+    """
+    write the jobs to a json manifest and return its path
+    """
+    path.write_text(json.dumps({'jobs': jobs}), encoding='utf-8')
+    return str(path)
+
+def gen_jobs(example_ply: str, example_grid: str, nok: int = 2, nmissing: int = 0) -> list[dict]:
+    """
+    nok jobs of the simple example and nmissing jobs with a ply that does not exist, the outputs are relative to the manifest
+    """
+    jobs = [{'name': f"ok{cnt}", 'ply': example_ply, 'grid': example_grid, 'vdim': 0.3, 'nrays': 20 + cnt, 'out': f"out/ok{cnt}.csv"}
+            for cnt in range(nok)]
+    jobs += [{'name': f"missing{cnt}", 'ply': 'missing.ply', 'grid': example_grid, 'vdim': 0.3, 'nrays': 20, 'out': f"out/missing{cnt}.csv"}
+             for cnt in range(nmissing)]
+    return jobs
+
+def test_read_manifest_json(tmp_path, example_ply: str, example_grid: str):
+    jobs = read_manifest(write_json_manifest(tmp_path / 'jobs.json', gen_jobs(example_ply, example_grid, nmissing=1)))
+    assert [job['name'] for job in jobs] == ['ok0', 'ok1', 'missing0']
+    assert [job['index'] for job in jobs] == [0, 1, 2]
+    # relative paths are relative to the manifest
+    assert jobs[0]['out'] == str(tmp_path / 'out' / 'ok0.csv')
+    assert jobs[2]['ply'] == str(tmp_path / 'missing.ply')
+    assert jobs[0]['ply'] == example_ply
+    for key, val in JOB_DEFAULTS.items():
+        if key != 'name':
+            assert jobs[0][key] == val
+
+def test_read_manifest_csv(tmp_path, example_ply: str, example_grid: str):
+    path = tmp_path / 'jobs.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ply', 'grid', 'vdim', 'nrays', 'out', 'method', 'tol', 'npz'])
+        writer.writerow([example_ply, example_grid, '0.2', '30', 'a.csv', 'dda', '', 'yes'])
+        writer.writerow([])
+        writer.writerow([example_ply, example_grid, '0.1', '40', 'b.csv', '', '0.5', ''])
+    jobs = read_manifest(str(path))
+    assert len(jobs) == 2
+    assert (jobs[0]['name'], jobs[0]['vdim'], jobs[0]['nrays'], jobs[0]['method'], jobs[0]['tol'], jobs[0]['npz']) == ('job0', 0.2, 30, 'dda', 0.0, True)
+    assert (jobs[1]['name'], jobs[1]['vdim'], jobs[1]['nrays'], jobs[1]['method'], jobs[1]['tol'], jobs[1]['npz']) == ('job1', 0.1, 40, 'slab', 0.5, False)
+
+def test_read_manifest_errors(tmp_path, example_ply: str, example_grid: str):
+    job = gen_jobs(example_ply, example_grid, nok=1)[0]
+    del job['nrays']
+    with pytest.raises(ValueError, match='missing'):
+        read_manifest(write_json_manifest(tmp_path / 'missing.json', [job]))
+    job = dict(gen_jobs(example_ply, example_grid, nok=1)[0], method='raymarch')
+    with pytest.raises(ValueError, match='unknown method'):
+        read_manifest(write_json_manifest(tmp_path / 'method.json', [job]))
+
+def test_plan_tasks(tmp_path, example_ply: str, example_grid: str):
+    jobs = read_manifest(write_json_manifest(tmp_path / 'jobs.json', gen_jobs(example_ply, example_grid, nok=4, nmissing=2)))
+    # the jobs of a ply stay in one task with one process
+    tasks = plan_tasks(jobs, 1)
+    assert [[job['name'] for job in task] for task in tasks] == [['ok0', 'ok1', 'ok2', 'ok3'], ['missing0', 'missing1']]
+    # and are split to keep more processes busy, the biggest task first
+    tasks = plan_tasks(jobs, 6)
+    assert sorted(len(task) for task in tasks) == [1, 1, 1, 1, 1, 1]
+    assert tasks[-1][0]['name'].startswith('missing')
+    for task in plan_tasks(jobs, 3):
+        assert len({job['ply'] for job in task}) == 1
+
+@pytest.mark.parametrize('max_procs', [1, 2])
+def test_run_batch_records_errors(tmp_path, example_ply: str, example_grid: str, max_procs: int):
+    jobs = read_manifest(write_json_manifest(tmp_path / 'jobs.json', gen_jobs(example_ply, example_grid, nok=2, nmissing=1)))
+    msgs = []
+    batch_res = run_batch(jobs, max_procs=max_procs, progress=msgs.append)
+    assert (batch_res['nok'], batch_res['nfailed']) == (2, 1)
+    assert len(msgs) == 3
+    recs = batch_res['jobs']
+    assert [rec['name'] for rec in recs] == ['ok0', 'ok1', 'missing0']
+    assert [rec['status'] for rec in recs] == ['ok', 'ok', 'error']
+    assert recs[2]['error'].startswith('FileNotFoundError')
+    assert recs[0]['ngrids'] == 16
+    assert recs[1]['nrays'] == 16 * len(get_unit_dirs(21))
+    for rec in recs[:2]:
+        assert os.path.exists(rec['out'])
+    assert not os.path.exists(recs[2]['out'])
+
+def test_run_batch_shared_cache(tmp_path, example_ply: str, example_grid: str):
+    jobs = read_manifest(write_json_manifest(tmp_path / 'jobs.json', gen_jobs(example_ply, example_grid, nok=2)))
+    batch_res = run_batch(jobs, max_procs=1)
+    # the jobs of the same ply run in one task, the second job reuses the parsed points and voxels
+    assert batch_res['ntasks'] == 1
+    assert batch_res['jobs'][1]['cache'].get('voxels') == 1
+    assert batch_res['jobs'][1]['cache_skipped'] == {}
+    # with a budget too small for the points they are not cached and reported as skipped
+    batch_res = run_batch(jobs, max_procs=1, cache_bytes=1000)
+    assert batch_res['jobs'][1]['cache'] == {}
+    assert 'cloud' in batch_res['jobs'][1]['cache_skipped']
+
+def test_main_batch_exit_code(tmp_path, example_ply: str, example_grid: str, capsys):
+    report = tmp_path / 'report.json'
+    manifest = write_json_manifest(tmp_path / 'ok.json', gen_jobs(example_ply, example_grid, nok=1))
+    main(['batch', manifest, '--procs', '1', '--report', str(report)])
+    assert json.loads(report.read_text(encoding='utf-8'))['nfailed'] == 0
+    manifest = write_json_manifest(tmp_path / 'failing.json', gen_jobs(example_ply, example_grid, nok=1, nmissing=1))
+    with pytest.raises(SystemExit) as exc_info:
+        main(['batch', manifest, '--procs', '1'])
+    assert exc_info.value.code == 1
+    assert 'missing0\terror' in capsys.readouterr().out
+    mrt_rows = np.loadtxt(tmp_path / 'out' / 'ok0.csv', delimiter=',', skiprows=1)
+    assert len(mrt_rows) == 16
+
+def test_run_batch_npz(tmp_path, example_ply: str, example_grid: str):
+    jobs = [dict(job, npz=True) for job in gen_jobs(example_ply, example_grid, nok=1)]
+    jobs = read_manifest(write_json_manifest(tmp_path / 'jobs.json', jobs))
+    assert run_batch(jobs, max_procs=1)['nok'] == 1
+    mrt_rows = np.loadtxt(tmp_path / 'out' / 'ok0.csv', delimiter=',', skiprows=1)
+    res = read_mrt_npz(str(tmp_path / 'out' / 'ok0.npz'))
+    np.testing.assert_allclose(mrt_rows[:, 3], np.round(res['mrt'], 2), atol=1e-4)
+    np.testing.assert_array_equal(res['nrays'], len(get_unit_dirs(20)))
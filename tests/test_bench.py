@@ -0,0 +1,28 @@
+import json
+
+import numpy as np
+
+from raytrace_mrt_engine import read_ply_vertex, ply_vertex_columns
+from raytrace_mrt_engine.bench import STAGES, gen_synthetic_scene, gen_ply_bytes, run_bench, format_bench, write_bench_json
+
+def test_gen_ply_bytes():
+    xyzs, temps = gen_synthetic_scene(1000)
+    cols = ply_vertex_columns(read_ply_vertex(gen_ply_bytes(xyzs, temps)))
+    np.testing.assert_allclose(cols['xyzs'], xyzs, atol=1e-5)
+    np.testing.assert_allclose(cols['temps'], temps, atol=1e-4)
+
+def test_run_bench(tmp_path):
+    bench_res = run_bench(scales=['xs'])
+    assert [case['name'] for case in bench_res['cases']] == ['simple_example', 'xs']
+    ref_case, xs_case = bench_res['cases']
+    assert (ref_case['ngrids'], ref_case['npts']) == (16, 12991)
+    assert (xs_case['npts'], xs_case['ngrids']) == (10000, 1)
+    for case in bench_res['cases']:
+        assert set(STAGES) <= set(case['stages'])
+        assert case['rays_per_s'] > 0
+    table = format_bench(bench_res).splitlines()
+    assert len(table) == 3
+    assert table[1].startswith('simple_example\t')
+    path = tmp_path / 'bench.json'
+    write_bench_json(str(path), bench_res)
+    assert len(json.loads(path.read_text(encoding='utf-8'))['cases']) == 2
@@ -0,0 +1,80 @@
+import numpy as np
+
+from raytrace_mrt_engine import gen_cache, cache_get, cache_put, cache_stats, calc_mrt_arr
+from raytrace_mrt_engine.cache import value_nbytes
+
+def test_value_nbytes():
+    arr = np.zeros(10)
+    assert value_nbytes(arr) == 80
+    assert value_nbytes({'a': arr, 'b': [arr, (np.zeros(4, dtype=np.int32), 'name')], 'c': 1.0}) == 80 + 80 + 16
+    assert value_nbytes('name') == 0
+
+def test_cache_get_put():
+    cache = gen_cache(1000)
+    arr = np.arange(10.0)
+    assert cache_get(cache, 'voxels', 'a') is None
+    cache_put(cache, 'voxels', 'a', arr)
+    assert cache_get(cache, 'voxels', 'a') is arr
+    # the same key of another kind is another entry
+    assert cache_get(cache, 'trace', 'a') is None
+    stats = cache_stats(cache)
+    assert stats['hits'] == {'voxels': 1}
+    assert stats['misses'] == {'voxels': 1, 'trace': 1}
+    assert stats['nentries'] == 1
+    assert stats['nbytes'] == 80
+
+def test_cache_eviction_lru():
+    cache = gen_cache(250)
+    for key in 'abc':
+        cache_put(cache, 'trace', key, np.zeros(10))
+    # a is the least recently put, using it makes b the least recently used
+    assert cache_get(cache, 'trace', 'a') is not None
+    cache_put(cache, 'trace', 'd', np.zeros(10))
+    assert cache_get(cache, 'trace', 'b') is None
+    for key in 'acd':
+        assert cache_get(cache, 'trace', key) is not None
+    assert cache_stats(cache)['nbytes'] == 240
+    # a large value evicts as many entries as needed
+    cache_put(cache, 'trace', 'e', np.zeros(25))
+    stats = cache_stats(cache)
+    assert stats['nentries'] == 1
+    assert stats['nbytes'] == 200
+    assert cache_get(cache, 'trace', 'e') is not None
+
+def test_cache_replace_accounting():
+    cache = gen_cache(1000)
+    cache_put(cache, 'voxels', 'a', np.zeros(10))
+    cache_put(cache, 'voxels', 'a', np.zeros(20))
+    stats = cache_stats(cache)
+    assert stats['nentries'] == 1
+    assert stats['nbytes'] == 160
+    assert cache['nbytes'] == sum(size for _, size in cache['entries'].values())
+
+def test_cache_skipped():
+    cache = gen_cache(100)
+    cache_put(cache, 'cloud', 'a', np.zeros(8))
+    cache_put(cache, 'cloud', 'b', np.zeros(20))
+    # the value larger than the budget is not cached and does not evict the others
+    assert cache_get(cache, 'cloud', 'b') is None
+    assert cache_get(cache, 'cloud', 'a') is not None
+    stats = cache_stats(cache, reset=True)
+    assert stats['skipped'] == {'cloud': 1}
+    assert stats['nbytes'] == 64
+    stats = cache_stats(cache)
+    assert stats['skipped'] == {}
+    assert stats['hits'] == {}
+    assert stats['misses'] == {}
+    assert stats['nentries'] == 1
+
+def test_calc_mrt_arr_cache(example_ply: str, example_grid_xyzs: np.ndarray):
+    cache = gen_cache()
+    first = calc_mrt_arr(example_ply, example_grid_xyzs, 0.3, 50, cache=cache)
+    second = calc_mrt_arr(example_ply, example_grid_xyzs, 0.3, 50, cache=cache)
+    ngrids = len(example_grid_xyzs)
+    # the trace is cached per grid point
+    assert first['cache']['hits'] == {}
+    assert first['cache']['misses'] == {'cloud': 1, 'voxels': 1, 'trace': ngrids}
+    assert second['cache']['hits'] == {'cloud': 1, 'voxels': 1, 'trace': ngrids}
+    assert second['cache']['misses'] == {}
+    np.testing.assert_array_equal(second['mrt'], first['mrt'])
+    assert cache_stats(cache)['nbytes'] == sum(size for _, size in cache['entries'].values())
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import load_scene, gen_tracer, trace_grid, calc_grid_mrt, floor_extent, gen_adaptive_grid, calc_adaptive_grid
+
+VDIM = 0.3
+NRAYS = 20
+HEIGHT = 1.0
+SPACING = 1.0
+MARGIN = 0.2
+
+@pytest.fixture(scope='module')
+def example_scene(example_ply: str) -> dict:
+    scene = load_scene(example_ply, VDIM)
+    scene['tracer'] = gen_tracer(scene['voxels'], intx_method='dda')
+    return scene
+
+def _gen_grid(example_scene: dict, threshold: float, max_depth: int) -> dict:
+    voxels = example_scene['voxels']
+    return gen_adaptive_grid(example_scene['tracer'], voxels['temps'], voxels, HEIGHT, SPACING, threshold=threshold, max_depth=max_depth,
+                             nrays=NRAYS, margin=MARGIN)
+
+def test_adaptive_grid_coarse(example_scene: dict):
+    # nothing is steeper than the threshold, the grid stays at the coarse spacing
+    res = _gen_grid(example_scene, 1000.0, 2)
+    xmin, xmax, ymin, ymax = floor_extent(example_scene['voxels'], margin=MARGIN)
+    nx = max(1, int(round((xmax - xmin)/SPACING)))
+    ny = max(1, int(round((ymax - ymin)/SPACING)))
+    assert len(res['grid_xyzs']) == (nx + 1)*(ny + 1)
+    assert res['ncells'] == nx*ny
+    assert res['nuniform'] == (nx*4 + 1)*(ny*4 + 1)
+    assert np.all(res['levels'] == 0)
+    np.testing.assert_allclose(res['grid_xyzs'][:, 0].min(), xmin)
+    np.testing.assert_allclose(res['grid_xyzs'][:, 0].max(), xmax)
+    np.testing.assert_allclose(res['grid_xyzs'][:, 1].min(), ymin)
+    np.testing.assert_allclose(res['grid_xyzs'][:, 1].max(), ymax)
+
+def test_adaptive_grid_refines(example_scene: dict):
+    coarse = _gen_grid(example_scene, 1000.0, 2)
+    res = _gen_grid(example_scene, 0.2, 2)
+    grid_xyzs = res['grid_xyzs']
+    # the coarse grid comes first, the new corners of each level after it
+    np.testing.assert_allclose(grid_xyzs[0:len(coarse['grid_xyzs'])], coarse['grid_xyzs'])
+    assert np.all(np.diff(res['levels']) >= 0)
+    assert res['levels'].max() > 0
+    assert len(grid_xyzs) < res['nuniform']
+    assert res['ncells'] > coarse['ncells']
+    assert len(np.unique(grid_xyzs, axis=0)) == len(grid_xyzs)
+    np.testing.assert_allclose(grid_xyzs[:, 2], HEIGHT)
+    # the mrt of each grid point is the same as tracing it on its own
+    mrts, _ = calc_grid_mrt(trace_grid(example_scene['tracer'], grid_xyzs, NRAYS), example_scene['voxels']['temps'], len(grid_xyzs))
+    np.testing.assert_allclose(res['mrt'], mrts)
+
+def test_calc_adaptive_grid_bvh(tmp_path, example_ply: str, example_scene: dict):
+    bvh_dir = str(tmp_path / 'bvh')
+    res = calc_adaptive_grid(example_ply, VDIM, HEIGHT, SPACING, threshold=1000.0, max_depth=2, nrays=NRAYS, intx_method='bvh',
+                             bvh_dir=bvh_dir, margin=MARGIN)
+    assert os.listdir(bvh_dir) == [f"{res['scene']['key']}.npz"]
+    np.testing.assert_allclose(res['grid_xyzs'], _gen_grid(example_scene, 1000.0, 2)['grid_xyzs'])
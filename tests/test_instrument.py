@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import gen_profile, profile_stage, add_stage, format_profile, write_profile, calc_mrt_arr
+
+MB = 1000000
+
+def test_profile_stage_accumulates():
+    profile = gen_profile()
+    for _ in range(3):
+        with profile_stage(profile, 'project', rays=100) as counters:
+            counters['hits'] = np.int64(40)
+            counters['method'] = 'slab'
+    stage = profile['stages']['project']
+    assert stage['calls'] == 3
+    assert stage['counters'] == {'rays': 300, 'hits': 120, 'method': 'slab'}
+    assert stage['peak_mb'] is None
+    assert stage['rates']['rays_per_s'] == pytest.approx(300/stage['time_s'])
+    add_stage(profile, 'project', 1.0, counters={'rays': 100})
+    assert profile['stages']['project']['counters']['rays'] == 400
+
+def test_profile_stage_none():
+    with profile_stage(None, 'project', rays=100) as counters:
+        counters['hits'] = 1
+    assert counters == {'rays': 100, 'hits': 1}
+
+def test_nested_profile_stage_peaks():
+    profile = gen_profile(trace_memory=True)
+    with profile_stage(profile, 'outer'):
+        before = np.ones(4*MB, dtype=np.uint8)
+        del before
+        with profile_stage(profile, 'inner'):
+            inner = np.ones(MB, dtype=np.uint8)
+            del inner
+        after = np.ones(2*MB, dtype=np.uint8)
+        del after
+    with profile_stage(profile, 'nesting'):
+        with profile_stage(profile, 'nested'):
+            nested = np.ones(3*MB, dtype=np.uint8)
+            del nested
+    stages = profile['stages']
+    # the peak of an inner stage does not see the larger peak of the outer stage before it
+    assert stages['inner']['peak_mb'] == pytest.approx(1.0, abs=0.1)
+    # the peak of the outer stage before the inner one is kept
+    assert stages['outer']['peak_mb'] == pytest.approx(4.0, abs=0.1)
+    # the peak of a stage includes the stages nested in it
+    assert stages['nested']['peak_mb'] == pytest.approx(3.0, abs=0.1)
+    assert stages['nesting']['peak_mb'] >= stages['nested']['peak_mb']
+    assert profile['open'] == []
+
+def test_calc_mrt_arr_profile(tmp_path, example_ply: str, example_grid_xyzs: np.ndarray):
+    res = calc_mrt_arr(example_ply, example_grid_xyzs, 0.3, 50, profile=True, trace_memory=True)
+    stages = res['profile']['stages']
+    for name in ['read_ply', 'voxelize', 'tracer', 'gen_rays', 'project', 'aggregate']:
+        assert stages[name]['time_s'] >= 0
+        assert stages[name]['peak_mb'] is not None
+    assert stages['project']['counters']['rays'] == len(res['trace']['hit_idxs'])
+    assert 'project' in format_profile(res['profile'])
+    path = tmp_path / 'profile.json'
+    write_profile(str(path), res['profile'])
+    assert set(json.loads(path.read_text(encoding='utf-8'))['stages']) == set(stages)
@@ -0,0 +1,152 @@
+import geomie3d
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import (midpts2bounds, rays_voxels_intersect, gen_voxel_lookup, rays_voxels_traverse, scene_key, gen_bvh, save_bvh,
+                                 load_bvh, get_cached_bvh, bvh_intersect)
+
+VDIM = 0.1
+NRAYS = 50
+
+def geomie3d_hits(voxels: dict, origs: np.ndarray, dirxs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    intersect the rays with the voxels as geomie3d bboxes the way the webapp does with the geomie3d method, the nearest hit of each ray
+
+    Parameters
+    ----------
+    voxels: dict
+        the "midpts" and "voxel_dim" of the voxels.
+
+    origs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the origins of the rays.
+
+    dirxs: np.ndarray
+        np.ndarray[shape(nrays, 3)] the directions of the rays.
+
+    Returns
+    -------
+    hit_idxs : np.ndarray
+        np.ndarray[shape(nrays)] index of the voxel hit by each ray, -1 if the ray did not hit any voxels.
+
+    hit_dists : np.ndarray
+        np.ndarray[shape(nrays)] distance to the hit, np.inf if the ray did not hit any voxels.
+    """
+    nvox = len(voxels['midpts'])
+    dims = np.full(nvox, voxels['voxel_dim'][0])
+    bboxes = geomie3d.create.bboxes_frm_midpts(voxels['midpts'].tolist(), dims, dims, dims,
+                                               attributes_list=[{'vx_id': cnt} for cnt in range(nvox)])
+    rays = [geomie3d.create.ray(orig.tolist(), dirx.tolist(), attributes={'ray_id': cnt})
+            for cnt, (orig, dirx) in enumerate(zip(origs, dirxs))]
+    hit_rays, _, _, _ = geomie3d.calculate.rays_bboxes_intersect(rays, bboxes)
+    hit_idxs = np.full(len(rays), -1, dtype=np.int64)
+    hit_dists = np.full(len(rays), np.inf)
+    for ray in hit_rays:
+        intx_att = ray.attributes['rays_bboxes_intersection']
+        cand_pts = np.asarray(intx_att['intersection'], dtype=np.float64).reshape(-1, 3)
+        cand_dists = (cand_pts - np.asarray(ray.origin)) @ np.asarray(ray.dirx)
+        cand_ids = [hb.attributes['vx_id'] for hb in intx_att['hit_bbox']]
+        nearest = min(range(len(cand_ids)), key=lambda cnt: (cand_dists[cnt], cand_ids[cnt]))
+        hit_idxs[ray.attributes['ray_id']] = cand_ids[nearest]
+        hit_dists[ray.attributes['ray_id']] = cand_dists[nearest]
+    return hit_idxs, hit_dists
+
+@pytest.fixture(scope='module')
+def example_voxels(example_cloud: dict) -> dict:
+    """
+    the voxels of the simple example from geomie3d.modify.xyzs2voxs, numbered in the order of the dictionary
+    """
+    vxs = geomie3d.modify.xyzs2voxs(example_cloud['xyzs'], VDIM, VDIM, VDIM)
+    return {'ijks': np.array(list(vxs['voxels'].keys())), 'midpts': np.array([vx['midpt'] for vx in vxs['voxels'].values()]),
+            'voxel_dim': vxs['voxel_dim'], 'lattice_orig': example_cloud['xyzs'].min(axis=0)}
+
+@pytest.fixture(scope='module')
+def example_rays(example_grid_xyzs: np.ndarray) -> dict:
+    """
+    the rays of the grid points of the simple example in the directions of geomie3d.d4pispace.tgDirs
+    """
+    unit_dirs = np.array([[dix.x, dix.y, dix.z] for dix in geomie3d.d4pispace.tgDirs(NRAYS).getDirList()])
+    return {'origs': np.repeat(example_grid_xyzs, len(unit_dirs), axis=0), 'dirxs': np.tile(unit_dirs, (len(example_grid_xyzs), 1))}
+
+@pytest.fixture(scope='module')
+def reference_hits(example_voxels: dict, example_rays: dict) -> tuple[np.ndarray, np.ndarray]:
+    return geomie3d_hits(example_voxels, example_rays['origs'], example_rays['dirxs'])
+
+def _check_hits(hits: tuple[np.ndarray, np.ndarray], reference_hits: tuple[np.ndarray, np.ndarray]):
+    hit_idxs, hit_dists = hits
+    ref_idxs, ref_dists = reference_hits
+    assert np.count_nonzero(ref_idxs != -1) > 0
+    np.testing.assert_array_equal(hit_idxs, ref_idxs)
+    is_hit = ref_idxs != -1
+    np.testing.assert_allclose(hit_dists[is_hit], ref_dists[is_hit], atol=1e-4)
+    assert np.all(np.isinf(hit_dists[np.logical_not(is_hit)]))
+
+def test_slab_matches_geomie3d(example_voxels: dict, example_rays: dict, reference_hits: tuple):
+    vx_mins, vx_maxs = midpts2bounds(example_voxels['midpts'], example_voxels['voxel_dim'])
+    hits = rays_voxels_intersect(example_rays['origs'], example_rays['dirxs'], vx_mins, vx_maxs)
+    _check_hits(hits, reference_hits)
+
+def test_slab_batches_match(example_voxels: dict, example_rays: dict):
+    vx_mins, vx_maxs = midpts2bounds(example_voxels['midpts'], example_voxels['voxel_dim'])
+    whole = rays_voxels_intersect(example_rays['origs'], example_rays['dirxs'], vx_mins, vx_maxs)
+    batched = rays_voxels_intersect(example_rays['origs'], example_rays['dirxs'], vx_mins, vx_maxs, max_tests=len(vx_mins)*7)
+    np.testing.assert_array_equal(batched[0], whole[0])
+    np.testing.assert_array_equal(batched[1], whole[1])
+
+def test_shared_face_keeps_lowest_index():
+    # two voxels sharing the face x = 1, a ray along the face is equally near to both
+    midpts = np.array([[1.5, 0.5, 0.5], [0.5, 0.5, 0.5]])
+    vx_dim = [1.0, 1.0, 1.0]
+    origs = np.array([[1.0, 0.5, -1.0]])
+    dirxs = np.array([[0.0, 0.0, 1.0]])
+    vx_mins, vx_maxs = midpts2bounds(midpts, vx_dim)
+    slab_idxs, slab_dists = rays_voxels_intersect(origs, dirxs, vx_mins, vx_maxs)
+    bvh_idxs, bvh_dists = bvh_intersect(gen_bvh(midpts, vx_dim, leaf_size=1), origs, dirxs)
+    np.testing.assert_array_equal(slab_idxs, [0])
+    np.testing.assert_array_equal(bvh_idxs, slab_idxs)
+    np.testing.assert_allclose(slab_dists, [1.0])
+    np.testing.assert_allclose(bvh_dists, slab_dists)
+
+def test_dda_matches_geomie3d(example_voxels: dict, example_rays: dict, reference_hits: tuple):
+    lookup = gen_voxel_lookup(example_voxels['ijks'])
+    hits = rays_voxels_traverse(example_rays['origs'], example_rays['dirxs'], lookup, example_voxels['lattice_orig'], example_voxels['voxel_dim'])
+    _check_hits(hits, reference_hits)
+
+def test_dda_sparse_lookup_matches_dense(example_voxels: dict, example_rays: dict):
+    dense = rays_voxels_traverse(example_rays['origs'], example_rays['dirxs'], gen_voxel_lookup(example_voxels['ijks']),
+                                 example_voxels['lattice_orig'], example_voxels['voxel_dim'])
+    sparse = rays_voxels_traverse(example_rays['origs'], example_rays['dirxs'], gen_voxel_lookup(example_voxels['ijks'], max_dense=0),
+                                  example_voxels['lattice_orig'], example_voxels['voxel_dim'])
+    np.testing.assert_array_equal(sparse[0], dense[0])
+
+@pytest.mark.parametrize('leaf_size', [1, 8])
+def test_bvh_matches_geomie3d(example_voxels: dict, example_rays: dict, reference_hits: tuple, leaf_size: int):
+    bvh = gen_bvh(example_voxels['midpts'], example_voxels['voxel_dim'], leaf_size=leaf_size)
+    hits = bvh_intersect(bvh, example_rays['origs'], example_rays['dirxs'], max_rays=97)
+    _check_hits(hits, reference_hits)
+
+def test_save_load_bvh(tmp_path, example_voxels: dict, example_rays: dict):
+    bvh = gen_bvh(example_voxels['midpts'], example_voxels['voxel_dim'])
+    path = str(tmp_path / 'scene.npz')
+    save_bvh(bvh, path)
+    loaded = load_bvh(path)
+    assert sorted(loaded) == sorted(bvh)
+    for name in bvh:
+        np.testing.assert_array_equal(loaded[name], bvh[name])
+    hits = bvh_intersect(loaded, example_rays['origs'], example_rays['dirxs'])
+    ref_hits = bvh_intersect(bvh, example_rays['origs'], example_rays['dirxs'])
+    np.testing.assert_array_equal(hits[0], ref_hits[0])
+
+def test_get_cached_bvh_reuses_key(tmp_path, example_ply: str, example_voxels: dict):
+    with open(example_ply, 'rb') as f:
+        ply_bytes = f.read()
+    key = scene_key(ply_bytes, VDIM)
+    # the same content and vdim give the same key, another vdim another key
+    assert scene_key(bytes(ply_bytes), VDIM) == key
+    assert scene_key(ply_bytes, 0.3) != key
+    cache_dir = str(tmp_path / 'bvh')
+    built = get_cached_bvh(example_voxels['midpts'], example_voxels['voxel_dim'], cache_dir, key)
+    assert (tmp_path / 'bvh' / f"{key}.npz").exists()
+    # a second call loads the saved bvh, the midpts are not looked at
+    loaded = get_cached_bvh(np.empty((0, 3)), example_voxels['voxel_dim'], cache_dir, key)
+    for name in built:
+        np.testing.assert_array_equal(loaded[name], built[name])
@@ -0,0 +1,41 @@
+import numpy as np
+
+from raytrace_mrt_engine import gen_point_lod
+
+def _level_cells(xyzs: np.ndarray, level: int) -> np.ndarray:
+    """
+    np.ndarray[shape(npts, 3)] the octree cell of each point at the level, on the bounding cube of the points
+    """
+    mns = xyzs.min(axis=0)
+    size = (xyzs.max(axis=0) - mns).max()
+    return np.clip(((xyzs - mns)/size * 2**level).astype(np.int64), 0, 2**level - 1)
+
+def test_point_lod_levels(example_cloud: dict):
+    xyzs = example_cloud['xyzs']
+    lod = gen_point_lod(xyzs, max_depth=8)
+    order = lod['order']
+    level_ends = lod['level_ends']
+    np.testing.assert_array_equal(np.sort(order), np.arange(len(xyzs)))
+    assert len(level_ends) == 10
+    assert level_ends[-1] == len(xyzs)
+    assert np.all(np.diff(level_ends) >= 0)
+    np.testing.assert_allclose(lod['spacings'][1:9]*2, lod['spacings'][0:8])
+    for level in range(9):
+        # the points up to a level are one point in each occupied cell of the level
+        ncells = len(np.unique(_level_cells(xyzs, level), axis=0))
+        assert level_ends[level] == ncells
+        assert len(np.unique(_level_cells(xyzs, level)[order[:level_ends[level]]], axis=0)) == ncells
+
+def test_point_lod_seed(example_cloud: dict):
+    lod = gen_point_lod(example_cloud['xyzs'], max_depth=8)
+    other = gen_point_lod(example_cloud['xyzs'], max_depth=8, seed=1)
+    # the seed only shuffles the points within the levels
+    np.testing.assert_array_equal(other['level_ends'], lod['level_ends'])
+    assert not np.array_equal(other['order'], lod['order'])
+    for start, end in zip(np.concatenate([[0], lod['level_ends'][:-1]]), lod['level_ends']):
+        np.testing.assert_array_equal(np.sort(other['order'][start:end]), np.sort(lod['order'][start:end]))
+
+def test_point_lod_empty():
+    lod = gen_point_lod(np.empty((0, 3)))
+    assert len(lod['order']) == 0
+    assert lod['level_ends'][-1] == 0
@@ -0,0 +1,59 @@
+import os
+import ast
+
+import numpy as np
+
+from conftest import WEBAPP_DIR
+
+def load_main_funcs(names: list[str], consts: list[str] = None) -> dict:
+    """
+    load functions of the webapp main script without running it, the script needs the browser to import
+
+    Parameters
+    ----------
+    names: list[str]
+        names of the functions, they can only use numpy and the constants.
+
+    consts: list[str], optional
+        names of the module level constants the functions use.
+
+    Returns
+    -------
+    dict
+        the functions and constants by name.
+    """
+    with open(os.path.join(WEBAPP_DIR, 'main.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    wanted = set(names) | set(consts or [])
+    body = [node for node in tree.body
+            if (isinstance(node, ast.FunctionDef) and node.name in wanted)
+            or (isinstance(node, ast.Assign) and any(isinstance(tgt, ast.Name) and tgt.id in wanted for tgt in node.targets))]
+    namespace = {'np': np}
+    exec(compile(ast.Module(body=body, type_ignores=[]), 'main.py', 'exec'), namespace)
+    return namespace
+
+def test_split_grid_round_robin():
+    split_grid = load_main_funcs(['split_grid'])['split_grid']
+    grid_xyzs = [[float(cnt), 0.0, 1.0] for cnt in range(10)]
+    shards, shard_ids = split_grid(grid_xyzs, 3)
+    assert shard_ids == [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    for shard, ids in zip(shards, shard_ids):
+        assert shard == [grid_xyzs[gcnt] for gcnt in ids]
+    # more workers than grid points leaves the last shards empty
+    shards, shard_ids = split_grid(grid_xyzs[0:2], 3)
+    assert shard_ids == [[0], [1], []]
+
+def test_lod_draw_count():
+    funcs = load_main_funcs(['lod_draw_count'], consts=['PTS_LOD_ANGLE'])
+    lod_draw_count = funcs['lod_draw_count']
+    lod = {'level_ends': np.array([1, 8, 64, 100]), 'spacings': np.array([4.0, 2.0, 1.0, 0.5]), 'radius': 2.0}
+    # the nearest points seen from far away only need the coarsest level
+    assert lod_draw_count(lod, 1e6, 1000) == (1, 4.0)
+    # a spacing of 1.5 m is seen under PTS_LOD_ANGLE, the first level finer than that is drawn
+    near = 1.5/funcs['PTS_LOD_ANGLE']
+    assert lod_draw_count(lod, near + lod['radius'], 1000) == (64, 1.0)
+    # inside the points every level is drawn
+    assert lod_draw_count(lod, 0.5, 1000) == (100, 0.5)
+    # the budget caps the points, drawn with the spacing of the level they fall in
+    assert lod_draw_count(lod, 0.5, 10) == (10, 1.0)
+    assert lod_draw_count(lod, 0.5, 0) == (1, 4.0)
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import (MIN_BATCH_RAYS, scene_key, load_scene, gen_tracer, aggregate_grid, iter_grid_mrt, calc_mrt_arr, read_grid_csv,
+                                 write_mrt_npz, read_mrt_npz, gen_cache, cache_stats, get_unit_dirs)
+from raytrace_mrt_engine.__main__ import main
+
+VDIM = 0.3
+NRAYS = 50
+
+@pytest.fixture(scope='module')
+def serial_res(example_ply: str, example_grid_xyzs: np.ndarray) -> dict:
+    return calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, NRAYS)
+
+def test_read_grid_csv(example_grid: str, example_grid_xyzs: np.ndarray):
+    np.testing.assert_array_equal(read_grid_csv(example_grid), example_grid_xyzs)
+
+def test_load_scene_key(example_ply: str, serial_res: dict):
+    with open(example_ply, 'rb') as f:
+        ply_bytes = f.read()
+    scene = load_scene(ply_bytes, VDIM, need_key=True)
+    assert scene['key'] == scene_key(ply_bytes, VDIM)
+    assert scene['key'] == scene_key(example_ply, VDIM)
+    np.testing.assert_array_equal(scene['voxels']['ijks'], serial_res['scene']['voxels']['ijks'])
+    # the key is not computed without a cache unless asked for
+    assert load_scene(ply_bytes, VDIM)['key'] is None
+
+def test_load_scene_chunks(example_ply: str, serial_res: dict):
+    scene = load_scene(example_ply, VDIM, chunk_size=1000, nsample=100)
+    voxels = serial_res['scene']['voxels']
+    np.testing.assert_array_equal(scene['voxels']['ijks'], voxels['ijks'])
+    np.testing.assert_allclose(scene['voxels']['temps'], voxels['temps'])
+    # only a sample of the points is kept
+    assert len(scene['xyzs']) == len(scene['temps']) <= 100
+    res = calc_mrt_arr(example_ply, serial_res['grid_xyzs'], VDIM, NRAYS, chunk_size=1000)
+    np.testing.assert_allclose(res['mrt'], serial_res['mrt'])
+
+def test_gen_tracer_errors(tmp_path, serial_res: dict):
+    voxels = serial_res['scene']['voxels']
+    with pytest.raises(ValueError, match='unknown intx_method'):
+        gen_tracer(voxels, intx_method='raymarch')
+    with pytest.raises(ValueError, match='key'):
+        gen_tracer(voxels, intx_method='bvh', bvh_dir=str(tmp_path))
+
+def test_calc_mrt_arr_mean_of_hits(serial_res: dict):
+    trace = serial_res['trace']
+    vx_temps = serial_res['scene']['voxels']['temps']
+    for grid_id, mrt in enumerate(serial_res['mrt']):
+        hit_idxs = trace['hit_idxs'][(trace['grid_ids'] == grid_id) & (trace['hit_idxs'] != -1)]
+        assert serial_res['nhits'][grid_id] == len(hit_idxs)
+        np.testing.assert_allclose(mrt, vx_temps[hit_idxs].mean())
+
+def test_aggregate_grid():
+    # grid point 0 hits voxels 0 and 1 and misses once, grid point 1 misses and grid point 2 casts no rays
+    trace_res = {'grid_ids': np.array([0, 0, 0, 1]), 'hit_idxs': np.array([0, 1, -1, -1])}
+    agg = aggregate_grid(trace_res, np.array([20.0, 24.0]), 3)
+    np.testing.assert_allclose(agg['mrt'], [22.0, -999.0, -999.0])
+    np.testing.assert_array_equal(agg['nhits'], [2, 0, 0])
+    np.testing.assert_array_equal(agg['nrays'], [3, 1, 0])
+    np.testing.assert_allclose(agg['miss_frac'], [1/3, 1.0, -999.0])
+
+def test_calc_mrt_arr_aggregates(serial_res: dict):
+    nunit = len(serial_res['trace']['hit_idxs'])//len(serial_res['grid_xyzs'])
+    np.testing.assert_array_equal(serial_res['nrays'], nunit)
+    np.testing.assert_allclose(serial_res['miss_frac'], 1 - serial_res['nhits']/nunit)
+
+def test_write_read_mrt_npz(tmp_path, serial_res: dict):
+    path = str(tmp_path / 'mrt.npz')
+    write_mrt_npz(path, serial_res['grid_xyzs'], serial_res['mrt'], nhits=serial_res['nhits'], nrays=serial_res['nrays'])
+    res = read_mrt_npz(path)
+    assert sorted(res) == ['grid_xyzs', 'miss_frac', 'mrt', 'nhits', 'nrays']
+    np.testing.assert_array_equal(res['grid_xyzs'], serial_res['grid_xyzs'])
+    np.testing.assert_array_equal(res['mrt'], serial_res['mrt'].astype(np.float32))
+    assert (res['mrt'].dtype, res['nhits'].dtype, res['nrays'].dtype) == (np.float32, np.int32, np.int32)
+    np.testing.assert_array_equal(res['nhits'], serial_res['nhits'])
+    np.testing.assert_allclose(res['miss_frac'], serial_res['miss_frac'], rtol=1e-6)
+    # the optional columns are only written when given
+    write_mrt_npz(path, serial_res['grid_xyzs'], serial_res['mrt'], stderrs=np.zeros(len(serial_res['mrt'])))
+    assert sorted(read_mrt_npz(path)) == ['grid_xyzs', 'mrt', 'stderr']
+
+@pytest.mark.parametrize('intx_method', ['slab', 'dda', 'bvh'])
+def test_calc_mrt_arr_workers_match_serial(tmp_path, example_ply: str, example_grid_xyzs: np.ndarray, intx_method: str):
+    # the grid points sharded across a process pool give the same hits as one process
+    serial_res = calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, NRAYS, intx_method=intx_method, bvh_dir=str(tmp_path))
+    res = calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, NRAYS, intx_method=intx_method, bvh_dir=str(tmp_path), workers=2)
+    np.testing.assert_array_equal(res['trace']['hit_idxs'], serial_res['trace']['hit_idxs'])
+    np.testing.assert_allclose(res['mrt'], serial_res['mrt'])
+    np.testing.assert_array_equal(res['nhits'], serial_res['nhits'])
+
+def test_iter_grid_mrt_batches(example_grid_xyzs: np.ndarray, serial_res: dict):
+    voxels = serial_res['scene']['voxels']
+    tracer = gen_tracer(voxels)
+    batches = list(iter_grid_mrt(tracer, voxels['temps'], example_grid_xyzs, NRAYS, batch_size=5))
+    assert [batch['grid_ids'].tolist() for batch in batches] == [list(range(start, min(start + 5, 16))) for start in range(0, 16, 5)]
+    assert [batch['ndone'] for batch in batches] == [5, 10, 15, 16]
+    np.testing.assert_allclose(np.concatenate([batch['mrt'] for batch in batches]), serial_res['mrt'])
+    np.testing.assert_array_equal(np.concatenate([batch['nhits'] for batch in batches]), serial_res['nhits'])
+
+def test_iter_grid_mrt_default_batch_floor(example_grid_xyzs: np.ndarray, serial_res: dict):
+    voxels = serial_res['scene']['voxels']
+    tracer = gen_tracer(voxels)
+    # the slab tracer of a huge voxel model reports every 10 rays, the default batch still has MIN_BATCH_RAYS rays
+    tracer['nvoxels'] = 10**9
+    batches = list(iter_grid_mrt(tracer, voxels['temps'], example_grid_xyzs, NRAYS))
+    nbatch = min(len(example_grid_xyzs), MIN_BATCH_RAYS//len(get_unit_dirs(NRAYS)))
+    assert len(batches[0]['grid_ids']) == nbatch
+    np.testing.assert_allclose(np.concatenate([batch['mrt'] for batch in batches]), serial_res['mrt'])
+
+def test_iter_grid_mrt_cancel(example_ply: str, example_grid_xyzs: np.ndarray, serial_res: dict):
+    # the traces are cached under the key of the voxel model
+    scene = load_scene(example_ply, VDIM, need_key=True)
+    voxels = scene['voxels']
+    tracer = gen_tracer(voxels, key=scene['key'])
+    cache = gen_cache()
+    batches = iter_grid_mrt(tracer, voxels['temps'], example_grid_xyzs, NRAYS, batch_size=5, cache=cache)
+    first = next(batches)
+    # not asking for the next batch stops the calculation, only the first batch is traced
+    batches.close()
+    assert cache_stats(cache, reset=True)['misses'] == {'trace': 5}
+    np.testing.assert_allclose(first['mrt'], serial_res['mrt'][0:5])
+    # the batches traced before the cancel are reused when the grid is submitted again
+    batches = list(iter_grid_mrt(tracer, voxels['temps'], example_grid_xyzs, NRAYS, batch_size=5, cache=cache))
+    stats = cache_stats(cache)
+    assert (stats['hits'], stats['misses']) == ({'trace': 5}, {'trace': 11})
+    np.testing.assert_allclose(np.concatenate([batch['mrt'] for batch in batches]), serial_res['mrt'])
+
+def test_main_run(tmp_path, example_ply: str, example_grid: str, serial_res: dict):
+    out = tmp_path / 'mrt.csv'
+    main(['run', example_ply, example_grid, '--vdim', str(VDIM), '--nrays', str(NRAYS), '--out', str(out), '--npz'])
+    mrt_rows = np.loadtxt(out, delimiter=',', skiprows=1)
+    np.testing.assert_allclose(mrt_rows[:, 0:3], serial_res['grid_xyzs'])
+    np.testing.assert_allclose(mrt_rows[:, 3], np.round(serial_res['mrt'], 2))
+    np.testing.assert_array_equal(read_mrt_npz(str(tmp_path / 'mrt.npz'))['nhits'], serial_res['nhits'])
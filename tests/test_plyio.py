@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import parse_ply_header, read_ply_vertex, ply_vertex_columns, ply_vertex_count, iter_ply_vertex_chunks
+
+PLY_FORMATS = ['ascii', 'binary_little_endian', 'binary_big_endian']
+PROPS = [('x', 'float'), ('y', 'float'), ('z', 'double'), ('temperature', 'float'), ('label', 'uchar')]
+NP_TYPES = {'float': 'f4', 'double': 'f8', 'uchar': 'u1'}
+
+def gen_vertex(npts: int) -> np.ndarray:
+    """
+    np.ndarray[shape(npts)] structured array of random vertices with the properties of PROPS
+    """
+    rng = np.random.default_rng(0)
+    vertex = np.empty(npts, dtype=[(name, NP_TYPES[ptype]) for name, ptype in PROPS])
+    for name, ptype in PROPS:
+        vertex[name] = rng.integers(0, 255, npts) if ptype == 'uchar' else rng.uniform(-10, 40, npts)
+    return vertex
+
+def write_ply(vertex: np.ndarray, fmt: str) -> bytes:
+    """
+    the content of a ply file with the vertex element written in the format fmt
+    """
+    header = f"ply\nformat {fmt} 1.0\ncomment written by the tests\nelement vertex {len(vertex)}\n"
+    header += ''.join(f"property {ptype} {name}\n" for name, ptype in PROPS)
+    header += 'end_header\n'
+    if fmt == 'ascii':
+        lines = [' '.join(repr(val.item()) for val in row) for row in vertex]
+        body = ('\n'.join(lines) + '\n').encode('ascii')
+    else:
+        byte_order = '<' if fmt == 'binary_little_endian' else '>'
+        body = vertex.astype(vertex.dtype.newbyteorder(byte_order)).tobytes()
+    return header.encode('ascii') + body
+
+def _check_vertex(read: np.ndarray, vertex: np.ndarray):
+    assert len(read) == len(vertex)
+    for name, _ in PROPS:
+        np.testing.assert_array_equal(np.asarray(read[name], dtype=vertex[name].dtype), vertex[name])
+
+@pytest.mark.parametrize('fmt', PLY_FORMATS)
+def test_read_ply_vertex_bytes(fmt: str):
+    vertex = gen_vertex(257)
+    _check_vertex(read_ply_vertex(write_ply(vertex, fmt)), vertex)
+
+@pytest.mark.parametrize('fmt', PLY_FORMATS)
+def test_read_ply_vertex_path(tmp_path, fmt: str):
+    vertex = gen_vertex(257)
+    path = tmp_path / f"{fmt}.ply"
+    path.write_bytes(write_ply(vertex, fmt))
+    _check_vertex(read_ply_vertex(str(path)), vertex)
+    assert ply_vertex_count(str(path)) == len(vertex)
+
+@pytest.mark.parametrize('fmt', PLY_FORMATS)
+def test_iter_ply_vertex_chunks(tmp_path, fmt: str):
+    vertex = gen_vertex(257)
+    content = write_ply(vertex, fmt)
+    path = tmp_path / f"{fmt}.ply"
+    path.write_bytes(content)
+    for source in [content, str(path)]:
+        chunks = list(iter_ply_vertex_chunks(source, chunk_size=50))
+        assert [len(chunk) for chunk in chunks] == [50, 50, 50, 50, 50, 7]
+        _check_vertex(np.concatenate(chunks), vertex)
+
+def test_parse_ply_header():
+    content = write_ply(gen_vertex(3), 'binary_big_endian')
+    header = parse_ply_header(content)
+    assert header['format'] == 'binary_big_endian'
+    assert header['elements'] == [{'name': 'vertex', 'count': 3, 'props': [(name, ptype) for name, ptype in PROPS]}]
+    assert content[header['header_len'] - len(b'end_header\n'):header['header_len']] == b'end_header\n'
+    with pytest.raises(ValueError):
+        parse_ply_header(b'not a ply')
+
+def test_ply_vertex_columns():
+    vertex = gen_vertex(10)
+    cols = ply_vertex_columns(vertex)
+    np.testing.assert_array_equal(cols['xyzs'], np.column_stack([vertex['x'], vertex['y'], vertex['z']]))
+    np.testing.assert_array_equal(cols['temps'], vertex['temperature'])
+    # another property is only used as the temperature when it is named
+    np.testing.assert_array_equal(ply_vertex_columns(vertex, temp_field='label')['temps'], vertex['label'])
+    with pytest.raises(ValueError, match="properties found: .*'temperature'"):
+        ply_vertex_columns(vertex, temp_field='temp')
+    with pytest.raises(ValueError):
+        ply_vertex_columns(vertex[['x', 'y', 'z']])
+
+def test_example_ply(example_ply: str, example_cloud: dict):
+    # the example is an ascii ply, the same points written as binary read the same as with plyfile
+    vertex = read_ply_vertex(example_ply)
+    assert ply_vertex_count(example_ply) == len(vertex) == len(example_cloud['xyzs'])
+    binary = b'ply\nformat binary_little_endian 1.0\nelement vertex %d\n' % len(vertex)
+    binary += b''.join(b'property float %s\n' % name.encode('ascii') for name in vertex.dtype.names) + b'end_header\n'
+    binary += np.asarray(vertex).astype([(name, '<f4') for name in vertex.dtype.names]).tobytes()
+    cols = ply_vertex_columns(read_ply_vertex(binary))
+    np.testing.assert_array_equal(cols['xyzs'], example_cloud['xyzs'])
+    np.testing.assert_array_equal(cols['temps'], example_cloud['temps'])
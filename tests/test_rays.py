@@ -0,0 +1,31 @@
+import geomie3d
+import numpy as np
+
+from raytrace_mrt_engine import get_unit_dirs, gen_rays_arr, separate_rays_arr
+
+def test_get_unit_dirs_memoized():
+    dirxs = get_unit_dirs(50)
+    assert get_unit_dirs(50) is dirxs
+    assert not dirxs.flags.writeable
+    ref_dirxs = [[dix.x, dix.y, dix.z] for dix in geomie3d.d4pispace.tgDirs(50).getDirList()]
+    np.testing.assert_array_equal(dirxs, ref_dirxs)
+    np.testing.assert_allclose(np.linalg.norm(dirxs, axis=1), 1.0)
+
+def test_gen_rays_arr(example_grid_xyzs: np.ndarray):
+    rays = gen_rays_arr(example_grid_xyzs.tolist(), 50)
+    unit_dirs = get_unit_dirs(50)
+    ngrids = len(example_grid_xyzs)
+    nunit = len(unit_dirs)
+    assert rays['origs'].shape == rays['dirxs'].shape == (ngrids * nunit, 3)
+    np.testing.assert_array_equal(rays['grid_ids'], np.repeat(np.arange(ngrids), nunit))
+    np.testing.assert_array_equal(rays['origs'], example_grid_xyzs[rays['grid_ids']])
+    np.testing.assert_array_equal(rays['dirxs'][nunit:2*nunit], unit_dirs)
+
+def test_separate_rays_arr(example_grid_xyzs: np.ndarray):
+    rays = gen_rays_arr(example_grid_xyzs, 50)
+    rays_ls = separate_rays_arr(rays, 3)
+    assert len(rays_ls) == 3
+    for key in rays:
+        np.testing.assert_array_equal(np.concatenate([part[key] for part in rays_ls]), rays[key])
+    # the groups are views of the rays
+    assert np.shares_memory(rays_ls[1]['origs'], rays['origs'])
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import (calc_mrt_arr, gen_view_matrix, save_view_matrix, load_view_matrix, view_matrix_mrt, calc_frames_mrt, frame_voxel_temps,
+                                 gen_voxel_lookup, find_voxels)
+
+VDIM = 0.1
+NRAYS = 100
+
+@pytest.fixture(scope='module')
+def example_res(example_ply: str, example_grid_xyzs: np.ndarray) -> dict:
+    return calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, NRAYS)
+
+@pytest.fixture(scope='module')
+def example_vmat(example_res: dict) -> dict:
+    return gen_view_matrix(example_res['trace'], example_res['scene']['voxels'], example_res['grid_xyzs'])
+
+def test_view_matrix_mrt_matches_calc_mrt_arr(example_res: dict, example_vmat: dict):
+    mrts = view_matrix_mrt(example_vmat, example_res['scene']['voxels']['temps'])
+    np.testing.assert_allclose(mrts, example_res['mrt'])
+    np.testing.assert_array_equal(example_vmat['nhits'], example_res['nhits'])
+    np.testing.assert_array_equal(example_vmat['nrays'], example_res['nrays'])
+    # each row with hits sums to 1
+    rows = np.repeat(np.arange(len(example_vmat['nhits'])), np.diff(example_vmat['indptr']))
+    row_sums = np.bincount(rows, weights=example_vmat['data'], minlength=len(example_vmat['nhits']))
+    np.testing.assert_allclose(row_sums[example_vmat['nhits'] > 0], 1.0)
+
+def test_view_matrix_mrt_matches_adaptive(example_ply: str, example_grid_xyzs: np.ndarray):
+    res = calc_mrt_arr(example_ply, example_grid_xyzs, VDIM, 50, tol=0.05, max_rays=200)
+    vmat = gen_view_matrix(res['trace'], res['scene']['voxels'], res['grid_xyzs'])
+    np.testing.assert_allclose(view_matrix_mrt(vmat, res['scene']['voxels']['temps']), res['mrt'])
+    np.testing.assert_array_equal(vmat['nrays'], res['nrays'])
+
+def test_view_matrix_mrt_radiant(example_res: dict, example_vmat: dict):
+    vx_temps = example_res['scene']['voxels']['temps']
+    trace = example_res['trace']
+    mrts = view_matrix_mrt(example_vmat, vx_temps, radiant=True)
+    for grid_id in range(len(mrts)):
+        hit_idxs = trace['hit_idxs'][(trace['grid_ids'] == grid_id) & (trace['hit_idxs'] != -1)]
+        expected = np.mean((vx_temps[hit_idxs] + 273.15)**4)**0.25 - 273.15
+        np.testing.assert_allclose(mrts[grid_id], expected)
+
+def test_view_matrix_mrt_nan_temps():
+    # grid point 0 sees voxel 0 twice and voxel 1 once, grid point 1 only sees voxel 1 and grid point 2 sees nothing
+    trace_res = {'grid_ids': np.array([0, 0, 0, 1, 2]), 'hit_idxs': np.array([0, 0, 1, 1, -1])}
+    voxels = {'ijks': np.array([[0, 0, 0], [1, 0, 0]]), 'voxel_dim': [1.0, 1.0, 1.0], 'lattice_orig': np.zeros(3)}
+    vmat = gen_view_matrix(trace_res, voxels, np.zeros((3, 3)))
+    np.testing.assert_allclose(view_matrix_mrt(vmat, np.array([20.0, 26.0])), [22.0, 26.0, -999.0])
+    # a voxel without temperature is left out and the hits of the rest are renormalized
+    np.testing.assert_allclose(view_matrix_mrt(vmat, np.array([20.0, np.nan])), [20.0, -999.0, -999.0])
+
+def test_save_load_view_matrix(tmp_path, example_res: dict, example_vmat: dict):
+    path = str(tmp_path / 'view_matrix.npz')
+    save_view_matrix(path, example_vmat)
+    loaded = load_view_matrix(path)
+    vx_temps = example_res['scene']['voxels']['temps']
+    np.testing.assert_array_equal(view_matrix_mrt(loaded, vx_temps), view_matrix_mrt(example_vmat, vx_temps))
+    assert loaded['vdim'] == example_vmat['vdim']
+
+def test_calc_frames_mrt(example_ply: str, example_cloud: dict, example_res: dict, example_vmat: dict):
+    # the same points 5 degC warmer, the mrt of every grid point that sees a temperature is 5 degC warmer
+    xyzs = example_cloud['xyzs']
+    header = f"ply\nformat ascii 1.0\nelement vertex {len(xyzs)}\nproperty double x\nproperty double y\nproperty double z\nproperty double temperature\nend_header\n"
+    rows = np.column_stack([xyzs, example_cloud['temps'] + 5])
+    warmer = header.encode('ascii') + '\n'.join(' '.join(repr(val) for val in row) for row in rows.tolist()).encode('ascii')
+    mrts = calc_frames_mrt(example_vmat, [example_ply, warmer])
+    assert mrts.shape == (2, len(example_res['mrt']))
+    np.testing.assert_allclose(mrts[0], example_res['mrt'])
+    is_seen = example_res['mrt'] != -999
+    np.testing.assert_allclose(mrts[1][is_seen], example_res['mrt'][is_seen] + 5)
+
+def test_frame_voxel_temps_lookup(example_cloud: dict, example_res: dict, example_vmat: dict):
+    ijks = example_vmat['ijks']
+    # every voxel of the view matrix is found at its own index, with the dense and the sparse lookup
+    for lookup in [gen_voxel_lookup(ijks), gen_voxel_lookup(ijks, max_dense=0)]:
+        np.testing.assert_array_equal(find_voxels(lookup, ijks), np.arange(len(ijks)))
+        vx_temps = frame_voxel_temps(example_vmat, example_cloud['xyzs'], example_cloud['temps'], lookup=lookup)
+        np.testing.assert_allclose(vx_temps, frame_voxel_temps(example_vmat, example_cloud['xyzs'], example_cloud['temps']))
+    np.testing.assert_allclose(vx_temps, example_res['scene']['voxels']['temps'])
@@ -0,0 +1,80 @@
+import geomie3d
+import numpy as np
+import pytest
+
+from raytrace_mrt_engine import voxelize, voxelize_chunks, pack_voxels, unpack_voxels
+
+VDIM = 0.1
+
+def chunk_reader(xyzs: np.ndarray, temps: np.ndarray, chunk_size: int):
+    """
+    function returning a new iterator over the points in chunks of chunk_size, the read_chunks of voxelize_chunks
+    """
+    def read_chunks():
+        for start in range(0, len(xyzs), chunk_size):
+            yield xyzs[start:start + chunk_size], temps[start:start + chunk_size]
+    return read_chunks
+
+@pytest.fixture(scope='module')
+def reference_voxels(example_cloud: dict) -> dict:
+    return geomie3d.modify.xyzs2voxs(example_cloud['xyzs'], VDIM, VDIM, VDIM)
+
+def test_voxelize_matches_xyzs2voxs(example_cloud: dict, reference_voxels: dict):
+    voxels = voxelize(example_cloud['xyzs'], example_cloud['temps'], VDIM)
+    ref = reference_voxels['voxels']
+    # xyzs2voxs numbers the voxels in the order their first point appears, the order of the dictionary
+    np.testing.assert_array_equal(voxels['ijks'], np.array(list(ref.keys())))
+    np.testing.assert_allclose(voxels['midpts'], np.array([vox['midpt'] for vox in ref.values()]))
+    np.testing.assert_array_equal(voxels['counts'], [len(vox['idx']) for vox in ref.values()])
+    ref_temps = [np.mean(example_cloud['temps'][vox['idx']]) for vox in ref.values()]
+    np.testing.assert_allclose(voxels['temps'], ref_temps)
+    for cnt, vox in enumerate(ref.values()):
+        assert np.all(voxels['pt_vx_ids'][vox['idx']] == cnt)
+    assert voxels['voxel_dim'] == reference_voxels['voxel_dim']
+
+def test_voxelize_stats(example_cloud: dict, reference_voxels: dict):
+    voxels = voxelize(example_cloud['xyzs'], example_cloud['temps'], VDIM, stats=['min', 'max', 'std'])
+    vox_temps = [example_cloud['temps'][vox['idx']] for vox in reference_voxels['voxels'].values()]
+    np.testing.assert_allclose(voxels['temp_mins'], [temps.min() for temps in vox_temps])
+    np.testing.assert_allclose(voxels['temp_maxs'], [temps.max() for temps in vox_temps])
+    np.testing.assert_allclose(voxels['temp_stds'], [temps.std() for temps in vox_temps], atol=1e-9)
+
+@pytest.mark.parametrize('chunk_size', [1000, 4097, 100000])
+def test_voxelize_chunks_matches_voxelize(example_cloud: dict, chunk_size: int):
+    xyzs = example_cloud['xyzs']
+    temps = example_cloud['temps']
+    voxels = voxelize(xyzs, temps, VDIM)
+    streamed = voxelize_chunks(chunk_reader(xyzs, temps, chunk_size), VDIM)
+    np.testing.assert_array_equal(streamed['ijks'], voxels['ijks'])
+    np.testing.assert_allclose(streamed['midpts'], voxels['midpts'])
+    np.testing.assert_array_equal(streamed['counts'], voxels['counts'])
+    np.testing.assert_allclose(streamed['temp_sums'], voxels['temp_sums'])
+    np.testing.assert_allclose(streamed['temps'], voxels['temps'])
+    np.testing.assert_allclose(streamed['lattice_orig'], voxels['lattice_orig'])
+    assert streamed['npts'] == len(xyzs)
+
+def test_voxelize_chunks_matches_xyzs2voxs(example_cloud: dict, reference_voxels: dict):
+    streamed = voxelize_chunks(chunk_reader(example_cloud['xyzs'], example_cloud['temps'], 999), VDIM)
+    ref = reference_voxels['voxels']
+    np.testing.assert_array_equal(streamed['ijks'], np.array(list(ref.keys())))
+    np.testing.assert_allclose(streamed['midpts'], np.array([vox['midpt'] for vox in ref.values()]))
+    np.testing.assert_array_equal(streamed['counts'], [len(vox['idx']) for vox in ref.values()])
+
+def test_voxelize_chunks_sample(example_cloud: dict):
+    xyzs = example_cloud['xyzs']
+    temps = example_cloud['temps']
+    streamed = voxelize_chunks(chunk_reader(xyzs, temps, 1000), VDIM, nsample=100)
+    stride = int(np.ceil(len(xyzs)/100))
+    np.testing.assert_array_equal(streamed['sample_xyzs'], xyzs[::stride])
+    np.testing.assert_array_equal(streamed['sample_temps'], temps[::stride])
+
+def test_voxelize_chunks_no_points():
+    with pytest.raises(ValueError):
+        voxelize_chunks(chunk_reader(np.empty((0, 3)), np.empty(0), 10), VDIM)
+
+def test_pack_unpack_voxels(example_cloud: dict):
+    voxels = voxelize(example_cloud['xyzs'], example_cloud['temps'], VDIM)
+    unpacked = unpack_voxels(pack_voxels(voxels), VDIM)
+    for key in ['lattice_orig', 'ijks', 'midpts', 'temps']:
+        np.testing.assert_array_equal(unpacked[key], voxels[key])
+    assert unpacked['voxel_dim'] == voxels['voxel_dim']